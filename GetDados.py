@@ -1,343 +1,835 @@
-import struct
+import time
+
+_import_start = time.perf_counter()  # medição do tempo de inicialização (ver startup_time)
+
 from datetime import datetime
-import pandas as pd
-from pymodbus.client.serial import ModbusSerialClient
+import atexit
+import os
+import threading
+import flask
 import dash
-from dash import dcc, html, Input, Output, State, dash_table
+from dash import dcc, html, Input, Output, State, dash_table, ClientsideFunction
 import dash_bootstrap_components as dbc
 import serial.tools.list_ports
 from dash.exceptions import PreventUpdate
 import math
-import io
-import time
-import xlsxwriter
+import numpy as np
+
+from armazenamento import ArmazenamentoSQLite
+from difusao import Difusor, PublicadorAmostras
+from agregacao import AgregadorJanela, COLUNAS_AGREGADAS, ESTATISTICAS
+from buffer_circular import BufferCircular, COLUNAS_HISTORICO
+from calibracao import CalibracaoIncremental
+from etapas import PerfiladorSobDemanda, TemporizadorEtapas
+from estabilidade import COLUNA_ESTAVEL, COLUNAS_JANELAS, DetectorEstabilidade, bordas_estaveis
+from exportacao import iniciar_exportacao, limpar_exportacoes, obter_exportacao
+from indice_agregados import IndiceAgregados, serie_para_json
+from processo_aquisicao import MotorProcesso, criar_motor
+from reducao import reduzir
 
 # Inicialização do app Dash
 app = dash.Dash(__name__, suppress_callback_exceptions=True,
                 external_stylesheets=[dbc.themes.BOOTSTRAP])
 server = app.server
 
+# Tempo de cada etapa (assinantes, lotes ao vivo, callbacks, figura, exportação) em histogramas
+# rolantes, e perfil cProfile sob demanda de qualquer função instrumentada por timings.funcao
+profiler = PerfiladorSobDemanda()
+timings = TemporizadorEtapas(perfilador=profiler)
+
 # Variáveis globais
-piranometer_client = None
-cr1000_client = None
-last_update_time = 0
-update_interval = 5  # segundos
-
-historical_data = pd.DataFrame(columns=[
-    'timestamp', 'irradiance', 'voltage_out', 'angle_x', 'angle_y',
-    'cr1000_1', 'cr1000_2', 'cr1000_3'
-])
-
-
-# Função para listar portas seriais
-def get_available_ports():
-    return [port.device for port in serial.tools.list_ports.comports()]
-
-
-# Função de conversão de registros para float
-def concat_16bits_to_float(reg1, reg2):
-    int_32bit = (reg1 << 16) | reg2
-    return struct.unpack('!f', struct.pack('!I', int_32bit))[0]
-
-
-# Função para interpretar valores do CR1000 via Modbus
-def interpret_cr1000_values(registers, active_ports):
-    """Interpreta os registros considerando apenas as portas ativas"""
-    if not registers or len(registers) != 6:
-        print(f"Dados incompletos do CR1000. Recebidos: {len(registers) if registers else 0}/6 registros")
-        return [float('nan')] * 3
-
-    # Converte para pares hexadecimais
-    hex_values = [f"{reg:04X}" for reg in registers]
-
-    values = []
-    for i in range(0, 6, 2):
-        channel_num = (i // 2) + 1
-        if channel_num in active_ports:
-            hex_pair = f"{hex_values[i]}{hex_values[i + 1]}"
-            try:
-                value = struct.unpack('>f', bytes.fromhex(hex_pair))[0]
-                values.append(value)
-            except:
-                values.append(float('nan'))
-        else:
-            values.append(float('nan'))
-
-    return values[:3]  # Retorna sempre 3 valores (NaN para portas inativas)
-
-
-# Layout do aplicativo
-app.layout = dbc.Container(
-    fluid=True,
-    style={
-        "display": "flex",
-        "flex-direction": "column",
-        "height": "100vh",
-        "padding": "20px",
-        "background": "#006d68",
-        "color": "white"
-    },
-    children=[
-        dcc.Location(id='url', refresh=False),
-        dcc.Interval(id='update-interval', interval=update_interval * 1000, disabled=True),
-        dcc.Store(id='connection-store'),
-        dcc.Store(id='data-store'),
-
-        # Cabeçalho
-        dbc.Row(
-            [
-                dbc.Col(
-                    html.Img(
-                        src="assets/Marca_Branca.png",
-                        style={"height": "8rem", "max-width": "100%", "object-fit": "contain"}
-                    ),
-                    width="auto",
-                ),
-                dbc.Col(
-                    html.H1(
-                        children='Calibração de Piranômetros',
-                        style={
-                            'color': '#FFFFFF',
-                            'font-size': 'clamp(2rem, 6vw, 4rem)',
-                            'margin': '0',
-                            'text-align': 'center',
-                            'font-weight': 'bold'
-                        }
+update_interval = 5  # segundos da janela de agregação mostrada nas tabelas
+push_interval = 1.0  # segundos entre lotes de amostras enviados aos navegadores (/eventos)
+sample_interval = 0.1  # segundos entre leituras dos instrumentos (0 = tão rápido quanto o barramento permitir)
+
+history_capacity = 200_000  # amostras brutas em memória (~5,5 h a 10 Hz; o restante fica no armazenamento)
+# Amostras recarregadas do disco na inicialização (~1 h a 10 Hz); o zoom em trechos mais antigos
+# lê do armazenamento, então o buffer não precisa começar cheio
+history_preload = 36_000
+graph_target_points = 2000  # pontos por trace após a redução (LTTB/min-max) no servidor
+graph_max_points = 2 * graph_target_points  # teto por trace no navegador (maxPoints do extendData)
+graph_downsampling = 'lttb'  # 'lttb' ou 'minmax'
+# Zoom anterior ao buffer com mais amostras brutas que isso vem das médias dos agregados
+graph_max_storage_rows = 100_000
+
+historical_data = BufferCircular(capacidade=history_capacity, colunas=COLUNAS_HISTORICO)
+historical_lock = threading.Lock()
+
+# Motor de aquisição: única thread que acessa os barramentos seriais.
+# 'asyncio' lê piranômetro e CR1000 em paralelo; 'thread' lê um após o outro;
+# 'replay' reproduz uma captura de registros brutos (replay_path) sem instrumentos.
+acquisition_mode = 'thread'
+# Maior buraco (em registros) aceito ao agrupar campos numa mesma leitura (None = plano mais barato)
+register_max_gap = None
+replay_path = os.path.join('dados', 'captura.pircap')
+replay_speed = 1.0  # 1.0 = ritmo original; None = tão rápido quanto possível
+# Pasta onde gravar os registros brutos de cada leitura, para reprodução posterior (None = não capturar)
+capture_dir = None
+# Roda o motor num processo próprio, que grava as amostras num anel em memória compartilhada:
+# a carga da interface (callbacks, pandas, JSON) deixa de disputar o GIL com o I/O Modbus
+acquisition_process = False
+acquisition_options = {'intervalo': sample_interval, 'max_gap': register_max_gap,
+                       'caminho_reproducao': replay_path, 'velocidade_reproducao': replay_speed}
+acquisition = None  # criado em start(), só no processo que serve o app
+
+# Armazenamento persistente: as amostras sobrevivem a reinícios e o histórico
+# em memória recebe as history_preload mais recentes na inicialização (start).
+# A reprodução grava num banco próprio, esvaziado a cada início, para que as amostras
+# reproduzidas (com os instantes da captura) não se misturem ao histórico dos instrumentos.
+# Os bancos são abertos (e o esquema criado) em start(), como os demais armazenamentos abaixo
+storage_path = os.path.join('dados', 'reproducao.sqlite' if acquisition_mode == 'replay' else 'historico.sqlite')
+storage = None
+
+# Série agregada: média/mín/máx/desvio/contagem das sub-amostras de cada janela de exibição
+aggregator = AgregadorJanela(periodo=update_interval)
+aggregated_storage = None
+
+# Índice de agregados de 1 s, 1 min e 1 h (média/mín/máx por coluna), atualizado a cada amostra:
+# /api/historico responde intervalos de semanas sem varrer as amostras brutas
+rollups = None
+
+# Detector de estabilidade: aceita a amostra quando a janela dos últimos stability_window s tem
+# irradiância estável (desvio e tendência) e inclinação dentro da tolerância. A marca vai na
+# coluna 'stable' do histórico e cada janela aceita (média/mín/máx/desvio por coluna) é gravada
+stability_window = 60.0  # s
+stability_max_std = 5.0  # W/m²
+stability_max_trend = 0.1  # W/m² por s
+stability_max_tilt = 0.5  # ° de angle_x e angle_y em relação a stability_tilt_reference (None = não verificar)
+stability_tilt_reference = (0.0, 0.0)
+stability = DetectorEstabilidade(janela=stability_window, desvio_maximo=stability_max_std,
+                                 tendencia_maxima=stability_max_trend, angulo_maximo=stability_max_tilt,
+                                 angulo_referencia=stability_tilt_reference)
+stability_storage = None
+
+# Calibração ao vivo: regressão incremental de cada canal do CR1000 contra a irradiância
+# de referência (sensibilidade em µV/(W/m²), offset, R² e incertezas), sem reprocessar o histórico
+cr1000_unit_uv = 1000.0  # µV por unidade lida do CR1000 (o programa do datalogger grava em mV)
+calibration_min_irradiance = None  # W/m²; amostras abaixo disso ficam fora da regressão (None = todas)
+calibration_stable_only = True  # só as amostras aceitas pelo detector de estabilidade entram na regressão
+calibration = CalibracaoIncremental(fator=cr1000_unit_uv, irradiancia_minima=calibration_min_irradiance,
+                                    coluna_aceite=COLUNA_ESTAVEL if calibration_stable_only else None)
+
+# Gateway Modbus TCP em localhost: outros programas leem os últimos registros do cache,
+# sem abrir as portas seriais nem gerar tráfego extra no barramento (None = desligado)
+gateway_port = None
+gateway_units = {'piranometro': 1, 'cr1000': 2}
+gateway_max_age = 10.0  # s; registros mais velhos respondem com a exceção 0x0B
+
+
+def append_historical(sample):
+    """Acrescenta a amostra publicada pelo motor de aquisição ao histórico"""
+    with historical_lock:
+        historical_data.append(sample)
+
+
+def restart_replay(sample):
+    """Recomeça o histórico em memória e o detector de estabilidade quando a reprodução volta no tempo.
+
+    Uma captura reproduzida de novo repete os instantes já vistos; graph_slice
+    usa searchsorted e o detector, a janela deslizante, e ambos os querem em ordem.
+    """
+    with historical_lock:
+        rewind = bool(len(historical_data)) and \
+            np.datetime64(sample['timestamp'], 'us') < historical_data.janela(1)['timestamp'][0]
+        if rewind:
+            historical_data.clear()
+    if rewind:
+        stability.encerrar()
+
+
+def format_value(value, fmt):
+    return "NaN" if math.isnan(value) else format(value, fmt)
+
+
+def stats_tables():
+    """Linhas das tabelas do piranômetro e do CR1000 (todos os canais) com a última janela agregada.
+
+    Antes de a primeira janela fechar, mostra a janela em andamento.
+    """
+    stats = aggregator.ultima() or aggregator.parcial()
+    if stats is None:
+        return None, None
+
+    def stats_row(column, fmt):
+        count = stats[f'{column}_count']
+        row = {key: format_value(stats[f'{column}_{key}'], fmt) for key in ('min', 'max', 'std')}
+        return {'value': format_value(stats[f'{column}_mean'], fmt), **row, 'count': count}
+
+    piranometer_table = [
+        {"parameter": "Irradiância solar", **stats_row('irradiance', '.2f'), "unit": "W/m²"},
+        {"parameter": "Tensão de saída", **stats_row('voltage_out', '.4f'), "unit": "mV"},
+        {"parameter": "Inclinação X", **stats_row('angle_x', '.2f'), "unit": "°"},
+        {"parameter": "Inclinação Y", **stats_row('angle_y', '.2f'), "unit": "°"}
+    ]
+    # 'port' não é coluna da tabela: o navegador filtra por ele os canais ativos
+    cr1000_table = [
+        {
+            'port': i,
+            'channel': f'Canal {i}',
+            **stats_row(f'cr1000_{i}', '.4f'),
+            'timestamp': stats['timestamp'].strftime('%H:%M:%S')
+        }
+        for i in (1, 2, 3)
+    ]
+    return piranometer_table, cr1000_table
+
+
+def bus_health_rows():
+    return [
+        {
+            'device': device,
+            'requests': stats['requisicoes'],
+            'timeouts': stats['timeout'],
+            'exceptions': stats['exception'],
+            'errors': stats['error'],
+            'crc': stats['erros_crc'],
+            'p50': format_value(stats['p50_ms'], '.1f'),
+            'p99': format_value(stats['p99_ms'], '.1f'),
+            'rate': format_value(stats['taxa_hz'], '.2f'),
+            'bytes': f"{stats['bytes_tx']}/{stats['bytes_rx']}",
+            'reconnects': stats['reconexoes'],
+            'breaker': stats['disjuntor'],
+            'timeout': format_value(stats['timeout_ms'], '.0f')
+        }
+        for device, stats in acquisition.resumo_barramento().items()
+    ]
+
+
+def calibration_rows():
+    """Coeficientes atuais de cada canal; 'port' permite ao navegador filtrar os canais ativos"""
+    return [
+        {
+            'port': i,
+            'channel': f'Canal {i}',
+            'count': result['count'],
+            'sensitivity': format_value(result['sensibilidade'], '.4f'),
+            'sensitivity_u': format_value(result['sensibilidade_u'], '.4f'),
+            'offset': format_value(result['offset'], '.2f'),
+            'offset_u': format_value(result['offset_u'], '.2f'),
+            'r2': format_value(result['r2'], '.6f'),
+            'residual': format_value(result['residuo'], '.2f'),
+        }
+        for i, result in enumerate(calibration.resultado().values(), start=1)
+    ]
+
+
+def stability_rows():
+    """Situação do detector e janelas aceitas (a em andamento primeiro)"""
+    state = stability.estado()
+    if state['estavel']:
+        status = (f"Estável · desvio {state['desvio']:.2f} W/m² · "
+                  f"tendência {state['tendencia']:+.3f} W/m²/s")
+    else:
+        status = f"Instável: {state['motivo']}"
+    rows = [
+        {
+            'start': window['timestamp'].strftime('%H:%M:%S'),
+            'duration': format_value(window['duration'], '.0f'),
+            'count': window['irradiance_count'],
+            'irradiance': format_value(window['irradiance_mean'], '.2f'),
+            'std': format_value(window['irradiance_std'], '.2f'),
+            'angle_x': format_value(window['angle_x_mean'], '.2f'),
+            'angle_y': format_value(window['angle_y_mean'], '.2f'),
+        }
+        for window in stability.janelas()
+    ]
+    return rows, status
+
+
+def stage_rows():
+    """Tempo de cada etapa: as do ciclo de aquisição (prefixo 'aquisicao.') e as deste processo"""
+    stages = {f'aquisicao.{name}': stats for name, stats in acquisition.resumo_etapas().items()}
+    stages.update(timings.resumo())
+    return [
+        {
+            'stage': name,
+            'count': stats['contagem'],
+            'mean': format_value(stats['media_ms'], '.3f'),
+            'p50': format_value(stats['p50_ms'], '.3f'),
+            'p99': format_value(stats['p99_ms'], '.3f'),
+            'max': format_value(stats['maximo_ms'], '.3f'),
+            'total': format_value(stats['total_s'], '.2f'),
+        }
+        for name, stats in stages.items()
+    ]
+
+
+def sampling_rows():
+    """Atraso de cada série (início do ciclo e requisição de cada dispositivo) em relação ao prazo da grade"""
+    sampling = acquisition.estatisticas_amostragem()
+    rows = [
+        {
+            'series': series,
+            'count': stats['contagem'],
+            'mean': format_value(stats['atraso_medio_ms'], '.2f'),
+            'jitter': format_value(stats['jitter_ms'], '.2f'),
+            'p99': format_value(stats['p99_ms'], '.2f'),
+            'max': format_value(stats['maximo_ms'], '.2f'),
+        }
+        for series, stats in sampling['series'].items()
+    ]
+    summary = (f"Período {sampling['periodo_s'] * 1000:.0f} ms · {sampling['ticks']} ciclos · "
+               f"{sampling['perdidos']} prazos perdidos · {sampling['estouros']} estouros")
+    return rows, summary
+
+
+@timings.funcao('lote.extra')
+def push_extra():
+    """Dados prontos para a interface, montados uma vez por lote para todos os navegadores"""
+    piranometer_table, cr1000_table = stats_tables()
+    timing_table, timing_summary = sampling_rows()
+    stability_table, stability_status = stability_rows()
+    return {'piranometro': piranometer_table, 'cr1000': cr1000_table, 'calibracao': calibration_rows(),
+            'estabilidade': stability_table, 'estabilidade_resumo': stability_status,
+            'barramento': bus_health_rows(),
+            'amostragem': timing_table, 'amostragem_resumo': timing_summary, 'etapas': stage_rows()}
+
+
+# Envio ao vivo por Server-Sent Events: a cada push_interval um único lote com as
+# amostras novas e as tabelas é serializado e entregue a todos os navegadores
+# conectados, que atualizam tabelas e gráfico localmente (assets/push.js)
+broadcaster = Difusor()
+publisher = PublicadorAmostras(broadcaster, ['timestamp', 'irradiance', 'cr1000_1', 'cr1000_2', 'cr1000_3',
+                                            COLUNA_ESTAVEL],
+                               intervalo=push_interval, extra=push_extra, etapas=timings)
+
+
+# Varredura das portas seriais em cache: com muitos adaptadores USB-serial a
+# enumeração é lenta, então ela é refeita no máximo a cada port_scan_ttl segundos
+# (ou pelo botão "Atualizar portas")
+port_scan_ttl = 30
+_port_cache = {'time': None, 'ports': []}
+_port_cache_lock = threading.Lock()
+
+
+def get_available_ports(refresh=False):
+    with _port_cache_lock:
+        now = time.monotonic()
+        if refresh or _port_cache['time'] is None or now - _port_cache['time'] > port_scan_ttl:
+            _port_cache['ports'] = [port.device for port in serial.tools.list_ports.comports()]
+            _port_cache['time'] = now
+        return list(_port_cache['ports'])
+
+
+def port_options(ports):
+    return [{'label': port, 'value': port} for port in ports]
+
+
+# Layout do aplicativo: montado a cada carregamento da página (e não na importação),
+# com uma única consulta à lista de portas em cache
+def serve_layout():
+    ports = get_available_ports()
+    return dbc.Container(
+        fluid=True,
+        style={
+            "display": "flex",
+            "flex-direction": "column",
+            "height": "100vh",
+            "padding": "20px",
+            "background": "#006d68",
+            "color": "white"
+        },
+        children=[
+            dcc.Location(id='url', refresh=False),
+            dcc.Store(id='connection-store'),
+            dcc.Store(id='live-store'),  # último lote recebido de /eventos
+            dcc.Store(id='graph-cursor'),  # amostras já enviadas ao gráfico deste navegador e no último redesenho
+            dcc.Store(id='graph-zoom'),  # intervalo de tempo ampliado pelo usuário (None = ao vivo)
+            dcc.Store(id='graph-redraw'),  # pedido do navegador para reduzir o histórico de novo
+            dcc.Store(id='graph-limits', data={'target': graph_target_points, 'max': graph_max_points}),
+
+            # Cabeçalho
+            dbc.Row(
+                [
+                    dbc.Col(
+                        html.Img(
+                            src="assets/Marca_Branca.png",
+                            style={"height": "8rem", "max-width": "100%", "object-fit": "contain"}
+                        ),
+                        width="auto",
                     ),
-                    width="auto",
+                    dbc.Col(
+                        html.H1(
+                            children='Calibração de Piranômetros',
+                            style={
+                                'color': '#FFFFFF',
+                                'font-size': 'clamp(2rem, 6vw, 4rem)',
+                                'margin': '0',
+                                'text-align': 'center',
+                                'font-weight': 'bold'
+                            }
+                        ),
+                        width="auto",
+                    )
+                ],
+                justify="center",
+                align="center",
+                className="w-100 mb-4",
+            ),
+
+            # Linha 1: Configuração Modbus - Piranômetro
+            dbc.Row(
+                dbc.Card(
+                    [
+                        dbc.CardHeader("Configuração Modbus - Piranômetro", className="bg-primary text-white"),
+                        dbc.CardBody(
+                            dbc.Row(
+                                [
+                                    dbc.Col(
+                                        [
+                                            dbc.Label("Porta Serial"),
+                                            dcc.Dropdown(
+                                                id='piranometer-port-dropdown',
+                                                options=port_options(ports),
+                                                value=ports[0] if ports else None,
+                                            ),
+                                        ],
+                                        md=2
+                                    ),
+                                    dbc.Col(
+                                        [
+                                            dbc.Label("Baudrate"),
+                                            dbc.Input(id='piranometer-baudrate', type='number', value=19200),
+                                        ],
+                                        md=2
+                                    ),
+                                    dbc.Col(
+                                        [
+                                            dbc.Label("Paridade"),
+                                            dbc.Select(
+                                                id='piranometer-parity',
+                                                options=[
+                                                    {'label': 'Nenhuma', 'value': 'N'},
+                                                    {'label': 'Par', 'value': 'E'},
+                                                    {'label': 'Ímpar', 'value': 'O'}
+                                                ],
+                                                value='E'
+                                            ),
+                                        ],
+                                        md=2
+                                    ),
+                                    dbc.Col(
+                                        [
+                                            dbc.Label("ID do Escravo"),
+                                            dbc.Input(id='piranometer-slave-id', type='number', value=32),
+                                        ],
+                                        md=2
+                                    ),
+                                ],
+                                className="g-2",
+                            )
+                        ),
+                    ],
+                    className="mb-3"
+                )
+            ),
+
+            # Linha 2: Configuração Modbus - CR1000
+            dbc.Row(
+                dbc.Card(
+                    [
+                        dbc.CardHeader("Configuração Modbus - CR1000", className="bg-primary text-white"),
+                        dbc.CardBody(
+                            dbc.Row(
+                                [
+                                    dbc.Col(
+                                        [
+                                            dbc.Label("Porta Serial"),
+                                            dcc.Dropdown(
+                                                id='cr1000-port-dropdown',
+                                                options=port_options(ports),
+                                                value=None,
+                                            ),
+                                        ],
+                                        md=2
+                                    ),
+                                    # Adicione este componente na seção de Configuração Modbus - CR1000 (dentro do CardBody)
+                                    dbc.Col(
+                                        [
+                                            dbc.Label("Portas Ativas"),
+                                            dbc.Checklist(
+                                                id='active-ports',
+                                                options=[
+                                                    {"label": "Canal 1", "value": 1},
+                                                    {"label": "Canal 2", "value": 2},
+                                                    {"label": "Canal 3", "value": 3},
+                                                ],
+                                                value=[1],  # Canal 1 ativo por padrão
+                                                inline=True,
+                                            ),
+                                        ],
+                                        md=2
+                                    ),
+                                    dbc.Col(
+                                        [
+                                            dbc.Label("Baudrate"),
+                                            dbc.Input(id='cr1000-baudrate', type='number', value=9600),
+                                        ],
+                                        md=2
+                                    ),
+                                    dbc.Col(
+                                        [
+                                            dbc.Label("Paridade"),
+                                            dbc.Select(
+                                                id='cr1000-parity',
+                                                options=[
+                                                    {'label': 'Nenhuma', 'value': 'N'},
+                                                    {'label': 'Par', 'value': 'E'},
+                                                    {'label': 'Ímpar', 'value': 'O'}
+                                                ],
+                                                value='N'
+                                            ),
+                                        ],
+                                        md=2
+                                    ),
+                                    dbc.Col(
+                                        [
+                                            dbc.Label("ID do Escravo"),
+                                            dbc.Input(id='cr1000-slave-id', type='number', value=1),
+                                        ],
+                                        md=2
+                                    ),
+                                ],
+                                className="g-2",
+                            )
+                        ),
+                    ],
+                    className="mb-3"
                 )
-            ],
-            justify="center",
-            align="center",
-            className="w-100 mb-4",
-        ),
-
-        # Linha 1: Configuração Modbus - Piranômetro
-        dbc.Row(
-            dbc.Card(
+            ),
+
+            # Linha 3: Botões de conexão
+            dbc.Row(
                 [
-                    dbc.CardHeader("Configuração Modbus - Piranômetro", className="bg-primary text-white"),
-                    dbc.CardBody(
-                        dbc.Row(
+                    dbc.Col(
+                        dbc.Button("Conectar Piranômetro", id='connect-piranometer-btn', color="success", className="me-2"),
+                        width="auto"),
+                    dbc.Col(dbc.Button("Conectar CR1000", id='connect-cr1000-btn', color="success", className="me-2"),
+                            width="auto"),
+                    dbc.Col(dbc.Button("Desconectar Tudo", id='disconnect-all-btn', color="danger", disabled=True),
+                            width="auto"),
+                    dbc.Col(dbc.Button("Atualizar portas", id='refresh-ports-btn', color="light"),
+                            width="auto"),
+                ],
+                className="mb-4 justify-content-center",
+            ),
+
+            # Linha 4: Cards de dados
+            dbc.Row(
+                id='data-display-row',
+                style={'display': 'none'},
+                children=[
+                    dbc.Col(
+                        dbc.Card(
                             [
-                                dbc.Col(
-                                    [
-                                        dbc.Label("Porta Serial"),
-                                        dcc.Dropdown(
-                                            id='piranometer-port-dropdown',
-                                            options=[{'label': port, 'value': port} for port in get_available_ports()],
-                                            value=get_available_ports()[0] if get_available_ports() else None,
-                                        ),
-                                    ],
-                                    md=2
-                                ),
-                                dbc.Col(
-                                    [
-                                        dbc.Label("Baudrate"),
-                                        dbc.Input(id='piranometer-baudrate', type='number', value=19200),
-                                    ],
-                                    md=2
-                                ),
-                                dbc.Col(
+                                dbc.CardHeader("Gráficos", className="bg-primary text-white"),
+                                dbc.CardBody(
+                                    dcc.Graph(
+                                        id='data-graph',
+                                        config={'displayModeBar': True},
+                                        style={'height': '400px'}
+                                    )
+                                )
+                            ],
+                            style={"height": "100%"}
+                        ),
+                        md=8
+                    ),
+                    dbc.Col(
+                        dbc.Card(
+                            [
+                                dbc.CardHeader("Dados do Piranômetro", className="bg-primary text-white"),
+                                dbc.CardBody(
                                     [
-                                        dbc.Label("Paridade"),
-                                        dbc.Select(
-                                            id='piranometer-parity',
-                                            options=[
-                                                {'label': 'Nenhuma', 'value': 'N'},
-                                                {'label': 'Par', 'value': 'E'},
-                                                {'label': 'Ímpar', 'value': 'O'}
+                                        dash_table.DataTable(
+                                            id='piranometer-table',
+                                            columns=[
+                                                {"name": "Parâmetro", "id": "parameter"},
+                                                {"name": "Média", "id": "value"},
+                                                {"name": "Mín", "id": "min"},
+                                                {"name": "Máx", "id": "max"},
+                                                {"name": "Desvio", "id": "std"},
+                                                {"name": "N", "id": "count"},
+                                                {"name": "Unidade", "id": "unit"}
                                             ],
-                                            value='E'
+                                            style_table={'height': '300px', 'overflowY': 'auto'},
+                                            style_cell={'textAlign': 'left', 'padding': '8px', 'color': 'black'},
                                         ),
-                                    ],
-                                    md=2
-                                ),
-                                dbc.Col(
-                                    [
-                                        dbc.Label("ID do Escravo"),
-                                        dbc.Input(id='piranometer-slave-id', type='number', value=32),
-                                    ],
-                                    md=2
-                                ),
+                                        html.H6("Janelas estáveis (aceite para calibração)", className="mt-3"),
+                                        html.Div(id='stability-status', className="small"),
+                                        dash_table.DataTable(
+                                            id='stability-table',
+                                            columns=[
+                                                {"name": "Início", "id": "start"},
+                                                {"name": "Duração (s)", "id": "duration"},
+                                                {"name": "N", "id": "count"},
+                                                {"name": "Irradiância", "id": "irradiance"},
+                                                {"name": "Desvio", "id": "std"},
+                                                {"name": "Incl. X", "id": "angle_x"},
+                                                {"name": "Incl. Y", "id": "angle_y"}
+                                            ],
+                                            style_table={'height': '200px', 'overflowY': 'auto'},
+                                            style_cell={'textAlign': 'left', 'padding': '8px', 'color': 'black'},
+                                        )
+                                    ]
+                                )
                             ],
-                            className="g-2",
-                        )
-                    ),
+                            style={"height": "100%"}
+                        ),
+                        md=4
+                    )
                 ],
-                className="mb-3"
-            )
-        ),
+                className="g-3"
+            ),
 
-        # Linha 2: Configuração Modbus - CR1000
-        dbc.Row(
-            dbc.Card(
-                [
-                    dbc.CardHeader("Configuração Modbus - CR1000", className="bg-primary text-white"),
-                    dbc.CardBody(
-                        dbc.Row(
+            # Linha 5: Dados CR1000
+            dbc.Row(
+                id='cr1000-data-row',
+                style={'display': 'none'},
+                children=[
+                    dbc.Col(
+                        dbc.Card(
                             [
-                                dbc.Col(
+                                dbc.CardHeader("Dados CR1000 - Canais", className="bg-primary text-white"),
+                                dbc.CardBody(
                                     [
-                                        dbc.Label("Porta Serial"),
-                                        dcc.Dropdown(
-                                            id='cr1000-port-dropdown',
-                                            options=[{'label': port, 'value': port} for port in get_available_ports()],
-                                            value=None,
+                                        dash_table.DataTable(
+                                            id='cr1000-table',
+                                            columns=[
+                                                {"name": "Canal", "id": "channel"},
+                                                {"name": "Média", "id": "value"},
+                                                {"name": "Mín", "id": "min"},
+                                                {"name": "Máx", "id": "max"},
+                                                {"name": "Desvio", "id": "std"},
+                                                {"name": "N", "id": "count"},
+                                                {"name": "Timestamp", "id": "timestamp"}
+                                            ],
+                                            style_table={'height': '200px', 'overflowY': 'auto'},
+                                            style_cell={'textAlign': 'left', 'padding': '8px', 'color': 'black'},
                                         ),
-                                    ],
-                                    md=2
-                                ),
-                                # Adicione este componente na seção de Configuração Modbus - CR1000 (dentro do CardBody)
-                                dbc.Col(
-                                    [
-                                        dbc.Label("Portas Ativas"),
-                                        dbc.Checklist(
-                                            id='active-ports',
-                                            options=[
-                                                {"label": "Canal 1", "value": 1},
-                                                {"label": "Canal 2", "value": 2},
-                                                {"label": "Canal 3", "value": 3},
+                                        html.H6("Calibração ao vivo (tensão = sensibilidade × irradiância + offset)",
+                                                className="mt-3"),
+                                        dash_table.DataTable(
+                                            id='calibration-table',
+                                            columns=[
+                                                {"name": "Canal", "id": "channel"},
+                                                {"name": "N", "id": "count"},
+                                                {"name": "Sensibilidade (µV/W/m²)", "id": "sensitivity"},
+                                                {"name": "u (k=1)", "id": "sensitivity_u"},
+                                                {"name": "Offset (µV)", "id": "offset"},
+                                                {"name": "u offset (k=1)", "id": "offset_u"},
+                                                {"name": "R²", "id": "r2"},
+                                                {"name": "Resíduo (µV)", "id": "residual"}
                                             ],
-                                            value=[1],  # Canal 1 ativo por padrão
-                                            inline=True,
+                                            style_cell={'textAlign': 'left', 'padding': '8px', 'color': 'black'},
                                         ),
-                                    ],
-                                    md=2
-                                ),
-                                dbc.Col(
-                                    [
-                                        dbc.Label("Baudrate"),
-                                        dbc.Input(id='cr1000-baudrate', type='number', value=9600),
-                                    ],
-                                    md=2
-                                ),
-                                dbc.Col(
-                                    [
-                                        dbc.Label("Paridade"),
-                                        dbc.Select(
-                                            id='cr1000-parity',
-                                            options=[
-                                                {'label': 'Nenhuma', 'value': 'N'},
-                                                {'label': 'Par', 'value': 'E'},
-                                                {'label': 'Ímpar', 'value': 'O'}
+                                        dbc.Button("Reiniciar calibração", id='calibration-reset-btn', color="warning",
+                                                   className="mt-2"),
+                                        dbc.Row(
+                                            [
+                                                dbc.Col(
+                                                    [
+                                                        dbc.Label("Formato"),
+                                                        dbc.Select(
+                                                            id='export-format',
+                                                            options=[
+                                                                {'label': 'Excel (.xlsx)', 'value': 'xlsx'},
+                                                                {'label': 'CSV', 'value': 'csv'},
+                                                                {'label': 'Parquet', 'value': 'parquet'}
+                                                            ],
+                                                            value='xlsx'
+                                                        ),
+                                                    ],
+                                                    md=2
+                                                ),
+                                                dbc.Col(
+                                                    [
+                                                        dbc.Label("Série"),
+                                                        dbc.Select(
+                                                            id='export-series',
+                                                            options=[
+                                                                {'label': 'Amostras brutas', 'value': 'raw'},
+                                                                {'label': 'Agregada por janela', 'value': 'aggregated'}
+                                                            ],
+                                                            value='raw'
+                                                        ),
+                                                    ],
+                                                    md=2
+                                                ),
+                                                dbc.Col(
+                                                    [
+                                                        dbc.Label("Início"),
+                                                        dbc.Input(id='export-start', type='datetime-local'),
+                                                    ],
+                                                    md=2
+                                                ),
+                                                dbc.Col(
+                                                    [
+                                                        dbc.Label("Fim"),
+                                                        dbc.Input(id='export-end', type='datetime-local'),
+                                                    ],
+                                                    md=2
+                                                ),
+                                                dbc.Col(
+                                                    [
+                                                        dbc.Label("Colunas"),
+                                                        dbc.Checklist(
+                                                            id='export-columns',
+                                                            options=[{'label': c, 'value': c} for c in COLUNAS_HISTORICO[1:]],
+                                                            value=COLUNAS_HISTORICO[1:],
+                                                            inline=True,
+                                                        ),
+                                                    ],
+                                                    md=4
+                                                ),
                                             ],
-                                            value='N'
+                                            className="g-2 mt-3",
                                         ),
-                                    ],
-                                    md=2
-                                ),
-                                dbc.Col(
-                                    [
-                                        dbc.Label("ID do Escravo"),
-                                        dbc.Input(id='cr1000-slave-id', type='number', value=1),
-                                    ],
-                                    md=2
-                                ),
-                            ],
-                            className="g-2",
+                                        dbc.Button("Exportar Dados", id='export-btn', color="info", className="mt-3"),
+                                        dbc.Progress(id='export-progress', value=0, className="mt-3",
+                                                     style={'display': 'none'}),
+                                        html.A("Baixar arquivo exportado", id='export-link', href='',
+                                               className="btn btn-light mt-3", style={'display': 'none'}),
+                                        dcc.Store(id='export-job'),
+                                        dcc.Interval(id='export-progress-interval', interval=500, disabled=True)
+                                    ]
+                                )
+                            ]
                         )
-                    ),
+                    )
                 ],
-                className="mb-3"
-            )
-        ),
+                className="mt-3"
+            ),
 
-        # Linha 3: Botões de conexão
-        dbc.Row(
-            [
-                dbc.Col(
-                    dbc.Button("Conectar Piranômetro", id='connect-piranometer-btn', color="success", className="me-2"),
-                    width="auto"),
-                dbc.Col(dbc.Button("Conectar CR1000", id='connect-cr1000-btn', color="success", className="me-2"),
-                        width="auto"),
-                dbc.Col(dbc.Button("Desconectar Tudo", id='disconnect-all-btn', color="danger", disabled=True),
-                        width="auto"),
-            ],
-            className="mb-4 justify-content-center",
-        ),
-
-        # Linha 4: Cards de dados
-        dbc.Row(
-            id='data-display-row',
-            style={'display': 'none'},
-            children=[
-                dbc.Col(
-                    dbc.Card(
-                        [
-                            dbc.CardHeader("Gráficos", className="bg-primary text-white"),
-                            dbc.CardBody(
-                                dcc.Graph(
-                                    id='data-graph',
-                                    config={'displayModeBar': True},
-                                    style={'height': '400px'}
-                                )
-                            )
-                        ],
-                        style={"height": "100%"}
-                    ),
-                    md=8
-                ),
+            # Linha 6: Saúde do barramento Modbus (as mesmas métricas saem em /metrics para o Prometheus)
+            dbc.Row(
                 dbc.Col(
                     dbc.Card(
                         [
-                            dbc.CardHeader("Dados do Piranômetro", className="bg-primary text-white"),
-                            dbc.CardBody(
-                                dash_table.DataTable(
-                                    id='piranometer-table',
-                                    columns=[
-                                        {"name": "Parâmetro", "id": "parameter"},
-                                        {"name": "Valor", "id": "value"},
-                                        {"name": "Unidade", "id": "unit"}
-                                    ],
-                                    style_table={'height': '300px', 'overflowY': 'auto'},
-                                    style_cell={'textAlign': 'left', 'padding': '8px', 'color': 'black'},
-                                )
-                            )
-                        ],
-                        style={"height": "100%"}
-                    ),
-                    md=4
-                )
-            ],
-            className="g-3"
-        ),
-
-        # Linha 5: Dados CR1000
-        dbc.Row(
-            id='cr1000-data-row',
-            style={'display': 'none'},
-            children=[
-                dbc.Col(
-                    dbc.Card(
-                        [
-                            dbc.CardHeader("Dados CR1000 - Canais", className="bg-primary text-white"),
+                            dbc.CardHeader("Saúde do barramento", className="bg-primary text-white"),
                             dbc.CardBody(
                                 [
                                     dash_table.DataTable(
-                                        id='cr1000-table',
+                                        id='bus-health-table',
                                         columns=[
-                                            {"name": "Canal", "id": "channel"},
-                                            {"name": "Valor", "id": "value"},
-                                            {"name": "Timestamp", "id": "timestamp"}
+                                            {"name": "Dispositivo", "id": "device"},
+                                            {"name": "Requisições", "id": "requests"},
+                                            {"name": "Timeouts", "id": "timeouts"},
+                                            {"name": "Exceções", "id": "exceptions"},
+                                            {"name": "Outros erros", "id": "errors"},
+                                            {"name": "Erros CRC", "id": "crc"},
+                                            {"name": "p50 (ms)", "id": "p50"},
+                                            {"name": "p99 (ms)", "id": "p99"},
+                                            {"name": "Taxa (Hz)", "id": "rate"},
+                                            {"name": "Bytes TX/RX", "id": "bytes"},
+                                            {"name": "Reconexões", "id": "reconnects"},
+                                            {"name": "Disjuntor", "id": "breaker"},
+                                            {"name": "Timeout (ms)", "id": "timeout"}
                                         ],
-                                        style_table={'height': '200px', 'overflowY': 'auto'},
                                         style_cell={'textAlign': 'left', 'padding': '8px', 'color': 'black'},
                                     ),
-                                    dbc.Button("Exportar Dados", id='export-btn', color="info", className="mt-3"),
-                                    dcc.Download(id="download-excel")
+                                    html.H6("Temporização da amostragem (atraso em relação ao prazo da grade)",
+                                            className="mt-3"),
+                                    dash_table.DataTable(
+                                        id='sampling-table',
+                                        columns=[
+                                            {"name": "Série", "id": "series"},
+                                            {"name": "N", "id": "count"},
+                                            {"name": "Atraso médio (ms)", "id": "mean"},
+                                            {"name": "Jitter (ms)", "id": "jitter"},
+                                            {"name": "p99 (ms)", "id": "p99"},
+                                            {"name": "Máx (ms)", "id": "max"}
+                                        ],
+                                        style_cell={'textAlign': 'left', 'padding': '8px', 'color': 'black'},
+                                    ),
+                                    html.Div(id='sampling-summary', className="mt-2"),
+                                    html.H6("Tempo por etapa (últimas 1000 medições de cada)", className="mt-3"),
+                                    dash_table.DataTable(
+                                        id='stage-table',
+                                        columns=[
+                                            {"name": "Etapa", "id": "stage"},
+                                            {"name": "N", "id": "count"},
+                                            {"name": "Média (ms)", "id": "mean"},
+                                            {"name": "p50 (ms)", "id": "p50"},
+                                            {"name": "p99 (ms)", "id": "p99"},
+                                            {"name": "Máx (ms)", "id": "max"},
+                                            {"name": "Total (s)", "id": "total"}
+                                        ],
+                                        sort_action='native',
+                                        style_table={'height': '300px', 'overflowY': 'auto'},
+                                        style_cell={'textAlign': 'left', 'padding': '8px', 'color': 'black'},
+                                    ),
+                                    dbc.Row(
+                                        [
+                                            dbc.Col(
+                                                [
+                                                    dbc.Label("Perfil (cProfile) da função"),
+                                                    dbc.Select(
+                                                        id='profile-target',
+                                                        options=[{'label': name, 'value': name}
+                                                                 for name in timings.funcoes()],
+                                                    ),
+                                                ],
+                                                md=4
+                                            ),
+                                            dbc.Col(
+                                                [
+                                                    dbc.Label("Invocações"),
+                                                    dbc.Input(id='profile-count', type='number', min=1, value=20),
+                                                ],
+                                                md=2
+                                            ),
+                                            dbc.Col(
+                                                dbc.Button("Capturar perfil", id='profile-btn', color="info"),
+                                                md=2,
+                                                className="d-flex align-items-end"
+                                            ),
+                                        ],
+                                        className="g-2 mt-3",
+                                    ),
+                                    html.Div(id='profile-status', className="mt-2"),
+                                    html.Div(
+                                        [
+                                            html.A("Baixar perfil (.prof)", id='profile-link-prof', href='',
+                                                   className="btn btn-light me-2"),
+                                            html.A("Baixar relatório (.txt)", id='profile-link-txt', href='',
+                                                   className="btn btn-light")
+                                        ],
+                                        id='profile-links',
+                                        className="mt-2",
+                                        style={'display': 'none'}
+                                    ),
+                                    dcc.Store(id='profile-job'),
+                                    dcc.Interval(id='profile-interval', interval=500, disabled=True),
+                                    html.A("Métricas (Prometheus)", href='/metrics', target='_blank',
+                                           className="btn btn-light mt-3")
                                 ]
                             )
                         ]
                     )
-                )
-            ],
-            className="mt-3"
-        ),
+                ),
+                className="mt-3"
+            ),
 
-        dbc.Alert(id='connection-status', className="mt-3", is_open=False)
-    ]
+            dbc.Alert(id='connection-status', className="mt-3", is_open=False)
+        ]
+    )
+
+
+app.layout = serve_layout
+
+
+# Callback para refazer a varredura das portas seriais
+@app.callback(
+    [Output('piranometer-port-dropdown', 'options'),
+     Output('cr1000-port-dropdown', 'options')],
+    Input('refresh-ports-btn', 'n_clicks'),
+    prevent_initial_call=True
 )
+@timings.funcao('callback.refresh_ports')
+def refresh_ports(n_clicks):
+    options = port_options(get_available_ports(refresh=True))
+    return options, options
 
 
 # Callback para gerenciar conexões
@@ -350,8 +842,7 @@ app.layout = dbc.Container(
      Output('disconnect-all-btn', 'disabled'),
      Output('data-display-row', 'style'),
      Output('cr1000-data-row', 'style'),
-     Output('connection-store', 'data'),
-     Output('update-interval', 'disabled')],
+     Output('connection-store', 'data')],
     [Input('connect-piranometer-btn', 'n_clicks'),
      Input('connect-cr1000-btn', 'n_clicks'),
      Input('disconnect-all-btn', 'n_clicks')],
@@ -365,6 +856,7 @@ app.layout = dbc.Container(
      State('cr1000-slave-id', 'value')],
     prevent_initial_call=True
 )
+@timings.funcao('callback.manage_connections')
 def manage_connections(piranometer_clicks, cr1000_clicks, disconnect_clicks,
                        piranometer_port, piranometer_baud, piranometer_parity, piranometer_slave,
                        cr1000_port, cr1000_baud, cr1000_parity, cr1000_slave):
@@ -373,196 +865,189 @@ def manage_connections(piranometer_clicks, cr1000_clicks, disconnect_clicks,
         raise PreventUpdate
 
     button_id = ctx.triggered[0]['prop_id'].split('.')[0]
-    global piranometer_client, cr1000_client
 
     if button_id == 'connect-piranometer-btn':
         try:
-            piranometer_client = ModbusSerialClient(
-                port=piranometer_port,
-                baudrate=piranometer_baud,
-                parity=piranometer_parity,
-                stopbits=1,
-                bytesize=8,
-                timeout=2.0
+            acquisition.conectar_piranometro(piranometer_port, piranometer_baud, piranometer_parity,
+                                             piranometer_slave, timeout=2.0)
+            acquisition.iniciar()
+            return (
+                "Piranômetro conectado com sucesso!", "success", True,
+                True, False, False,
+                {'display': 'flex'}, {'display': 'flex'},
+                {'piranometer_connected': True, 'piranometer_port': piranometer_port,
+                 'piranometer_slave': piranometer_slave,
+                 'cr1000_connected': acquisition.cr1000_conectado, 'cr1000_slave': cr1000_slave}
             )
 
-            if piranometer_client.connect():
-                return (
-                    "Piranômetro conectado com sucesso!", "success", True,
-                    True, False, False,
-                    {'display': 'flex'}, {'display': 'flex'},
-                    {'piranometer_connected': True, 'piranometer_port': piranometer_port,
-                     'piranometer_slave': piranometer_slave,
-                     'cr1000_connected': cr1000_client is not None, 'cr1000_slave': cr1000_slave},
-                    False
-                )
-            else:
-                raise Exception("Falha na conexão física com piranômetro")
-
         except Exception as e:
             return (
                 f"Erro na conexão Piranômetro: {str(e)}", "danger", True,
                 False, False, False,
                 {'display': 'none'}, {'display': 'none'},
-                None, True
+                None
             )
 
     elif button_id == 'connect-cr1000-btn':
         try:
-            cr1000_client = ModbusSerialClient(
-                port=cr1000_port,
-                baudrate=cr1000_baud,
-                parity=cr1000_parity,
-                stopbits=1,
-                bytesize=8,
-                timeout=3.0
+            # Abre a porta e testa a comunicação lendo os registros
+            acquisition.conectar_cr1000(cr1000_port, cr1000_baud, cr1000_parity,
+                                        cr1000_slave, timeout=3.0)
+            acquisition.iniciar()
+            return (
+                "CR1000 conectado com sucesso!", "success", True,
+                False, True, False,
+                {'display': 'flex'}, {'display': 'flex'},
+                {'piranometer_connected': acquisition.piranometro_conectado,
+                 'piranometer_port': piranometer_port,
+                 'piranometer_slave': piranometer_slave,
+                 'cr1000_connected': True, 'cr1000_slave': cr1000_slave}
             )
 
-            if cr1000_client.connect():
-                # Testar comunicação lendo registros
-                response = cr1000_client.read_holding_registers(
-                    address=0,
-                    count=6,
-                    slave=cr1000_slave
-                )
-
-                if not response.isError():
-                    return (
-                        "CR1000 conectado com sucesso!", "success", True,
-                        False, True, False,
-                        {'display': 'flex'}, {'display': 'flex'},
-                        {'piranometer_connected': piranometer_client is not None, 'piranometer_port': piranometer_port,
-                         'piranometer_slave': piranometer_slave,
-                         'cr1000_connected': True, 'cr1000_slave': cr1000_slave},
-                        False
-                    )
-                else:
-                    cr1000_client.close()
-                    cr1000_client = None
-                    raise Exception("Falha na comunicação com CR1000 - Resposta inválida")
-            else:
-                raise Exception("Falha na conexão física com CR1000")
-
         except Exception as e:
             return (
                 f"Erro na conexão CR1000: {str(e)}", "danger", True,
                 False, False, False,
                 {'display': 'none'}, {'display': 'none'},
-                None, True
+                None
             )
 
     elif button_id == 'disconnect-all-btn':
-        if piranometer_client:
-            piranometer_client.close()
-            piranometer_client = None
-        if cr1000_client:
-            cr1000_client.close()
-            cr1000_client = None
+        acquisition.desconectar_todos()
+        stability.encerrar()  # fim da medição: grava a janela aceita em andamento
         return (
             "Todos dispositivos desconectados", "warning", True,
             False, False, True,
             {'display': 'none'}, {'display': 'none'},
-            None, True
+            None
         )
 
 
-# Callback para atualizar dados
+# Redesenho do gráfico no servidor (reduzido para graph_target_points por trace) quando os
+# canais ativos ou a conexão mudam, ou quando o navegador já acrescentou pontos demais
 @app.callback(
-    [Output('piranometer-table', 'data'),
-     Output('cr1000-table', 'data'),
-     Output('data-graph', 'figure'),
-     Output('data-store', 'data')],
-    [Input('update-interval', 'n_intervals'),
-     Input('active-ports', 'value')],
-    [State('connection-store', 'data')],
-
+    [Output('data-graph', 'figure'),
+     Output('graph-cursor', 'data')],
+    [Input('active-ports', 'value'),
+     Input('connection-store', 'data'),
+     Input('graph-redraw', 'data')],
+    State('graph-zoom', 'data'),
     prevent_initial_call=True
 )
-def update_data(n_intervals, active_ports, connection_data):
-    global historical_data
+@timings.funcao('callback.redraw_graph')
+def redraw_graph(active_ports, connection_data, redraw, graph_zoom):
+    if not connection_data:
+        raise PreventUpdate
 
+    acquisition.portas_ativas = list(active_ports)
+    total, data = graph_slice(graph_zoom)
+    fig = create_figure(data, active_ports, graph_zoom)
+    return fig, {'total': total, 'redraw_total': total}
 
 
-    if not connection_data:
-        print("Sem dados de conexão!")
-        raise PreventUpdate
+# Aplicação de cada lote recebido por /eventos, no navegador: tabelas e pontos novos
+# (extendData) sem nenhuma requisição ao servidor
+app.clientside_callback(
+    ClientsideFunction(namespace='push', function_name='apply_batch'),
+    [Output('piranometer-table', 'data'),
+     Output('cr1000-table', 'data'),
+     Output('calibration-table', 'data'),
+     Output('stability-table', 'data'),
+     Output('stability-status', 'children'),
+     Output('bus-health-table', 'data'),
+     Output('sampling-table', 'data'),
+     Output('sampling-summary', 'children'),
+     Output('stage-table', 'data'),
+     Output('data-graph', 'extendData'),
+     Output('graph-cursor', 'data', allow_duplicate=True),
+     Output('graph-redraw', 'data')],
+    Input('live-store', 'data'),
+    [State('active-ports', 'value'),
+     State('connection-store', 'data'),
+     State('graph-cursor', 'data'),
+     State('graph-zoom', 'data'),
+     State('graph-limits', 'data')],
+    prevent_initial_call=True
+)
 
-    # 1. Obter dados do piranômetro
-    piranometer_data = {}
-    if piranometer_client and connection_data.get('piranometer_connected'):
-        try:
-            response = piranometer_client.read_holding_registers(
-                address=0, count=29, slave=connection_data['piranometer_slave']
-            )
 
-            if response.isError():
-                print("Erro na resposta do piranômetro!")
-            else:
-                print(f"Dados piranômetro: {response.registers[:4]}...")  # Debug
-                piranometer_data = {
-                    'irradiance': concat_16bits_to_float(response.registers[2], response.registers[3]),
-                    'voltage_out': concat_16bits_to_float(response.registers[20], response.registers[21]),
-                    'angle_x': concat_16bits_to_float(response.registers[14], response.registers[15]),
-                    'angle_y': concat_16bits_to_float(response.registers[16], response.registers[17])
-                }
-        except Exception as e:
-            print(f"Erro no piranômetro: {str(e)}")
+# Reinicia a regressão de todos os canais (novo sensor ou nova montagem)
+@app.callback(
+    Output('calibration-table', 'data', allow_duplicate=True),
+    Input('calibration-reset-btn', 'n_clicks'),
+    State('active-ports', 'value'),
+    prevent_initial_call=True
+)
+@timings.funcao('callback.reset_calibration')
+def reset_calibration(n_clicks, active_ports):
+    calibration.reiniciar()
+    return [row for row in calibration_rows() if row['port'] in active_ports]
 
-    # 2. Obter dados do CR1000
-    cr1000_values = [float('nan')] * 3
-    if cr1000_client and connection_data.get('cr1000_connected'):
-        try:
-            response = cr1000_client.read_holding_registers(
-                address=0, count=6, slave=connection_data['cr1000_slave']
-            )
 
-            if response.isError():
-                print("Erro na resposta do CR1000!")
-            else:
-                print(f"Dados CR1000: {response.registers}")  # Debug
-                cr1000_values = interpret_cr1000_values(response.registers, active_ports)
-        except Exception as e:
-            print(f"Erro no CR1000: {str(e)}")
+# Callback de zoom: busca uma fatia com mais resolução para o intervalo visível
+@app.callback(
+    [Output('data-graph', 'figure', allow_duplicate=True),
+     Output('graph-zoom', 'data'),
+     Output('graph-cursor', 'data', allow_duplicate=True)],
+    Input('data-graph', 'relayoutData'),
+    State('active-ports', 'value'),
+    prevent_initial_call=True
+)
+@timings.funcao('callback.zoom_graph')
+def zoom_graph(relayout_data, active_ports):
+    if not relayout_data:
+        raise PreventUpdate
+    if 'xaxis.range[0]' in relayout_data:
+        zoom = [relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']]
+    elif 'xaxis.range' in relayout_data:
+        zoom = list(relayout_data['xaxis.range'])
+    elif relayout_data.get('xaxis.autorange'):
+        zoom = None  # duplo clique: volta à visão ao vivo
+    else:
+        raise PreventUpdate
 
-    # 3. Preparar dados para tabelas
-    piranometer_table = [
-        {"parameter": "Irradiância solar", "value": f"{piranometer_data.get('irradiance', float('nan')):.2f}",
-         "unit": "W/m²"},
-        {"parameter": "Tensão de saída", "value": f"{piranometer_data.get('voltage_out', float('nan')):.4f}",
-         "unit": "mV"},
-        {"parameter": "Inclinação X", "value": f"{piranometer_data.get('angle_x', float('nan')):.2f}", "unit": "°"},
-        {"parameter": "Inclinação Y", "value": f"{piranometer_data.get('angle_y', float('nan')):.2f}", "unit": "°"}
-    ]
+    total, data = graph_slice(zoom)
+    fig = create_figure(data, active_ports, zoom)
+    return fig, zoom, {'total': total, 'redraw_total': total}
 
-    cr1000_table = []
-    for i in active_ports:
-        val = cr1000_values[i - 1]
-        cr1000_table.append({
-            'channel': f'Canal {i}',
-            'value': f"{val:.4f}" if not math.isnan(val) else "NaN",
-            'timestamp': datetime.now().strftime('%H:%M:%S')
-        })
 
-    # 4. Atualizar histórico
-    new_row = {
-        'timestamp': datetime.now(),
-        **piranometer_data,
-        'cr1000_1': cr1000_values[0],
-        'cr1000_2': cr1000_values[1],
-        'cr1000_3': cr1000_values[2]
-    }
-    historical_data = pd.concat([historical_data, pd.DataFrame([new_row])], ignore_index=True)
+@timings.funcao('grafico.fatia')
+def graph_slice(zoom):
+    """(total de amostras recebidas, cópia das colunas do histórico no intervalo visível).
 
-    # 5. Criar gráfico
-    fig = create_figure(historical_data, active_ports)
+    Sem zoom, a fatia é todo o buffer. Só a cópia acontece sob historical_lock;
+    a figura é montada fora dele. Se o início do zoom for anterior ao que o
+    buffer guarda, a fatia vem do armazenamento persistente: as amostras brutas
+    até graph_max_storage_rows, acima disso a média de cada intervalo dos
+    agregados.
+    """
+    start = end = None
+    if zoom:
+        start, end = (np.datetime64(str(value).replace(' ', 'T'), 'us') for value in zoom)
+    with historical_lock:
+        total = historical_data.total
+        window = historical_data.janela()
+        timestamps = window['timestamp']
+        if not zoom:
+            return total, {column: values.copy() for column, values in window.items()}
+        if len(timestamps) and start >= timestamps[0]:
+            i0, i1 = np.searchsorted(timestamps, start, side='left'), np.searchsorted(timestamps, end, side='right')
+            return total, {column: values[i0:i1].copy() for column, values in window.items()}
 
-    return piranometer_table, cr1000_table, fig, new_row
+    if storage.contar(start, end) <= graph_max_storage_rows:
+        return total, storage.ler_intervalo(start, end)
+    _, data = rollups.consultar(start, end, resolucao='auto')
+    return total, {column: data[f'{column}_mean'] if column in rollups.colunas else data[column]
+                   for column in ['timestamp'] + rollups.colunas}
 
 
-def create_figure(data, active_ports):
+@timings.funcao('grafico.figura')
+def create_figure(data, active_ports, zoom=None):
+    # Cada trace é reduzido no servidor para ~graph_target_points pontos
+    x, y = reduzir(data['timestamp'], data['irradiance'], graph_target_points, graph_downsampling)
     fig_data = [{
-        'x': data['timestamp'],
-        'y': data['irradiance'],
+        'x': x,
+        'y': y,
         'type': 'line',
         'name': 'Irradiância (W/m²)',
         'yaxis': 'y1'
@@ -570,53 +1055,316 @@ def create_figure(data, active_ports):
 
     colors = ['red', 'green', 'purple']
     for i in active_ports:
+        x, y = reduzir(data['timestamp'], data[f'cr1000_{i}'], graph_target_points, graph_downsampling)
         fig_data.append({
-            'x': data['timestamp'],
-            'y': data[f'cr1000_{i}'],
+            'x': x,
+            'y': y,
             'type': 'line',
             'name': f'Canal {i}',
             'yaxis': 'y2',
             'line': {'color': colors[i - 1]}
         })
 
+    # Faixas das amostras aceitas pelo detector de estabilidade: degraus 0/1 num eixo próprio,
+    # só com os pontos de mudança (o navegador estende o trace com a marca de cada amostra nova).
+    # As médias dos agregados não têm a marca: o trace fica zerado
+    marks = data.get(COLUNA_ESTAVEL, np.full(len(data['timestamp']), np.nan))
+    x, y = bordas_estaveis(data['timestamp'], marks)
+    fig_data.append({
+        'x': x,
+        'y': y,
+        'type': 'scatter',
+        'mode': 'lines',
+        'name': 'Janela estável',
+        'yaxis': 'y3',
+        'fill': 'tozeroy',
+        'fillcolor': 'rgba(40, 167, 69, 0.15)',
+        'line': {'shape': 'hv', 'width': 0},
+        'hoverinfo': 'skip'
+    })
+
+    xaxis = {'title': 'Tempo'}
+    if zoom:
+        xaxis['range'] = zoom
     return {
         'data': fig_data,
         'layout': {
             'title': 'Dados em Tempo Real',
-            'xaxis': {'title': 'Tempo'},
+            'xaxis': xaxis,
             'yaxis': {'title': 'Irradiância (W/m²)', 'side': 'left'},
-            'yaxis2': {'title': 'Valores CR1000', 'side': 'right', 'overlaying': 'y'}
+            'yaxis2': {'title': 'Valores CR1000', 'side': 'right', 'overlaying': 'y'},
+            'yaxis3': {'range': [0, 1], 'overlaying': 'y', 'visible': False, 'fixedrange': True}
         }
     }
 
 
+@server.route('/eventos')
+def push_events():
+    """Fluxo Server-Sent Events com os lotes de amostras (um por push_interval)"""
+    return flask.Response(broadcaster.fluxo(), mimetype='text/event-stream',
+                          headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@server.route('/api/historico')
+@timings.funcao('rota.history_query')
+def history_query():
+    """Intervalo do histórico em JSON: ?start=&end= (ISO 8601), columns=a,b e resolution=auto|raw|1s|1min|1h"""
+    args = flask.request.args
+    try:
+        start = datetime.fromisoformat(args['start']) if args.get('start') else None
+        end = datetime.fromisoformat(args['end']) if args.get('end') else None
+        columns = [c for c in args.get('columns', '').split(',') if c] or None
+        resolution, data = rollups.consultar(start, end, columns, args.get('resolution', 'auto'))
+    except ValueError as e:
+        return flask.jsonify({'error': str(e)}), 400
+    return flask.jsonify({'resolution': resolution, 'count': len(data['timestamp']), 'data': serie_para_json(data)})
+
+
+@server.route('/api/janelas')
+@timings.funcao('rota.stable_windows_query')
+def stable_windows_query():
+    """Janelas aceitas pelo detector de estabilidade em JSON: ?start=&end= (ISO 8601, início da janela)"""
+    args = flask.request.args
+    try:
+        start = datetime.fromisoformat(args['start']) if args.get('start') else None
+        end = datetime.fromisoformat(args['end']) if args.get('end') else None
+    except ValueError as e:
+        return flask.jsonify({'error': str(e)}), 400
+    stability_storage.flush(timeout=1.0)
+    data = stability_storage.ler_intervalo(start, end)
+    return flask.jsonify({'count': len(data['timestamp']), 'data': serie_para_json(data)})
+
+
+@server.route('/metrics')
+def prometheus_metrics():
+    """Métricas do barramento Modbus, da grade, das etapas e do gateway no formato texto do Prometheus"""
+    text = acquisition.prometheus() + timings.prometheus(
+        'app_stage_duration_seconds', 'Time spent in each stage of the Dash process (callbacks, live batches).')
+    return flask.Response(text, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Requisições de callback do Dash, da chegada à resposta serializada: a diferença para a etapa
+# 'callback.<nome>' é o tempo do Dash (validação dos argumentos e JSON da resposta)
+@server.before_request
+def start_request_timer():
+    flask.g.request_start = time.perf_counter()
+
+
+@server.after_request
+def record_request_time(response):
+    start = flask.g.pop('request_start', None)
+    if start is not None and flask.request.path.endswith('/_dash-update-component'):
+        body = flask.request.get_json(silent=True) or {}
+        # 'output' é "id.prop" ou "..id.prop...id2.prop2.." com várias saídas: usa a primeira
+        output = str(body.get('output', '')).strip('.').split('...')[0]
+        timings.registrar(f'requisicao.{output}', time.perf_counter() - start)
+    return response
+
+
 @app.callback(
-    Output("download-excel", "data"),
+    [Output('export-job', 'data'),
+     Output('export-progress-interval', 'disabled'),
+     Output('export-progress', 'style'),
+     Output('export-link', 'style', allow_duplicate=True)],
     Input("export-btn", "n_clicks"),
+    [State('export-format', 'value'),
+     State('export-series', 'value'),
+     State('export-start', 'value'),
+     State('export-end', 'value'),
+     State('export-columns', 'value')],
     prevent_initial_call=True
 )
-def export_to_excel(n_clicks):
+@timings.funcao('callback.export_to_excel')
+def export_to_excel(n_clicks, export_format, series, start, end, columns):
+    """Dispara a exportação em segundo plano; o arquivo é montado fora da requisição"""
     if not n_clicks:
         raise PreventUpdate
 
+    source = storage
+    if series == 'aggregated':
+        # Cada coluna escolhida vira as suas estatísticas por janela; só as medições são agregadas
+        # (offsets de requisição e a marca 'stable' ficam de fora da série agregada)
+        source = aggregated_storage
+        columns = [f'{column}_{stat}' for column in (columns or []) if column in aggregator.colunas
+                   for stat in ESTATISTICAS]
+
+    try:
+        job = iniciar_exportacao(
+            source, export_format,
+            inicio=datetime.fromisoformat(start) if start else None,
+            fim=datetime.fromisoformat(end) if end else None,
+            colunas=columns or None,
+            etapas=timings
+        )
+    except Exception as e:
+        print(f"Erro na exportação: {str(e)}")
+        raise PreventUpdate
+
+    limpar_exportacoes()
+    return job.id, False, {'display': 'flex'}, {'display': 'none'}
+
+
+@app.callback(
+    [Output('export-progress', 'value'),
+     Output('export-progress', 'label'),
+     Output('export-progress', 'color'),
+     Output('export-progress-interval', 'disabled', allow_duplicate=True),
+     Output('export-link', 'href'),
+     Output('export-link', 'style')],
+    Input('export-progress-interval', 'n_intervals'),
+    State('export-job', 'data'),
+    prevent_initial_call=True
+)
+@timings.funcao('callback.update_export_progress')
+def update_export_progress(n_intervals, job_id):
+    job = obter_exportacao(job_id) if job_id else None
+    if job is None:
+        raise PreventUpdate
+
+    percent = round(100 * job.progresso)
+    if job.estado == 'erro':
+        return 100, f"Erro: {job.erro}", "danger", True, '', {'display': 'none'}
+    if job.estado == 'concluido':
+        return (100, f"{job.linhas} linhas exportadas", "success", True,
+                f"/exportacao/{job.id}", {'display': 'inline-block'})
+    return percent, f"{percent}%", "info", False, '', {'display': 'none'}
+
+
+# Perfil sob demanda: as próximas N invocações da função escolhida rodam sob cProfile
+@app.callback(
+    [Output('profile-job', 'data'),
+     Output('profile-interval', 'disabled'),
+     Output('profile-status', 'children', allow_duplicate=True)],
+    Input('profile-btn', 'n_clicks'),
+    [State('profile-target', 'value'),
+     State('profile-count', 'value')],
+    prevent_initial_call=True
+)
+def start_profile(n_clicks, target, count):
+    if not n_clicks or not target:
+        raise PreventUpdate
     try:
-        # Usar a variável global diretamente
-        global historical_data
-        df = historical_data.copy()
+        capture = profiler.armar(target, int(count or 1))
+    except ValueError as e:
+        return None, True, str(e)
+    return capture.id, False, f"Aguardando {capture.invocacoes} invocações de {target}…"
 
-        # Converter timestamp se necessário
-        if 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp']).dt.strftime('%Y-%m-%d %H:%M:%S')
 
-        output = io.BytesIO()
-        df.to_excel(output, index=False)
-        output.seek(0)
+@app.callback(
+    [Output('profile-status', 'children'),
+     Output('profile-interval', 'disabled', allow_duplicate=True),
+     Output('profile-links', 'style'),
+     Output('profile-link-prof', 'href'),
+     Output('profile-link-txt', 'href')],
+    Input('profile-interval', 'n_intervals'),
+    State('profile-job', 'data'),
+    prevent_initial_call=True
+)
+def update_profile_status(n_intervals, capture_id):
+    capture = profiler.obter(capture_id) if capture_id else None
+    if capture is None:
+        raise PreventUpdate
+    if capture.estado == 'armado':
+        return (f"{capture.nome}: {capture.feitas} de {capture.invocacoes} invocações", False,
+                {'display': 'none'}, '', '')
+    if capture.estado == 'concluido':
+        return (f"Perfil de {capture.nome} ({capture.feitas} invocações) pronto", True,
+                {'display': 'block'}, f"/perfil/{capture.id}.prof", f"/perfil/{capture.id}.txt")
+    return f"Perfil de {capture.nome}: {capture.estado}", True, {'display': 'none'}, '', ''
 
-        return dcc.send_bytes(output.getvalue(), filename="dados_piranometro.xlsx")
 
-    except Exception as e:
-        print(f"Erro na exportação: {str(e)}")
-        return no_update
+@server.route('/perfil/<capture_id>.<fmt>')
+def download_profile(capture_id, fmt):
+    """Perfil concluído: .prof (pstats/snakeviz) ou .txt (funções por tempo acumulado)"""
+    capture = profiler.obter(capture_id)
+    if capture is None or capture.estado != 'concluido' or fmt not in capture.caminhos:
+        flask.abort(404)
+    return flask.send_file(capture.caminhos[fmt], as_attachment=True, download_name=capture.nome_arquivo(fmt))
+
+
+@server.route('/exportacao/<job_id>')
+def download_export(job_id):
+    """Envia o arquivo exportado por streaming, sem passar pelo JSON do Dash"""
+    job = obter_exportacao(job_id)
+    if job is None or job.estado != 'concluido':
+        flask.abort(404)
+    return flask.send_file(job.caminho, as_attachment=True, download_name=job.nome_arquivo)
+
+
+# Tempo de importação do módulo (dependências, armazenamento e callbacks); o layout é
+# montado à parte, a cada carregamento da página
+startup_time = time.perf_counter() - _import_start
+
+
+def serving_process(debug):
+    """Se este é o processo que serve o app.
+
+    Com debug, o reloader do Werkzeug roda o módulo também num processo monitor,
+    que só observa os arquivos e reinicia o filho (marcado com WERKZEUG_RUN_MAIN).
+    """
+    return not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+
+
+def start():
+    """Abre os bancos, carrega o histórico e sobe o motor, as threads de gravação, o publicador e o gateway.
+
+    Chamado uma única vez, no processo que serve o app: importar o módulo (o
+    monitor do reloader, o benchmark) não cria arquivos, não abre portas nem
+    cria processos e threads.
+    """
+    global acquisition, storage, aggregated_storage, rollups, stability_storage
+    storage = ArmazenamentoSQLite(storage_path, sincronismo='NORMAL', lote=100, intervalo_flush=5.0)
+    aggregated_storage = ArmazenamentoSQLite(storage_path, sincronismo='NORMAL', tabela='agregados',
+                                             colunas=COLUNAS_AGREGADAS, lote=20, intervalo_flush=10.0)
+    aggregator.assinar(aggregated_storage.append)
+    rollups = IndiceAgregados(storage_path, bruto=storage)
+    stability_storage = ArmazenamentoSQLite(storage_path, sincronismo='NORMAL', tabela='janelas_estaveis',
+                                            colunas=COLUNAS_JANELAS, lote=1, intervalo_flush=5.0)
+    stability.assinar(stability_storage.append)
+
+    writers = (storage, aggregated_storage, rollups, stability_storage)
+    if acquisition_mode == 'replay':
+        # A reprodução começa com o histórico vazio, sem as amostras de uma reprodução anterior
+        for writer in writers:
+            writer.apagar()
+    else:
+        historical_data.estender(storage.ultimas(min(history_preload, history_capacity)))
+    publisher.total = historical_data.total
+    for writer in writers:
+        writer.iniciar()
+        atexit.register(writer.fechar)
+
+    if acquisition_process:
+        acquisition = MotorProcesso(acquisition_mode, **acquisition_options)
+        atexit.register(acquisition.encerrar)
+    else:
+        acquisition = criar_motor(acquisition_mode, **acquisition_options)
+    if capture_dir and acquisition_mode != 'replay':
+        acquisition.iniciar_captura(os.path.join(capture_dir, f"captura_{datetime.now():%Y%m%d_%H%M%S}.pircap"))
+        atexit.register(acquisition.parar_captura)
+
+    # O detector vem primeiro (depois do recomeço da reprodução): marca a amostra (coluna 'stable')
+    # antes dos demais assinantes. Cada assinante é medido (e pode ser perfilado) como 'assinante.<nome>'
+    if acquisition_mode == 'replay':
+        acquisition.assinar(timings.envolver('assinante.reproducao', restart_replay))
+    acquisition.assinar(timings.envolver('assinante.estabilidade', stability.adicionar))
+    acquisition.assinar(timings.envolver('assinante.historico', append_historical))
+    acquisition.assinar(timings.envolver('assinante.armazenamento', storage.append))
+    acquisition.assinar(timings.envolver('assinante.agregacao', aggregator.adicionar))
+    acquisition.assinar(timings.envolver('assinante.agregados', rollups.adicionar))
+    acquisition.assinar(timings.envolver('assinante.calibracao', calibration.adicionar))
+    acquisition.assinar(timings.envolver('assinante.publicador', publisher.adicionar))
+    publisher.iniciar()
+    atexit.register(publisher.parar)
+
+    if gateway_port:
+        acquisition.iniciar_gateway(gateway_port, unidades=gateway_units, idade_maxima=gateway_max_age)
+        atexit.register(acquisition.parar_gateway)
+
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    debug = True
+    if serving_process(debug):
+        start()
+        print(f"Aplicativo carregado em {startup_time:.2f} s")
+    app.run(debug=debug)
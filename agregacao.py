@@ -0,0 +1,129 @@
+import math
+import threading
+from datetime import datetime, timedelta
+
+ESTATISTICAS = ('mean', 'min', 'max', 'std', 'count')
+
+# Colunas de valores agregadas (as medições do histórico, sem o timestamp e os offsets de requisição)
+COLUNAS_VALORES = ['irradiance', 'voltage_out', 'angle_x', 'angle_y', 'cr1000_1', 'cr1000_2', 'cr1000_3']
+
+# Origem das janelas: o relógio local sem fuso, como os datetime64 do armazenamento. Assim a
+# agregação ao vivo e a reconstrução (indice_agregados.agregar_intervalos) usam as mesmas
+# fronteiras, também em fusos de meia hora e nas mudanças de horário de verão
+EPOCA = datetime(1970, 1, 1)
+MICROSSEGUNDO = timedelta(microseconds=1)
+
+
+def colunas_agregadas(colunas=COLUNAS_VALORES):
+    """Esquema da série agregada: timestamp + <coluna>_<estatística>"""
+    return ['timestamp'] + [f'{c}_{e}' for c in colunas for e in ESTATISTICAS]
+
+
+COLUNAS_AGREGADAS = colunas_agregadas()
+
+
+class EstatisticaIncremental:
+    """Média, variância (Welford), mínimo e máximo atualizados em O(1) por valor"""
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def adicionar(self, valor):
+        if valor is None or math.isnan(valor):
+            return
+        self.count += 1
+        delta = valor - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (valor - self.mean)
+        if valor < self.min:
+            self.min = valor
+        if valor > self.max:
+            self.max = valor
+
+    @property
+    def std(self):
+        # Desvio padrão amostral; zero com uma única leitura
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def resultado(self):
+        if not self.count:
+            return {'mean': math.nan, 'min': math.nan, 'max': math.nan, 'std': math.nan, 'count': 0}
+        return {'mean': self.mean, 'min': self.min, 'max': self.max, 'std': self.std, 'count': self.count}
+
+
+class AgregadorJanela:
+    """Agrega as sub-amostras de cada janela de exibição (ex.: 5 s).
+
+    As janelas são alinhadas a múltiplos de `periodo` no relógio local. Quando chega
+    uma amostra de uma janela nova, a anterior é fechada e publicada como uma
+    linha {timestamp (início da janela), <coluna>_mean, _min, _max, _std,
+    _count} para os assinantes; a última linha fechada e a janela em
+    andamento ficam disponíveis para a interface.
+    """
+
+    def __init__(self, periodo, colunas=COLUNAS_VALORES):
+        self.periodo = float(periodo)
+        self._periodo_us = round(self.periodo * 1_000_000)
+        self.colunas = list(colunas)
+        self._estatisticas = {c: EstatisticaIncremental() for c in self.colunas}
+        self._janela = None  # índice da janela atual (início // periodo)
+        self._ultima = None
+        self._assinantes = []
+        self._lock = threading.Lock()
+
+    def assinar(self, callback):
+        self._assinantes.append(callback)
+
+    def _indice(self, timestamp):
+        return ((timestamp - EPOCA) // MICROSSEGUNDO) // self._periodo_us
+
+    def adicionar(self, amostra):
+        fechada = None
+        with self._lock:
+            indice = self._indice(amostra['timestamp'])
+            if self._janela is not None and indice != self._janela:
+                fechada = self._fechar()
+            self._janela = indice
+            for coluna, estatistica in self._estatisticas.items():
+                estatistica.adicionar(amostra.get(coluna))
+
+        if fechada is not None:
+            for callback in list(self._assinantes):
+                try:
+                    callback(fechada)
+                except Exception as e:
+                    print(f"Erro no assinante da agregação: {str(e)}")
+
+    def _linha(self):
+        linha = {'timestamp': EPOCA + self._janela * self._periodo_us * MICROSSEGUNDO}
+        for coluna, estatistica in self._estatisticas.items():
+            for nome, valor in estatistica.resultado().items():
+                linha[f'{coluna}_{nome}'] = valor
+        return linha
+
+    def _fechar(self):
+        linha = self._linha()
+        for estatistica in self._estatisticas.values():
+            estatistica.reset()
+        self._ultima = linha
+        return linha
+
+    def ultima(self):
+        """Última janela completa (ou None)"""
+        with self._lock:
+            return self._ultima
+
+    def parcial(self):
+        """Estatísticas da janela em andamento (ou None se ainda não houve amostras)"""
+        with self._lock:
+            return self._linha() if self._janela is not None else None
+
@@ -0,0 +1,174 @@
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+AMOSTRAS_JITTER = 1000  # atrasos recentes guardados por série para os percentis
+
+
+class SerieTemporizacao:
+    """Atrasos (em segundos) de uma série em relação ao prazo da grade"""
+
+    def __init__(self):
+        self.contagem = 0
+        self.soma = 0.0
+        self.maximo = 0.0
+        self._recentes = deque(maxlen=AMOSTRAS_JITTER)
+
+    def registrar(self, atraso):
+        self.contagem += 1
+        self.soma += atraso
+        self.maximo = max(self.maximo, atraso)
+        self._recentes.append(atraso)
+
+    def percentil(self, p):
+        return float(np.percentile(self._recentes, p)) if self._recentes else float('nan')
+
+    @property
+    def media(self):
+        return self.soma / self.contagem if self.contagem else float('nan')
+
+    @property
+    def desvio(self):
+        return float(np.std(self._recentes)) if len(self._recentes) > 1 else float('nan')
+
+
+class EstatisticasTemporizacao:
+    """Qualidade da amostragem: jitter por série, prazos perdidos e ciclos que estouraram o período.
+
+    A série 'ciclo' é o atraso do início de cada tick; cada dispositivo tem a
+    sua série com o atraso do instante da requisição em relação ao tick.
+    """
+
+    def __init__(self, periodo):
+        self.periodo = periodo
+        self.ticks = 0
+        self.perdidos = 0   # prazos pulados porque o ciclo anterior passou deles
+        self.estouros = 0   # ciclos mais longos que o período
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, serie, atraso):
+        with self._lock:
+            if serie not in self._series:
+                self._series[serie] = SerieTemporizacao()
+            self._series[serie].registrar(atraso)
+
+    def resumo(self):
+        with self._lock:
+            return {
+                'periodo_s': self.periodo,
+                'ticks': self.ticks,
+                'perdidos': self.perdidos,
+                'estouros': self.estouros,
+                'series': {
+                    nome: {
+                        'contagem': s.contagem,
+                        'atraso_medio_ms': s.media * 1000,
+                        'jitter_ms': s.desvio * 1000,
+                        'p50_ms': s.percentil(50) * 1000,
+                        'p99_ms': s.percentil(99) * 1000,
+                        'maximo_ms': s.maximo * 1000,
+                    }
+                    for nome, s in self._series.items()
+                },
+            }
+
+    def prometheus(self):
+        """Métricas no formato texto de exposição do Prometheus (versão 0.0.4)"""
+        linhas = [
+            '# HELP sampling_ticks_total Sampling grid ticks executed.',
+            '# TYPE sampling_ticks_total counter',
+            f'sampling_ticks_total {self.ticks}',
+            '# HELP sampling_missed_deadlines_total Grid deadlines skipped because the previous cycle ran past them.',
+            '# TYPE sampling_missed_deadlines_total counter',
+            f'sampling_missed_deadlines_total {self.perdidos}',
+            '# HELP sampling_overruns_total Cycles longer than the sampling period.',
+            '# TYPE sampling_overruns_total counter',
+            f'sampling_overruns_total {self.estouros}',
+            '# HELP sampling_delay_seconds Delay after the grid deadline (cycle start or device request).',
+            '# TYPE sampling_delay_seconds summary',
+        ]
+        with self._lock:
+            for nome, s in sorted(self._series.items()):
+                for q in (0.5, 0.99):
+                    linhas.append(f'sampling_delay_seconds{{series="{nome}",quantile="{q:g}"}} '
+                                  f'{s.percentil(q * 100)!r}')
+                linhas.append(f'sampling_delay_seconds_sum{{series="{nome}"}} {s.soma!r}')
+                linhas.append(f'sampling_delay_seconds_count{{series="{nome}"}} {s.contagem}')
+        return '\n'.join(linhas) + '\n'
+
+
+class GradeAmostragem:
+    """Prazos de amostragem numa grade fixa do relógio monotônico.
+
+    O k-ésimo prazo é `origem + k * periodo`, calculado a partir da origem (e
+    não somando o período ao fim da leitura anterior), então o tempo de
+    leitura não se acumula como deriva. Um ciclo que passa do prazo seguinte
+    não gera rajada para alcançar a grade: os prazos já vencidos são contados
+    como perdidos e pulados. Com `periodo` 0 a leitura é contínua, sem grade.
+
+    Os instantes monotônicos viram datetime por uma única âncora no relógio de
+    parede, tomada na criação, para que os timestamps fiquem na mesma grade
+    mesmo que o relógio do sistema seja ajustado durante a aquisição.
+    `parede` fixa a âncora (o time.time() correspondente à origem), como na
+    reprodução de uma captura.
+    """
+
+    def __init__(self, periodo, origem=None, parede=None):
+        self.periodo = max(0.0, float(periodo))
+        self.origem = time.monotonic() if origem is None else origem
+        self._parede = time.time() - (time.monotonic() - self.origem) if parede is None else parede
+        self.indice = 0
+        self.inicio_ciclo = None
+        self.estatisticas = EstatisticasTemporizacao(self.periodo)
+
+    @property
+    def prazo(self):
+        if not self.periodo:
+            return time.monotonic()
+        return self.origem + self.indice * self.periodo
+
+    def para_epoch(self, instante):
+        """Instante monotônico em segundos do relógio de parede (como time.time())"""
+        return self._parede + (instante - self.origem)
+
+    def para_datetime(self, instante):
+        return datetime.fromtimestamp(self.para_epoch(instante))
+
+    def aguardar(self, parar=None):
+        """Espera o próximo prazo; retorna o prazo (monotônico) ou None se `parar` foi sinalizado"""
+        prazo = self.prazo
+        espera = prazo - time.monotonic()
+        if espera > 0:
+            if parar is not None:
+                if parar.wait(espera):
+                    return None
+            else:
+                time.sleep(espera)
+        elif parar is not None and parar.is_set():
+            return None
+        return self.iniciar_ciclo(prazo)
+
+    def iniciar_ciclo(self, prazo):
+        """Marca o início do ciclo do prazo (para quem espera por conta própria, como o event loop)"""
+        self.inicio_ciclo = time.monotonic()
+        self.estatisticas.ticks += 1
+        self.estatisticas.registrar('ciclo', self.inicio_ciclo - prazo)
+        return prazo
+
+    def concluir(self):
+        """Avança para o próximo prazo ao fim do ciclo, pulando os que já venceram"""
+        if not self.periodo:
+            self.indice += 1
+            return
+        fim = time.monotonic()
+        if self.inicio_ciclo is not None and fim - self.inicio_ciclo > self.periodo:
+            self.estatisticas.estouros += 1
+        # O prazo mais recente já vencido ainda é atendido (com atraso); os anteriores são perdidos
+        seguinte = max(self.indice + 1, math.floor((fim - self.origem) / self.periodo))
+        self.estatisticas.perdidos += seguinte - self.indice - 1
+        self.indice = seguinte
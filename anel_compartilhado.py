@@ -0,0 +1,158 @@
+"""Anel de amostras em memória compartilhada (multiprocessing.shared_memory).
+
+Um único processo escritor (o de aquisição) grava as amostras decodificadas
+e qualquer processo leitor mapeia o mesmo bloco e as lê direto da memória,
+sem pipes nem serialização. Layout (little-endian):
+
+    cabeçalho (64 bytes): mágica b'PIRANEL1', versão (uint32), capacidade (uint32),
+                          colunas (uint32), reservado, escritas (uint64)
+    registro × capacidade: sequência (uint64), timestamp (int64, µs desde a época),
+                           uma coluna float64 por campo de COLUNAS_HISTORICO
+
+A k-ésima escrita (k a partir de 1) vai para o registro (k - 1) % capacidade.
+O escritor zera a sequência do registro, grava os campos e só então grava a
+sequência k e o total de escritas; o leitor confere a sequência antes e
+depois de copiar os campos e descarta o registro que mudou no meio da
+leitura (seqlock), então nunca entrega uma amostra pela metade.
+"""
+import sys
+
+import numpy as np
+from multiprocessing import shared_memory
+
+from buffer_circular import COLUNAS_HISTORICO
+
+MAGICA = b'PIRANEL1'
+VERSAO = 1
+
+CABECALHO = np.dtype([
+    ('magica', 'S8'),
+    ('versao', '<u4'),
+    ('capacidade', '<u4'),
+    ('colunas', '<u4'),
+    ('reservado', 'V36'),
+    ('escritas', '<u8'),
+])
+
+NAT = np.iinfo(np.int64).min  # NaT do datetime64
+
+
+def tipo_registro(colunas=COLUNAS_HISTORICO, coluna_tempo='timestamp'):
+    """dtype estruturado de um registro do anel"""
+    campos = [('sequencia', '<u8'), (coluna_tempo, '<i8')]
+    campos += [(coluna, '<f8') for coluna in colunas if coluna != coluna_tempo]
+    return np.dtype(campos)
+
+
+class AnelAmostras:
+    """Anel de amostras de capacidade fixa num bloco de memória compartilhada.
+
+    `criar` aloca o bloco (o dono o libera com `liberar`); `abrir` mapeia um
+    bloco existente pelo nome.
+    """
+
+    def __init__(self, memoria, colunas=COLUNAS_HISTORICO, coluna_tempo='timestamp', dono=False):
+        self.memoria = memoria
+        self.nome = memoria.name
+        self.colunas = list(colunas)
+        self.coluna_tempo = coluna_tempo
+        self.tipo = tipo_registro(self.colunas, coluna_tempo)
+        self._dono = dono
+        self._cabecalho = np.ndarray((), dtype=CABECALHO, buffer=memoria.buf)
+        if self._cabecalho['magica'] != MAGICA or self._cabecalho['versao'] != VERSAO \
+                or self._cabecalho['colunas'] != len(self.tipo.names) - 1:
+            raise ValueError(f"Memória compartilhada {self.nome} não é um anel de amostras compatível")
+        self.capacidade = int(self._cabecalho['capacidade'])
+        self._registros = np.ndarray((self.capacidade,), dtype=self.tipo, buffer=memoria.buf,
+                                     offset=CABECALHO.itemsize)
+        self._sequencias = self._registros['sequencia']
+        self._valores = [c for c in self.tipo.names if c not in ('sequencia', coluna_tempo)]
+        self._escritas = int(self._cabecalho['escritas'])
+
+    @classmethod
+    def criar(cls, capacidade, colunas=COLUNAS_HISTORICO, coluna_tempo='timestamp'):
+        tipo = tipo_registro(colunas, coluna_tempo)
+        memoria = shared_memory.SharedMemory(create=True, size=CABECALHO.itemsize + capacidade * tipo.itemsize)
+        cabecalho = np.ndarray((), dtype=CABECALHO, buffer=memoria.buf)
+        cabecalho['magica'] = MAGICA
+        cabecalho['versao'] = VERSAO
+        cabecalho['capacidade'] = capacidade
+        cabecalho['colunas'] = len(tipo.names) - 1
+        cabecalho['escritas'] = 0
+        del cabecalho
+        return cls(memoria, colunas, coluna_tempo, dono=True)
+
+    @classmethod
+    def abrir(cls, nome, colunas=COLUNAS_HISTORICO, coluna_tempo='timestamp', rastrear=False):
+        memoria = shared_memory.SharedMemory(name=nome)
+        if not rastrear and sys.platform != 'win32':
+            # Outro processo que só mapeia o bloco não deve apagá-lo ao sair (só o dono,
+            # em `liberar`); rastrear=True quando o dono está no mesmo processo
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(memoria._name, 'shared_memory')
+        return cls(memoria, colunas, coluna_tempo)
+
+    @property
+    def escritas(self):
+        """Total de amostras gravadas desde a criação do anel"""
+        return int(self._cabecalho['escritas'])
+
+    # --- Escritor ---
+
+    def gravar(self, amostra):
+        """Grava uma amostra (dict coluna -> valor); colunas ausentes viram NaN/NaT.
+
+        Só pode haver um escritor; a assinatura serve de assinante do motor de aquisição.
+        """
+        k = self._escritas + 1
+        i = (k - 1) % self.capacidade
+        tempo = amostra.get(self.coluna_tempo)
+        tempo = NAT if tempo is None else np.datetime64(tempo, 'us').astype(np.int64)
+        valores = tuple(np.nan if amostra.get(c) is None else amostra[c] for c in self._valores)
+        self._sequencias[i] = 0
+        self._registros[i] = (0, tempo) + valores
+        self._sequencias[i] = k
+        self._cabecalho['escritas'] = k
+        self._escritas = k
+
+    # --- Leitores ---
+
+    def ler(self, desde):
+        """Amostras gravadas depois da escrita `desde`: (lista de dicts, escritas, perdidas).
+
+        `perdidas` conta as amostras que o escritor sobrescreveu antes de
+        serem lidas; passe o `escritas` devolvido como `desde` da próxima leitura.
+        """
+        escritas = self.escritas
+        perdidas = max(0, escritas - desde - self.capacidade)
+        inicio = desde + perdidas
+        amostras = []
+        while inicio < escritas:
+            # Trecho contíguo do anel: uma view da memória compartilhada
+            posicao = inicio % self.capacidade
+            n = min(escritas - inicio, self.capacidade - posicao)
+            trecho = self._registros[posicao:posicao + n]
+            esperadas = np.arange(inicio + 1, inicio + n + 1, dtype=np.uint64)
+            antes = self._sequencias[posicao:posicao + n] == esperadas
+            linhas = trecho.tolist()
+            validas = antes & (self._sequencias[posicao:posicao + n] == esperadas)
+            for linha, valida in zip(linhas, validas.tolist()):
+                if not valida:
+                    perdidas += 1
+                    continue
+                tempo = linha[1]
+                amostra = {self.coluna_tempo: None if tempo == NAT else np.datetime64(tempo, 'us').item()}
+                amostra.update(zip(self._valores, linha[2:]))
+                amostras.append(amostra)
+            inicio += n
+        return amostras, escritas, perdidas
+
+    def fechar(self):
+        self._cabecalho = self._registros = self._sequencias = None
+        self.memoria.close()
+
+    def liberar(self):
+        """Fecha e apaga o bloco (só o processo que o criou)"""
+        self.fechar()
+        if self._dono:
+            self.memoria.unlink()
@@ -0,0 +1,358 @@
+import threading
+import time
+
+from pymodbus.client.serial import ModbusSerialClient
+
+from amostragem import GradeAmostragem
+from captura import EscritorCaptura
+from conexao import ConexaoDispositivo
+from etapas import TemporizadorEtapas
+from gateway_modbus import CacheRegistros, ServidorGateway
+from mapa_registros import MAPA_CR1000, MAPA_PIRANOMETRO, planejar_leituras
+from metricas import MetricasBarramento
+
+
+class MotorAquisicao:
+    """Thread dedicada à leitura dos instrumentos Modbus.
+
+    É a única dona dos clientes do piranômetro e do CR1000: faz a leitura no
+    seu próprio ritmo e publica a última amostra num snapshot protegido por
+    lock. Os callbacks do Dash apenas leem esse snapshot, de modo que a
+    latência da interface não depende mais da latência do barramento.
+
+    Os ciclos seguem uma grade fixa de prazos (ver amostragem.GradeAmostragem):
+    o timestamp da amostra é o prazo do ciclo e cada dispositivo guarda em
+    '<dispositivo>_offset' quantos segundos depois dele a sua requisição saiu.
+    """
+
+    def __init__(self, intervalo=5, mapa_piranometro=MAPA_PIRANOMETRO, mapa_cr1000=MAPA_CR1000, max_gap=None,
+                 metricas=None, retries=1):
+        self.intervalo = intervalo  # período da grade de amostragem, em segundos (0 = contínuo)
+        self.grade = GradeAmostragem(intervalo)  # refeita a cada início da thread
+        self.portas_ativas = [1]
+        # Contadores de saúde do barramento (latência, timeouts, exceções, CRC, bytes) por dispositivo
+        self.metricas = metricas if metricas is not None else MetricasBarramento()
+        # Tempo de cada etapa do ciclo (leitura de cada dispositivo, decodificação, assinantes)
+        self.etapas = TemporizadorEtapas()
+        # Repetições do pymodbus por requisição; falhas seguidas ficam a cargo do disjuntor
+        self.retries = retries
+
+        # Mapas de registros e planos de leitura (refeitos ao conhecer o baudrate)
+        self.mapa_piranometro = mapa_piranometro
+        self.mapa_cr1000 = mapa_cr1000
+        self.max_gap = max_gap  # maior buraco (em registros) aceito dentro de uma leitura
+        self._mapas = {'piranometro': mapa_piranometro, 'cr1000': mapa_cr1000}
+        self._planos = {'piranometro': planejar_leituras(mapa_piranometro, 19200, max_gap),
+                        'cr1000': planejar_leituras(mapa_cr1000, 9600, max_gap)}
+
+        # Dispositivo -> ConexaoDispositivo (cliente persistente da porta, disjuntor e timeout adaptativo)
+        self._conexoes = {}
+        self._nomes_por_porta = {}  # porta -> {slave: dispositivo}, para atribuir os bytes no fio
+        self._captura = None  # EscritorCaptura ativo (registros brutos de cada leitura)
+        self._cache = None    # CacheRegistros do gateway Modbus TCP (últimos registros de cada leitura)
+        self.gateway = None   # ServidorGateway iniciado por iniciar_gateway
+
+        self._lock_bus = threading.Lock()       # protege os clientes durante a leitura
+        self._lock_snapshot = threading.Lock()  # protege a última amostra publicada
+        self._amostra = None
+        self._sequencia = 0
+        self._assinantes = []
+
+        self._parar = threading.Event()
+        self._thread = None
+
+    # --- Gerenciamento dos clientes ---
+
+    def _criar_cliente(self, nome, port, baudrate, parity, timeout):
+        return ModbusSerialClient(
+            port=port,
+            baudrate=baudrate,
+            parity=parity,
+            stopbits=1,
+            bytesize=8,
+            timeout=timeout,
+            retries=self.retries,
+            trace_packet=self.metricas.rastreador(nome, self._nomes_por_porta.setdefault(port, {}))
+        )
+
+    def _cliente_da_porta(self, nome, port, baudrate, parity, timeout):
+        """Um único cliente por porta serial: dispositivos no mesmo barramento compartilham o cliente"""
+        for conexao in self._conexoes.values():
+            if conexao.nome != nome and conexao.port == port:
+                if (conexao.baudrate, conexao.parity) != (baudrate, parity):
+                    raise Exception(f"Porta {port} já aberta com outra configuração")
+                return conexao.client
+        return self._criar_cliente(nome, port, baudrate, parity, timeout)
+
+    def conectar_piranometro(self, port, baudrate, parity, slave, timeout=2.0):
+        """Abre a porta do piranômetro; levanta Exception com a mensagem para a interface"""
+        client = self._cliente_da_porta('piranometro', port, baudrate, parity, timeout)
+        if not client.connect():
+            raise Exception("Falha na conexão física com piranômetro")
+        self.definir_piranometro(client, slave, baudrate, port, parity, timeout)
+
+    def conectar_cr1000(self, port, baudrate, parity, slave, timeout=3.0):
+        """Abre a porta do CR1000 e testa a comunicação lendo os registros"""
+        client = self._cliente_da_porta('cr1000', port, baudrate, parity, timeout)
+        if not client.connect():
+            raise Exception("Falha na conexão física com CR1000")
+
+        with self.metricas.medir('cr1000') as medicao:
+            response = medicao.resposta(client.read_holding_registers(address=0, count=6, slave=slave))
+        if response.isError():
+            if not self._cliente_em_uso(client, exceto='cr1000'):
+                client.close()
+            raise Exception("Falha na comunicação com CR1000 - Resposta inválida")
+        self.definir_cr1000(client, slave, baudrate, port, parity, timeout)
+
+    def definir_piranometro(self, client, slave, baudrate=19200, port=None, parity=None, timeout=2.0):
+        self._definir(ConexaoDispositivo('piranometro', client, port, baudrate, parity, slave, timeout,
+                                         metricas=self.metricas))
+
+    def definir_cr1000(self, client, slave, baudrate=9600, port=None, parity=None, timeout=3.0):
+        self._definir(ConexaoDispositivo('cr1000', client, port, baudrate, parity, slave, timeout,
+                                         metricas=self.metricas))
+
+    def _definir(self, conexao):
+        with self._lock_bus:
+            anterior = self._conexoes.get(conexao.nome)
+            self._conexoes[conexao.nome] = conexao
+            conexao.captura = self._captura
+            conexao.cache = self._cache
+            conexao.etapas = self.etapas
+            self._nomes_por_porta.setdefault(conexao.port, {})[conexao.slave] = conexao.nome
+            if anterior and not self._cliente_em_uso(anterior.client):
+                anterior.client.close()
+            self._planos[conexao.nome] = planejar_leituras(self._mapas[conexao.nome], conexao.baudrate,
+                                                           self.max_gap)
+
+    def _cliente_em_uso(self, client, exceto=None):
+        return any(c.client is client for nome, c in self._conexoes.items() if nome != exceto)
+
+    def _fechar_todos(self):
+        for client in {id(c.client): c.client for c in self._conexoes.values()}.values():
+            client.close()
+        self._conexoes.clear()
+        self._nomes_por_porta.clear()
+
+    def desconectar_todos(self):
+        with self._lock_bus:
+            self._fechar_todos()
+
+    # --- Captura dos registros brutos ---
+
+    def iniciar_captura(self, caminho):
+        """Passa a gravar os registros brutos de cada leitura em `caminho` (ver captura.py)"""
+        captura = EscritorCaptura(caminho, list(self._mapas), mapas=self._mapas)
+        anterior = self._trocar_captura(captura)
+        if anterior is not None:
+            anterior.fechar()
+        return captura
+
+    def parar_captura(self):
+        captura = self._trocar_captura(None)
+        if captura is not None:
+            captura.fechar()
+
+    def _trocar_captura(self, captura):
+        with self._lock_bus:
+            anterior, self._captura = self._captura, captura
+            for conexao in self._conexoes.values():
+                conexao.captura = captura
+        return anterior
+
+    # --- Cache de registros para o gateway Modbus TCP ---
+
+    def usar_cache(self, cache):
+        """Passa a copiar os registros de cada leitura para `cache` (ver gateway_modbus.py); None desliga"""
+        with self._lock_bus:
+            self._cache = cache
+            for conexao in self._conexoes.values():
+                conexao.cache = cache
+
+    def iniciar_gateway(self, porta, unidades=None, host='127.0.0.1', idade_maxima=10.0):
+        """Serve os registros de cada leitura num gateway Modbus TCP local (ver gateway_modbus.py)"""
+        self.parar_gateway()
+        self.gateway = ServidorGateway(CacheRegistros(), unidades=unidades, host=host, porta=porta,
+                                       idade_maxima=idade_maxima)
+        self.usar_cache(self.gateway.cache)
+        self.gateway.iniciar()
+
+    def parar_gateway(self):
+        if self.gateway is not None:
+            self.usar_cache(None)
+            self.gateway.parar()
+            self.gateway = None
+
+    @property
+    def piranometro_conectado(self):
+        return 'piranometro' in self._conexoes
+
+    @property
+    def cr1000_conectado(self):
+        return 'cr1000' in self._conexoes
+
+    def estatisticas_amostragem(self):
+        """Jitter por série, prazos perdidos e estouros da grade de amostragem atual"""
+        return self.grade.estatisticas.resumo()
+
+    def resumo_barramento(self):
+        """Contadores de saúde do barramento por dispositivo (ver MetricasBarramento.resumo)"""
+        return self.metricas.resumo()
+
+    def resumo_etapas(self):
+        """Tempo de cada etapa do ciclo de aquisição (ver TemporizadorEtapas.resumo)"""
+        return self.etapas.resumo()
+
+    def prometheus(self):
+        """Métricas do barramento, da grade, das etapas do ciclo e do gateway no formato texto do Prometheus"""
+        texto = self.metricas.prometheus() + self.grade.estatisticas.prometheus()
+        texto += self.etapas.prometheus('acquisition_stage_duration_seconds',
+                                        'Time spent in each acquisition stage (Modbus reads, decoding, subscribers).')
+        if self.gateway is not None:
+            texto += self.gateway.prometheus()
+        return texto
+
+    def estado_conexoes(self):
+        """Disjuntor, falhas seguidas e timeout em uso de cada dispositivo conectado"""
+        return {nome: conexao.estado() for nome, conexao in list(self._conexoes.items())}
+
+    # --- Publicação ---
+
+    def assinar(self, callback):
+        """Registra uma função chamada (na thread de aquisição) a cada nova amostra"""
+        self._assinantes.append(callback)
+
+    def ultima_amostra(self):
+        """Retorna (sequência, amostra) da última leitura publicada"""
+        with self._lock_snapshot:
+            return self._sequencia, self._amostra
+
+    # --- Ciclo de vida da thread ---
+
+    def iniciar(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, name="aquisicao-modbus", daemon=True)
+        self._thread.start()
+
+    def parar(self, timeout=None):
+        self._parar.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self):
+        self.grade = GradeAmostragem(self.intervalo)
+        while True:
+            # Espera o prazo seguinte da grade (retorna None imediatamente ao parar)
+            prazo = self.grade.aguardar(self._parar)
+            if prazo is None:
+                break
+            try:
+                self.ler_ciclo(prazo)
+            except Exception as e:
+                print(f"Erro no ciclo de aquisição: {str(e)}")
+            self.grade.concluir()
+
+    # --- Leitura ---
+
+    def ler_ciclo(self, prazo=None):
+        """Lê todos os dispositivos conectados e publica uma nova amostra.
+
+        `prazo` é o instante monotônico do tick da grade; sem ele (leitura
+        avulsa) vale o instante da chamada.
+        """
+        prazo = time.monotonic() if prazo is None else prazo
+        with self._lock_bus:
+            if not self._conexoes:
+                return None
+            if self._captura is not None:
+                self._captura.tick = prazo
+            with self.etapas.medir('leitura_piranometro'):
+                piranometer_data, piranometer_time = self._ler_piranometro()
+            with self.etapas.medir('leitura_cr1000'):
+                cr1000_values, cr1000_time = self._ler_cr1000()
+
+        amostra = self._montar_amostra(prazo, piranometer_data, piranometer_time, cr1000_values, cr1000_time)
+        self.publicar(amostra)
+        return amostra
+
+    def _montar_amostra(self, prazo, piranometer_data, piranometer_time, cr1000_values, cr1000_time):
+        return {
+            'timestamp': self.grade.para_datetime(prazo),
+            **piranometer_data,
+            'cr1000_1': cr1000_values[0],
+            'cr1000_2': cr1000_values[1],
+            'cr1000_3': cr1000_values[2],
+            'piranometer_offset': self._offset('piranometro', prazo, piranometer_time),
+            'cr1000_offset': self._offset('cr1000', prazo, cr1000_time)
+        }
+
+    def _offset(self, nome, prazo, instante):
+        """Segundos entre o tick e a requisição do dispositivo (NaN se ele não foi consultado)"""
+        if instante is None:
+            return float('nan')
+        self.grade.estatisticas.registrar(nome, instante - prazo)
+        return instante - prazo
+
+    def publicar(self, amostra):
+        with self._lock_snapshot:
+            self._sequencia += 1
+            self._amostra = amostra
+
+        with self.etapas.medir('assinantes'):
+            for callback in list(self._assinantes):
+                try:
+                    callback(amostra)
+                except Exception as e:
+                    print(f"Erro no assinante de aquisição: {str(e)}")
+
+    def _conexao_liberada(self, nome):
+        """Conexão do dispositivo, ou None se não está conectado ou o disjuntor está aberto"""
+        conexao = self._conexoes.get(nome)
+        if conexao is None or not conexao.permitir():
+            return None
+        return conexao
+
+    def _ler_piranometro(self):
+        """Retorna (valores, instante monotônico da requisição)"""
+        conexao = self._conexao_liberada('piranometro')
+        if conexao is None:
+            return {}, None
+        try:
+            conexao.garantir_conexao()
+            enviado = time.monotonic()
+            valores = conexao.ler_plano(self._planos['piranometro'])
+            if valores is None:
+                print("Erro na resposta do piranômetro!")
+                return {}, enviado
+
+            return valores, enviado
+        except Exception as e:
+            print(f"Erro no piranômetro: {str(e)}")
+            return {}, None
+
+    def _ler_cr1000(self):
+        """Retorna (3 canais, instante monotônico da requisição)"""
+        conexao = self._conexao_liberada('cr1000')
+        if conexao is None:
+            return [float('nan')] * 3, None
+        try:
+            conexao.garantir_conexao()
+            enviado = time.monotonic()
+            valores = conexao.ler_plano(self._planos['cr1000'])
+            if valores is None:
+                print("Erro na resposta do CR1000!")
+                return [float('nan')] * 3, enviado
+
+            return self._canais_cr1000(valores), enviado
+        except Exception as e:
+            print(f"Erro no CR1000: {str(e)}")
+            return [float('nan')] * 3, None
+
+    def _canais_cr1000(self, valores):
+        """Retorna sempre 3 valores (NaN para portas inativas)"""
+        return [valores.get(f'cr1000_{i}', float('nan')) if i in self.portas_ativas else float('nan')
+                for i in range(1, 4)]
@@ -0,0 +1,219 @@
+import asyncio
+import threading
+import time
+
+from pymodbus.client import AsyncModbusSerialClient
+
+from amostragem import GradeAmostragem
+from aquisicao import MotorAquisicao
+from conexao import ConexaoDispositivo
+from mapa_registros import decodificar_bloco
+
+
+class MotorAquisicaoAsync(MotorAquisicao):
+    """Modo asyncio do motor de aquisição.
+
+    O piranômetro e o CR1000 ficam em portas seriais separadas, então as duas
+    leituras são disparadas ao mesmo tempo com asyncio.gather: o ciclo dura o
+    tempo do dispositivo mais lento, e não a soma dos dois. Cada requisição
+    recebe o seu próprio instante, de modo que um instrumento lento ou em
+    timeout não atrasa a marcação de tempo do outro.
+
+    Todo o acesso aos clientes acontece no event loop da thread de aquisição;
+    as chamadas vindas dos callbacks do Dash são encaminhadas para esse loop.
+    """
+
+    def __init__(self, intervalo=5, **kwargs):
+        super().__init__(intervalo, **kwargs)
+        self._loop = None
+        self._loop_pronto = threading.Event()
+        self._evento_parar = None
+        self._reconexoes = {}  # id do cliente -> tarefa de reconexão em andamento
+
+    # --- Gerenciamento dos clientes (executado no event loop) ---
+
+    def _executar_no_loop(self, coro, timeout=None):
+        self.iniciar()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def conectar_piranometro(self, port, baudrate, parity, slave, timeout=2.0):
+        self._executar_no_loop(self._conectar_piranometro(port, baudrate, parity, slave, timeout))
+
+    def conectar_cr1000(self, port, baudrate, parity, slave, timeout=3.0):
+        self._executar_no_loop(self._conectar_cr1000(port, baudrate, parity, slave, timeout))
+
+    def desconectar_todos(self):
+        if self._loop and self._thread and self._thread.is_alive():
+            self._executar_no_loop(self._desconectar_todos())
+
+    def _criar_cliente(self, nome, port, baudrate, parity, timeout):
+        # O cliente assíncrono precisa ser criado dentro do event loop em execução.
+        # reconnect_delay=0 desliga a reconexão automática do pymodbus: quem
+        # reconecta (com espera exponencial) é o disjuntor do dispositivo
+        return AsyncModbusSerialClient(
+            port=port,
+            baudrate=baudrate,
+            parity=parity,
+            stopbits=1,
+            bytesize=8,
+            timeout=timeout,
+            retries=self.retries,
+            reconnect_delay=0,
+            trace_packet=self.metricas.rastreador(nome, self._nomes_por_porta.setdefault(port, {}))
+        )
+
+    async def _conectar_piranometro(self, port, baudrate, parity, slave, timeout):
+        client = self._cliente_da_porta('piranometro', port, baudrate, parity, timeout)
+        if not client.connected and not await client.connect():
+            raise Exception("Falha na conexão física com piranômetro")
+        self._definir(ConexaoDispositivo('piranometro', client, port, baudrate, parity, slave, timeout,
+                                         metricas=self.metricas))
+
+    async def _conectar_cr1000(self, port, baudrate, parity, slave, timeout):
+        client = self._cliente_da_porta('cr1000', port, baudrate, parity, timeout)
+        if not client.connected and not await client.connect():
+            raise Exception("Falha na conexão física com CR1000")
+
+        with self.metricas.medir('cr1000') as medicao:
+            response = medicao.resposta(await client.read_holding_registers(address=0, count=6, slave=slave))
+        if response.isError():
+            if not self._cliente_em_uso(client, exceto='cr1000'):
+                client.close()
+            raise Exception("Falha na comunicação com CR1000 - Resposta inválida")
+        self._definir(ConexaoDispositivo('cr1000', client, port, baudrate, parity, slave, timeout,
+                                         metricas=self.metricas))
+
+    async def _desconectar_todos(self):
+        self._fechar_todos()
+
+    # --- Ciclo de vida ---
+
+    def iniciar(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._loop_pronto.clear()
+        self._thread = threading.Thread(target=asyncio.run, args=(self._loop_async(),),
+                                        name="aquisicao-modbus-async", daemon=True)
+        self._thread.start()
+        self._loop_pronto.wait()
+
+    def parar(self, timeout=None):
+        if self._loop and self._evento_parar and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._evento_parar.set)
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    async def _loop_async(self):
+        self._loop = asyncio.get_running_loop()
+        self._evento_parar = asyncio.Event()
+        self._loop_pronto.set()
+
+        self.grade = GradeAmostragem(self.intervalo)
+        try:
+            while not self._evento_parar.is_set():
+                # Espera o prazo seguinte da grade (retorna imediatamente ao parar)
+                prazo = self.grade.prazo
+                restante = prazo - time.monotonic()
+                try:
+                    await asyncio.wait_for(self._evento_parar.wait(), timeout=max(0.0, restante))
+                    break
+                except asyncio.TimeoutError:
+                    pass  # sem espera, ainda cede o event loop às chamadas vindas dos callbacks
+                self.grade.iniciar_ciclo(prazo)
+                try:
+                    await self.ler_ciclo_async(prazo)
+                except Exception as e:
+                    print(f"Erro no ciclo de aquisição: {str(e)}")
+                self.grade.concluir()
+        finally:
+            await self._desconectar_todos()
+
+    # --- Leitura ---
+
+    async def ler_ciclo_async(self, prazo=None):
+        """Lê os dois dispositivos em paralelo e publica uma nova amostra"""
+        prazo = time.monotonic() if prazo is None else prazo
+        if not self._conexoes:
+            return None
+        if self._captura is not None:
+            self._captura.tick = prazo
+
+        with self.etapas.medir('leitura_paralela'):
+            (piranometer_data, piranometer_time), (cr1000_values, cr1000_time) = await asyncio.gather(
+                self._ler_piranometro_async(), self._ler_cr1000_async()
+            )
+
+        amostra = self._montar_amostra(prazo, piranometer_data, piranometer_time, cr1000_values, cr1000_time)
+        self.publicar(amostra)
+        return amostra
+
+    async def _garantir_conexao_async(self, conexao):
+        client = conexao.client
+        if client.connected:
+            return
+        # Dispositivos na mesma porta compartilham o cliente e leem em paralelo:
+        # uma única tentativa de reconexão por cliente, aguardada por todos
+        tarefa = self._reconexoes.get(id(client))
+        if tarefa is None:
+            tarefa = asyncio.ensure_future(client.connect())
+            self._reconexoes[id(client)] = tarefa
+            tarefa.add_done_callback(lambda _: self._reconexoes.pop(id(client), None))
+        if not await asyncio.shield(tarefa):
+            conexao.falha()
+            raise Exception("porta serial indisponível")
+        conexao.reconectou()
+
+    async def _ler_plano_async(self, conexao, plano):
+        conexao.aplicar_timeout()
+        valores = {}
+        for bloco in plano:
+            medicao = self.metricas.medir(conexao.nome)
+            enviado = time.monotonic()
+            try:
+                with medicao:
+                    response = medicao.resposta(await conexao.client.read_holding_registers(
+                        address=bloco.endereco, count=bloco.count, slave=conexao.slave
+                    ))
+            finally:
+                conexao.apos_requisicao(medicao)
+            if response.isError():
+                return None
+            conexao.capturar(enviado, bloco, response.registers)
+            with self.etapas.medir('decodificacao'):
+                valores.update(decodificar_bloco(bloco, response.registers))
+        return valores
+
+    async def _ler_piranometro_async(self):
+        conexao = self._conexao_liberada('piranometro')
+        if conexao is None:
+            return {}, None
+        try:
+            await self._garantir_conexao_async(conexao)
+            enviado = time.monotonic()
+            valores = await self._ler_plano_async(conexao, self._planos['piranometro'])
+            if valores is None:
+                print("Erro na resposta do piranômetro!")
+                return {}, enviado
+
+            return valores, enviado
+        except Exception as e:
+            print(f"Erro no piranômetro: {str(e)}")
+            return {}, None
+
+    async def _ler_cr1000_async(self):
+        conexao = self._conexao_liberada('cr1000')
+        if conexao is None:
+            return [float('nan')] * 3, None
+        try:
+            await self._garantir_conexao_async(conexao)
+            enviado = time.monotonic()
+            valores = await self._ler_plano_async(conexao, self._planos['cr1000'])
+            if valores is None:
+                print("Erro na resposta do CR1000!")
+                return [float('nan')] * 3, enviado
+
+            return self._canais_cr1000(valores), enviado
+        except Exception as e:
+            print(f"Erro no CR1000: {str(e)}")
+            return [float('nan')] * 3, None
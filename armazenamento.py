@@ -0,0 +1,411 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from buffer_circular import COLUNAS_HISTORICO
+
+
+def _para_microssegundos(timestamp):
+    return int(np.datetime64(timestamp, 'us').astype(np.int64))
+
+
+def _linha(amostra, colunas):
+    """Converte uma amostra (dict) numa tupla na ordem das colunas; timestamp em µs"""
+    linha = [_para_microssegundos(amostra['timestamp'])]
+    for coluna in colunas[1:]:
+        valor = amostra.get(coluna)
+        linha.append(float('nan') if valor is None else float(valor))
+    return tuple(linha)
+
+
+class ArmazenamentoBase:
+    """Armazenamento persistente com escrita em segundo plano (write-behind).
+
+    append() só enfileira a amostra; uma thread grava em lotes de `lote`
+    amostras ou a cada `intervalo_flush` segundos, o que vier primeiro.
+    Assim o caminho de aquisição nunca espera pelo disco. As subclasses
+    implementam _abrir, _gravar_lote, _fechar e as consultas.
+    """
+
+    def __init__(self, colunas=COLUNAS_HISTORICO, lote=100, intervalo_flush=5.0):
+        self.colunas = list(colunas)
+        self.lote = lote
+        self.intervalo_flush = intervalo_flush
+        self._fila = queue.Queue()
+        self._parar = threading.Event()
+        self._flush_pedido = threading.Event()
+        self._thread = None
+        self.gravadas = 0
+
+    def append(self, amostra):
+        self._fila.put(_linha(amostra, self.colunas))
+
+    def flush(self, timeout=None):
+        """Pede a gravação imediata do que estiver na fila e espera terminar"""
+        inicio = time.monotonic()
+        while self._fila.unfinished_tasks:
+            # Repetido a cada volta: cada pedido só adianta um lote
+            self._flush_pedido.set()
+            if timeout is not None and time.monotonic() - inicio > timeout:
+                break
+            time.sleep(0.01)
+
+    def iniciar(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, name="armazenamento", daemon=True)
+        self._thread.start()
+
+    def fechar(self, timeout=None):
+        self._parar.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self):
+        self._abrir()
+        try:
+            while True:
+                linhas = self._coletar()
+                if linhas:
+                    try:
+                        self._gravar_lote(linhas)
+                        self.gravadas += len(linhas)
+                    except Exception as e:
+                        print(f"Erro ao gravar lote no armazenamento: {str(e)}")
+                    finally:
+                        for _ in linhas:
+                            self._fila.task_done()
+                elif self._parar.is_set():
+                    break
+        finally:
+            self._fechar()
+
+    def _coletar(self):
+        """Espera até completar um lote, vencer o intervalo de flush ou receber parada"""
+        linhas = []
+        limite = time.monotonic() + self.intervalo_flush
+        while len(linhas) < self.lote:
+            if self._parar.is_set() or self._flush_pedido.is_set():
+                self._flush_pedido.clear()
+                while len(linhas) < self.lote:
+                    try:
+                        linhas.append(self._fila.get_nowait())
+                    except queue.Empty:
+                        break
+                break
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                linhas.append(self._fila.get(timeout=min(restante, 0.1)))
+            except queue.Empty:
+                pass
+        return linhas
+
+    def _abrir(self):
+        pass
+
+    def _gravar_lote(self, linhas):
+        raise NotImplementedError
+
+    def _fechar(self):
+        pass
+
+    def ler_intervalo(self, inicio=None, fim=None, colunas=None):
+        """Retorna um dict coluna -> array com as amostras em [inicio, fim]"""
+        raise NotImplementedError
+
+    def ultimas(self, n):
+        """Retorna um dict coluna -> array com as n amostras mais recentes (em ordem)"""
+        raise NotImplementedError
+
+    def iterar_intervalo(self, inicio=None, fim=None, colunas=None, tamanho=10000):
+        """Gera o intervalo em pedaços de até `tamanho` amostras (dict coluna -> array)"""
+        dados = self.ler_intervalo(inicio, fim, colunas)
+        for k in range(0, len(dados['timestamp']), tamanho):
+            yield {c: v[k:k + tamanho] for c, v in dados.items()}
+
+    def contar(self, inicio=None, fim=None):
+        return len(self.ler_intervalo(inicio, fim, ['timestamp'])['timestamp'])
+
+    def _validar_colunas(self, colunas):
+        """Sempre inclui o timestamp; rejeita colunas fora do esquema"""
+        colunas = colunas or self.colunas
+        desconhecidas = [c for c in colunas if c not in self.colunas]
+        if desconhecidas:
+            raise ValueError(f"Colunas desconhecidas: {desconhecidas}")
+        return ['timestamp'] + [c for c in colunas if c != 'timestamp']
+
+    def _para_colunas(self, linhas, colunas):
+        dados = {}
+        for k, coluna in enumerate(colunas):
+            valores = [linha[k] for linha in linhas]
+            if coluna == 'timestamp':
+                dados[coluna] = np.array(valores, dtype=np.int64).astype('datetime64[us]')
+            else:
+                dados[coluna] = np.array(valores, dtype=np.float64)
+        return dados
+
+
+class ArmazenamentoSQLite(ArmazenamentoBase):
+    """Amostras numa tabela SQLite em modo WAL, indexada pelo timestamp.
+
+    `sincronismo` controla o fsync: 'FULL' sincroniza a cada commit, 'NORMAL'
+    (padrão, seguro em WAL) só nos checkpoints, 'OFF' deixa para o sistema.
+    Depois de uma queda, o banco reabre no último lote confirmado.
+    """
+
+    def __init__(self, caminho, sincronismo='NORMAL', tabela='amostras', **kwargs):
+        super().__init__(**kwargs)
+        if sincronismo not in ('OFF', 'NORMAL', 'FULL'):
+            raise ValueError(f"Sincronismo inválido: {sincronismo}")
+        if not tabela.isidentifier():
+            raise ValueError(f"Nome de tabela inválido: {tabela}")
+        self.caminho = caminho
+        self.tabela = tabela
+        self.sincronismo = sincronismo
+        self._conexao = None
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        # Cria o esquema já na inicialização para que as consultas funcionem antes do primeiro lote
+        conexao = self._conectar()
+        colunas = ', '.join(f'{c} REAL' for c in self.colunas[1:])
+        conexao.execute(f'CREATE TABLE IF NOT EXISTS {tabela} (timestamp INTEGER NOT NULL, {colunas})')
+        # Bancos criados com um esquema anterior ganham as colunas novas (vazias nas linhas antigas)
+        existentes = {linha[1] for linha in conexao.execute(f'PRAGMA table_info({tabela})')}
+        for coluna in self.colunas[1:]:
+            if coluna not in existentes:
+                conexao.execute(f'ALTER TABLE {tabela} ADD COLUMN {coluna} REAL')
+        conexao.execute(f'CREATE INDEX IF NOT EXISTS idx_{tabela}_timestamp ON {tabela} (timestamp)')
+        conexao.commit()
+        conexao.close()
+
+    def _conectar(self):
+        conexao = sqlite3.connect(self.caminho)
+        conexao.execute('PRAGMA journal_mode=WAL')
+        conexao.execute(f'PRAGMA synchronous={self.sincronismo}')
+        return conexao
+
+    def _abrir(self):
+        self._conexao = self._conectar()
+
+    def _gravar_lote(self, linhas):
+        marcadores = ', '.join('?' * len(self.colunas))
+        with self._conexao:
+            self._conexao.executemany(
+                f'INSERT INTO {self.tabela} ({", ".join(self.colunas)}) VALUES ({marcadores})', linhas
+            )
+
+    def _fechar(self):
+        if self._conexao:
+            self._conexao.close()
+            self._conexao = None
+
+    def apagar(self):
+        """Remove todas as linhas da tabela (antes de iniciar a gravação)"""
+        conexao = self._conectar()
+        try:
+            with conexao:
+                conexao.execute(f'DELETE FROM {self.tabela}')
+        finally:
+            conexao.close()
+
+    def inserir(self, colunas):
+        """Grava já, numa única transação, um lote em colunas (dict coluna -> array); ausentes viram NaN.
+
+        Não passa pela fila: serve para cargas grandes (como a reconstrução
+        de agregados), em que a gravação em segundo plano só atrasaria.
+        """
+        tempos = np.asarray(colunas['timestamp']).astype('datetime64[us]').astype(np.int64)
+        n = len(tempos)
+        valores = [np.asarray(colunas[c], dtype=np.float64) if c in colunas else np.full(n, np.nan)
+                   for c in self.colunas[1:]]
+        marcadores = ', '.join('?' * len(self.colunas))
+        conexao = self._conectar()
+        try:
+            with conexao:
+                conexao.executemany(f'INSERT INTO {self.tabela} ({", ".join(self.colunas)}) VALUES ({marcadores})',
+                                    zip(tempos.tolist(), *(v.tolist() for v in valores)))
+        finally:
+            conexao.close()
+        self.gravadas += n
+
+    def _consultar(self, sql, parametros, colunas):
+        conexao = self._conectar()
+        try:
+            return self._para_colunas(conexao.execute(sql, parametros).fetchall(), colunas)
+        finally:
+            conexao.close()
+
+    @staticmethod
+    def _filtro(inicio, fim):
+        filtros, parametros = [], []
+        if inicio is not None:
+            filtros.append('timestamp >= ?')
+            parametros.append(_para_microssegundos(inicio))
+        if fim is not None:
+            filtros.append('timestamp <= ?')
+            parametros.append(_para_microssegundos(fim))
+        return (f'WHERE {" AND ".join(filtros)}' if filtros else ''), parametros
+
+    def ler_intervalo(self, inicio=None, fim=None, colunas=None):
+        colunas = self._validar_colunas(colunas)
+        where, parametros = self._filtro(inicio, fim)
+        sql = f'SELECT {", ".join(colunas)} FROM {self.tabela} {where} ORDER BY timestamp'
+        return self._consultar(sql, parametros, colunas)
+
+    def iterar_intervalo(self, inicio=None, fim=None, colunas=None, tamanho=10000):
+        colunas = self._validar_colunas(colunas)
+        where, parametros = self._filtro(inicio, fim)
+        conexao = self._conectar()
+        try:
+            cursor = conexao.execute(f'SELECT {", ".join(colunas)} FROM {self.tabela} {where} ORDER BY timestamp',
+                                     parametros)
+            while True:
+                linhas = cursor.fetchmany(tamanho)
+                if not linhas:
+                    break
+                yield self._para_colunas(linhas, colunas)
+        finally:
+            conexao.close()
+
+    def contar(self, inicio=None, fim=None):
+        where, parametros = self._filtro(inicio, fim)
+        conexao = self._conectar()
+        try:
+            return conexao.execute(f'SELECT COUNT(*) FROM {self.tabela} {where}', parametros).fetchone()[0]
+        finally:
+            conexao.close()
+
+    def limites(self):
+        """(primeiro, último) timestamp gravado como datetime64[us], ou (None, None) se vazio"""
+        conexao = self._conectar()
+        try:
+            # Duas consultas: o SQLite só usa o índice para um MIN ou MAX isolado
+            primeiro = conexao.execute(f'SELECT MIN(timestamp) FROM {self.tabela}').fetchone()[0]
+            ultimo = conexao.execute(f'SELECT MAX(timestamp) FROM {self.tabela}').fetchone()[0]
+        finally:
+            conexao.close()
+        if primeiro is None:
+            return None, None
+        return np.datetime64(primeiro, 'us'), np.datetime64(ultimo, 'us')
+
+    def ultimas(self, n):
+        sql = (f'SELECT * FROM (SELECT {", ".join(self.colunas)} FROM {self.tabela} '
+               f'ORDER BY timestamp DESC LIMIT ?) ORDER BY timestamp')
+        return self._consultar(sql, (int(n),), self.colunas)
+
+
+class ArmazenamentoParquet(ArmazenamentoBase):
+    """Amostras em arquivos Parquet por blocos (requer pyarrow).
+
+    Cada lote vira um arquivo cujo nome guarda o primeiro e o último
+    timestamp, de modo que as consultas por intervalo só abrem os blocos que
+    se sobrepõem a ele. O arquivo é escrito com nome temporário e renomeado,
+    então uma queda nunca deixa um bloco pela metade.
+    """
+
+    def __init__(self, diretorio, lote=3600, intervalo_flush=60.0, **kwargs):
+        super().__init__(lote=lote, intervalo_flush=intervalo_flush, **kwargs)
+        import pyarrow  # noqa: F401  (falha cedo se a dependência opcional não estiver instalada)
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+        # Descarta blocos temporários de uma execução interrompida
+        for nome in os.listdir(diretorio):
+            if nome.endswith('.tmp'):
+                os.remove(os.path.join(diretorio, nome))
+
+    def _blocos(self):
+        blocos = []
+        for nome in os.listdir(self.diretorio):
+            if nome.startswith('amostras_') and nome.endswith('.parquet'):
+                primeiro, ultimo = nome[len('amostras_'):-len('.parquet')].split('_')
+                blocos.append((int(primeiro), int(ultimo), os.path.join(self.diretorio, nome)))
+        return sorted(blocos)
+
+    def _gravar_lote(self, linhas):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        dados = self._para_colunas(linhas, self.colunas)
+        tabela = pa.table({c: pa.array(v) for c, v in dados.items()})
+        primeiro = min(linha[0] for linha in linhas)
+        ultimo = max(linha[0] for linha in linhas)
+        destino = os.path.join(self.diretorio, f'amostras_{primeiro:017d}_{ultimo:017d}.parquet')
+        if os.path.exists(destino):
+            # Dois lotes com a mesma faixa de tempo: desloca o nome em 1 µs
+            destino = destino.replace(f'_{ultimo:017d}.', f'_{ultimo + 1:017d}.')
+        temporario = destino + '.tmp'
+        pq.write_table(tabela, temporario)
+        with open(temporario, 'rb') as arquivo:
+            os.fsync(arquivo.fileno())
+        os.replace(temporario, destino)
+
+    def _ler_blocos(self, blocos, colunas):
+        import pyarrow.parquet as pq
+
+        partes = {c: [] for c in colunas}
+        for _, _, caminho in blocos:
+            # Blocos gravados com um esquema anterior não têm as colunas novas: viram NaN
+            presentes = [c for c in colunas if c in pq.read_schema(caminho).names]
+            tabela = pq.read_table(caminho, columns=presentes)
+            for c in colunas:
+                if c in presentes:
+                    partes[c].append(tabela.column(c).to_numpy())
+                else:
+                    partes[c].append(np.full(tabela.num_rows, np.nan))
+        dados = {}
+        for c in colunas:
+            if partes[c]:
+                dados[c] = np.concatenate(partes[c])
+            else:
+                dados[c] = np.array([], dtype='datetime64[us]' if c == 'timestamp' else np.float64)
+        ordem = np.argsort(dados['timestamp'], kind='stable')
+        return {c: v[ordem] for c, v in dados.items()}
+
+    def _filtrar(self, dados, inicio, fim):
+        mascara = np.ones(len(dados['timestamp']), dtype=bool)
+        if inicio is not None:
+            mascara &= dados['timestamp'] >= np.datetime64(inicio, 'us')
+        if fim is not None:
+            mascara &= dados['timestamp'] <= np.datetime64(fim, 'us')
+        return {c: v[mascara] for c, v in dados.items()}
+
+    def _blocos_no_intervalo(self, inicio, fim):
+        t_inicio = _para_microssegundos(inicio) if inicio is not None else None
+        t_fim = _para_microssegundos(fim) if fim is not None else None
+        return [b for b in self._blocos()
+                if (t_inicio is None or b[1] >= t_inicio) and (t_fim is None or b[0] <= t_fim)]
+
+    def ler_intervalo(self, inicio=None, fim=None, colunas=None):
+        colunas = self._validar_colunas(colunas)
+        dados = self._ler_blocos(self._blocos_no_intervalo(inicio, fim), colunas)
+        return self._filtrar(dados, inicio, fim)
+
+    def iterar_intervalo(self, inicio=None, fim=None, colunas=None, tamanho=10000):
+        # Um bloco Parquet por vez: a memória fica limitada ao tamanho do bloco
+        colunas = self._validar_colunas(colunas)
+        for bloco in self._blocos_no_intervalo(inicio, fim):
+            dados = self._filtrar(self._ler_blocos([bloco], colunas), inicio, fim)
+            for k in range(0, len(dados['timestamp']), tamanho):
+                yield {c: v[k:k + tamanho] for c, v in dados.items()}
+
+    def ultimas(self, n):
+        import pyarrow.parquet as pq
+
+        # Lê os blocos do mais novo para o mais antigo até juntar n amostras
+        escolhidos, total = [], 0
+        for bloco in reversed(self._blocos()):
+            if total >= n:
+                break
+            total += pq.ParquetFile(bloco[2]).metadata.num_rows
+            escolhidos.append(bloco)
+        dados = self._ler_blocos(escolhidos, self.colunas)
+        return {c: v[-n:] if n else v[:0] for c, v in dados.items()}
@@ -0,0 +1,80 @@
+// Canal de eventos do servidor (Server-Sent Events em /eventos): cada lote de
+// amostras é publicado uma vez no servidor e aplicado localmente em cada navegador
+(function () {
+    if (!window.EventSource) {
+        return;
+    }
+
+    var source = new EventSource('/eventos');
+    source.addEventListener('amostras', function (event) {
+        // O layout pode ainda não ter sido montado no primeiro evento
+        if (!document.getElementById('live-store')) {
+            return;
+        }
+        window.dash_clientside.set_props('live-store', {data: JSON.parse(event.data)});
+    });
+})();
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    push: {
+        // Tabelas, extendData do gráfico e cursor a partir de um lote recebido
+        apply_batch: function (batch, activePorts, connection, cursor, zoom, limits) {
+            var dc = window.dash_clientside;
+            if (!batch) {
+                throw dc.PreventUpdate;
+            }
+            var stabilityTable = batch.estabilidade || dc.no_update;
+            var stabilityStatus = batch.estabilidade_resumo || dc.no_update;
+            var busTable = batch.barramento || dc.no_update;
+            var timingTable = batch.amostragem || dc.no_update;
+            var timingSummary = batch.amostragem_resumo || dc.no_update;
+            var stageTable = batch.etapas || dc.no_update;
+            if (!connection) {
+                return [dc.no_update, dc.no_update, dc.no_update, dc.no_update, dc.no_update,
+                        busTable, timingTable, timingSummary, stageTable, dc.no_update, dc.no_update, dc.no_update];
+            }
+
+            var ports = activePorts || [];
+            var activeOnly = function (rows) {
+                return rows ? rows.filter(function (row) {
+                    return ports.indexOf(row.port) !== -1;
+                }) : dc.no_update;
+            };
+            var piranometerTable = batch.piranometro || dc.no_update;
+            var cr1000Table = activeOnly(batch.cr1000);
+            var calibrationTable = activeOnly(batch.calibracao);
+
+            // Sem redesenho inicial ainda não há traces para estender
+            if (!cursor) {
+                return [piranometerTable, cr1000Table, calibrationTable, stabilityTable, stabilityStatus,
+                        busTable, timingTable, timingSummary, stageTable, dc.no_update, dc.no_update, dc.no_update];
+            }
+
+            // Descarta as amostras que já vieram no último redesenho
+            var count = batch.timestamp.length;
+            var skip = Math.max(0, cursor.total - (batch.total - count));
+            var extend = dc.no_update;
+            var newCursor = dc.no_update;
+            if (!zoom && skip < count) {
+                var x = batch.timestamp.slice(skip);
+                var ys = [batch.irradiance.slice(skip)];
+                ports.forEach(function (port) {
+                    ys.push(batch['cr1000_' + port].slice(skip));
+                });
+                // Último trace: faixa das amostras aceitas pelo detector de estabilidade
+                ys.push(batch.stable.slice(skip));
+                extend = [
+                    {x: ys.map(function () { return x; }), y: ys},
+                    ys.map(function (_, i) { return i; }),
+                    limits.max
+                ];
+                newCursor = {total: batch.total, redraw_total: cursor.redraw_total};
+            }
+
+            // Depois de limits.target pontos novos o servidor reduz o histórico de novo
+            var redraw = batch.total - cursor.redraw_total > limits.target ? batch.total : dc.no_update;
+            return [piranometerTable, cr1000Table, calibrationTable, stabilityTable, stabilityStatus,
+                    busTable, timingTable, timingSummary, stageTable, extend, newCursor, redraw];
+        }
+    }
+});
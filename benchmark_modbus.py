@@ -0,0 +1,516 @@
+"""Benchmark do caminho de leitura Modbus contra escravos RTU simulados.
+
+Cada instrumento é simulado por um servidor pymodbus numa porta pseudo-
+terminal, ligado à porta do cliente por uma ponte que imita o fio: atrasa
+cada quadro pelo tempo de transmissão no baudrate escolhido, acrescenta a
+latência de resposta do escravo e pode corromper respostas (erro de CRC).
+
+Uso:
+    python benchmark_modbus.py
+    python benchmark_modbus.py --baudrate 9600 --latencia 5 --erro-crc 0.01
+    python benchmark_modbus.py --modo asyncio --json resultados.json
+
+O JSON inclui o commit atual, para comparar resultados entre versões.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import select
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+from pymodbus import FramerType
+from pymodbus.client import ModbusSerialClient
+from pymodbus.datastore import ModbusSequentialDataBlock, ModbusServerContext, ModbusSlaveContext
+from pymodbus.server import ModbusSerialServer
+
+import cr1000MB
+from agregacao import AgregadorJanela
+from aquisicao import MotorAquisicao
+from aquisicao_async import MotorAquisicaoAsync
+from buffer_circular import BufferCircular
+from captura import EscritorCaptura, LeitorCaptura
+from decodificacao import concat_16bits_to_float, decode_float32_batch, interpret_cr1000_values
+from escalonador_barramento import BITS_POR_CARACTERE
+from mapa_registros import MAPA_CR1000, MAPA_PIRANOMETRO
+from reproducao import MotorReproducao
+
+SLAVE_PIRANOMETRO = 32
+SLAVE_CR1000 = 1
+
+
+# --- Mapas de registros simulados ---
+
+def _float_para_registros(valor):
+    inteiro = struct.unpack('>I', struct.pack('>f', valor))[0]
+    return [inteiro >> 16, inteiro & 0xFFFF]
+
+
+def registros_piranometro(irradiancia=850.0, angulo_x=1.2, angulo_y=-0.8, tensao=7.9):
+    """29 registros com floats nas posições 2 (irradiância), 14/16 (ângulos) e 20 (tensão)"""
+    registros = [0] * 29
+    registros[2:4] = _float_para_registros(irradiancia)
+    registros[14:16] = _float_para_registros(angulo_x)
+    registros[16:18] = _float_para_registros(angulo_y)
+    registros[20:22] = _float_para_registros(tensao)
+    return registros
+
+
+def registros_cr1000(valores=(1.1, 2.2, 3.3)):
+    """6 registros: três floats big-endian"""
+    return [r for valor in valores for r in _float_para_registros(valor)]
+
+
+# --- Ponte serial com fio simulado ---
+
+class PonteSerial:
+    """Dois pares de pseudo-terminais ligados por uma thread que imita o barramento.
+
+    O servidor abre `porta_servidor` e o cliente abre `porta_cliente`; os bytes
+    passam pela ponte, que espera o tempo de fio do quadro no baudrate, soma a
+    latência do escravo às respostas e corrompe uma resposta com
+    probabilidade `taxa_erro_crc`.
+    """
+
+    def __init__(self, baudrate, latencia=0.0, taxa_erro_crc=0.0, semente=0):
+        self.baudrate = baudrate
+        self.latencia = latencia
+        self.taxa_erro_crc = taxa_erro_crc
+        self._aleatorio = random.Random(semente)
+        self._mestre_servidor, self._escravo_servidor = os.openpty()
+        self._mestre_cliente, self._escravo_cliente = os.openpty()
+        self.porta_servidor = os.ttyname(self._escravo_servidor)
+        self.porta_cliente = os.ttyname(self._escravo_cliente)
+        self.bytes_transmitidos = 0
+        self.respostas_corrompidas = 0
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="ponte-serial", daemon=True)
+        self._thread.start()
+
+    def _tempo_fio(self, n_bytes):
+        return n_bytes * BITS_POR_CARACTERE / self.baudrate
+
+    def _loop(self):
+        descritores = [self._mestre_servidor, self._mestre_cliente]
+        while not self._parar.is_set():
+            prontos, _, _ = select.select(descritores, [], [], 0.1)
+            for fd in prontos:
+                try:
+                    dados = os.read(fd, 4096)
+                except OSError:
+                    continue
+                time.sleep(self._tempo_fio(len(dados)))
+                self.bytes_transmitidos += len(dados)
+                if fd == self._mestre_cliente:
+                    os.write(self._mestre_servidor, dados)
+                    continue
+
+                # Resposta do escravo
+                if self.latencia:
+                    time.sleep(self.latencia)
+                if self.taxa_erro_crc and self._aleatorio.random() < self.taxa_erro_crc:
+                    dados = bytearray(dados)
+                    dados[self._aleatorio.randrange(len(dados))] ^= 0xFF
+                    dados = bytes(dados)
+                    self.respostas_corrompidas += 1
+                os.write(self._mestre_cliente, dados)
+
+    def fechar(self):
+        self._parar.set()
+        self._thread.join(1)
+        for fd in (self._mestre_servidor, self._escravo_servidor, self._mestre_cliente, self._escravo_cliente):
+            os.close(fd)
+
+
+class SimuladorRTU:
+    """Servidores pymodbus RTU (um por ponte) rodando num event loop próprio"""
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="simulador-rtu", daemon=True)
+        self._thread.start()
+        self._servidores = []
+
+    def adicionar(self, porta, baudrate, slaves):
+        """slaves: dict slave_id -> lista de holding registers (endereço 0 em diante)"""
+        contexto = ModbusServerContext(
+            slaves={
+                # O pymodbus só usa `hr` quando `di` também é informado
+                slave: ModbusSlaveContext(di=ModbusSequentialDataBlock.create(),
+                                          hr=ModbusSequentialDataBlock(1, list(registros)))
+                for slave, registros in slaves.items()
+            },
+            single=False
+        )
+
+        async def _iniciar():
+            servidor = ModbusSerialServer(contexto, framer=FramerType.RTU, port=porta, baudrate=baudrate)
+            await servidor.serve_forever(background=True)
+            return servidor
+
+        self._servidores.append(asyncio.run_coroutine_threadsafe(_iniciar(), self._loop).result(5))
+
+    def fechar(self):
+        for servidor in self._servidores:
+            asyncio.run_coroutine_threadsafe(servidor.shutdown(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(1)
+
+
+# --- Medições ---
+
+def resumir_latencias(latencias, erros, duracao):
+    latencias = np.asarray(latencias) * 1000
+    return {
+        'leituras': int(len(latencias)),
+        'erros': int(erros),
+        'leituras_por_s': len(latencias) / duracao if duracao else 0.0,
+        'p50_ms': float(np.percentile(latencias, 50)) if len(latencias) else float('nan'),
+        'p99_ms': float(np.percentile(latencias, 99)) if len(latencias) else float('nan'),
+    }
+
+
+def medir(funcao, n, ok=lambda resultado: resultado is not None):
+    latencias, erros = [], 0
+    inicio = time.perf_counter()
+    for _ in range(n):
+        t0 = time.perf_counter()
+        resultado = funcao()
+        latencias.append(time.perf_counter() - t0)
+        if not ok(resultado):
+            erros += 1
+    return resumir_latencias(latencias, erros, time.perf_counter() - inicio)
+
+
+def bench_ler_registros(porta, baudrate, n, timeout):
+    """cr1000MB.ler_registros: uma leitura de 6 registros por chamada"""
+    cr1000MB.CONFIG.update({'slave_id': SLAVE_CR1000, 'start_address': 0, 'register_count': 6})
+    client = ModbusSerialClient(port=porta, baudrate=baudrate, parity='N', stopbits=1, bytesize=8,
+                                timeout=timeout)
+    client.connect()
+    try:
+        esperado = registros_cr1000()
+        return medir(lambda: cr1000MB.ler_registros(client), n, ok=lambda registros: registros == esperado)
+    finally:
+        client.close()
+
+
+def _criar_motor(modo, porta_piranometro, porta_cr1000, baudrate, timeout, intervalo=0):
+    motor = MotorAquisicaoAsync(intervalo=intervalo) if modo == 'asyncio' else MotorAquisicao(intervalo=intervalo)
+    motor.portas_ativas = [1, 2, 3]
+    motor.conectar_piranometro(porta_piranometro, baudrate, 'N', SLAVE_PIRANOMETRO, timeout=timeout)
+    motor.conectar_cr1000(porta_cr1000, baudrate, 'N', SLAVE_CR1000, timeout=timeout)
+    return motor
+
+
+def _ciclo(motor, modo):
+    if modo == 'asyncio':
+        return motor._executar_no_loop(motor.ler_ciclo_async())
+    return motor.ler_ciclo()
+
+
+def _ciclo_ok(amostra):
+    return amostra is not None and abs(amostra.get('irradiance', np.nan) - 850.0) < 1e-3 \
+        and abs(amostra['cr1000_1'] - 1.1) < 1e-6
+
+
+def bench_ciclo_aquisicao(motor, modo, n):
+    """Um ciclo completo do motor (piranômetro + CR1000), o antigo corpo de update_data"""
+    return medir(lambda: _ciclo(motor, modo), n, ok=_ciclo_ok)
+
+
+def bench_amostragem(modo, porta_piranometro, porta_cr1000, baudrate, timeout, periodo, duracao):
+    """Qualidade da grade de amostragem com a thread do motor rodando `duracao` segundos a 1/periodo Hz"""
+    motor = _criar_motor(modo, porta_piranometro, porta_cr1000, baudrate, timeout, intervalo=periodo)
+    try:
+        motor.iniciar()
+        time.sleep(duracao)
+    finally:
+        motor.desconectar_todos()
+        motor.parar(2)
+    resumo = motor.estatisticas_amostragem()
+    return {
+        'periodo_s': periodo,
+        'ticks': resumo['ticks'],
+        'perdidos': resumo['perdidos'],
+        'estouros': resumo['estouros'],
+        'series': resumo['series'],
+    }
+
+
+def bench_captura(n_ciclos, diretorio):
+    """Gravação, leitura (mmap) e reprodução acelerada de uma captura sintética de n_ciclos"""
+    caminho = os.path.join(diretorio, 'bench.pircap')
+    piranometro = registros_piranometro()[2:22]  # bloco do plano padrão: endereços 2 a 21
+    cr1000 = registros_cr1000()
+
+    t0 = time.perf_counter()
+    escritor = EscritorCaptura(caminho, ['piranometro', 'cr1000'],
+                               mapas={'piranometro': MAPA_PIRANOMETRO, 'cr1000': MAPA_CR1000})
+    for k in range(n_ciclos):
+        escritor.tick = k * 0.1
+        escritor.gravar('piranometro', k * 0.1 + 0.001, 2, piranometro)
+        escritor.gravar('cr1000', k * 0.1 + 0.02, 0, cr1000)
+    escritor.fechar()
+    gravacao = time.perf_counter() - t0
+    n_quadros = 2 * n_ciclos
+
+    with LeitorCaptura(caminho) as leitor:
+        t0 = time.perf_counter()
+        for _ in leitor.quadros():
+            pass
+        leitura = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        blocos = leitor.blocos()
+        for bloco in blocos.values():
+            decode_float32_batch(bloco['registros'])
+        vetorizada = time.perf_counter() - t0
+
+    motor = MotorReproducao(caminho, velocidade=None)
+    motor.portas_ativas = [1, 2, 3]
+    historico = BufferCircular(capacidade=max(1, n_ciclos))
+    agregador = AgregadorJanela(periodo=1.0)
+    motor.assinar(historico.append)
+    motor.assinar(agregador.adicionar)
+    t0 = time.perf_counter()
+    motor.iniciar()
+    motor.concluida.wait()
+    reproducao = time.perf_counter() - t0
+    motor.parar(2)
+
+    return {
+        'ciclos': n_ciclos,
+        'bytes_por_ciclo': os.path.getsize(caminho) / n_ciclos if n_ciclos else 0.0,
+        'gravacao_quadros_por_s': n_quadros / gravacao,
+        'leitura_quadros_por_s': n_quadros / leitura,
+        'decodificacao_vetorizada_quadros_por_s': n_quadros / vetorizada,
+        'reproducao_ciclos_por_s': motor.ciclos_reproduzidos / reproducao,
+        'reproducao_ok': bool(len(historico) == n_ciclos
+                              and abs(historico.janela()['irradiance'][-1] - 850.0) < 1e-3),
+    }
+
+
+def bench_decodificacao(n_quadros):
+    """Custo de decodificação por valor: vetorizado x um float por vez"""
+    aleatorio = np.random.default_rng(0)
+    quadros = aleatorio.integers(0, 0x4000, size=(n_quadros, 6), dtype=np.uint16)
+
+    t0 = time.perf_counter()
+    decode_float32_batch(quadros)
+    lote = time.perf_counter() - t0
+
+    amostra = quadros[:min(n_quadros, 20000)].tolist()
+    t0 = time.perf_counter()
+    for registros in amostra:
+        interpret_cr1000_values(registros, [1, 2, 3])
+    por_quadro = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for registros in amostra:
+        concat_16bits_to_float(registros[0], registros[1])
+    concat = time.perf_counter() - t0
+
+    return {
+        'lote_ns_por_valor': lote / (n_quadros * 3) * 1e9,
+        'interpret_cr1000_ns_por_valor': por_quadro / (len(amostra) * 3) * 1e9,
+        'concat_16bits_ns_por_valor': concat / len(amostra) * 1e9,
+    }
+
+
+def bench_memoria(motor, modo, n):
+    """Crescimento de memória em n ciclos com os assinantes usados pelo app (buffer + agregação)"""
+    historico = BufferCircular(capacidade=max(1, n // 2))
+    agregador = AgregadorJanela(periodo=1.0)
+    motor.assinar(historico.append)
+    motor.assinar(agregador.adicionar)
+
+    tracemalloc.start()
+    for _ in range(min(100, n)):  # aquecimento: caches e alocações únicas
+        _ciclo(motor, modo)
+    inicial, _ = tracemalloc.get_traced_memory()
+    for _ in range(n):
+        _ciclo(motor, modo)
+    final, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'ciclos': n,
+        'crescimento_kb': (final - inicial) / 1024,
+        'crescimento_bytes_por_ciclo': (final - inicial) / n if n else 0.0,
+        'pico_kb': pico / 1024,
+    }
+
+
+# Executado num processo novo: importa o app e monta o layout da primeira página
+_SCRIPT_INICIALIZACAO = """
+import json, sys, time
+t0 = time.perf_counter()
+import GetDados
+t1 = time.perf_counter()
+layout = GetDados.app.layout
+if callable(layout):
+    layout = layout()
+t2 = time.perf_counter()
+print(json.dumps({'importacao_s': t1 - t0, 'layout_s': t2 - t1,
+                  'modulos': [m for m in ('pandas', 'xlsxwriter', 'pyarrow') if m in sys.modules]}))
+"""
+
+
+def bench_inicializacao(repeticoes):
+    """Tempo de `import GetDados` e da montagem do primeiro layout, num processo novo a cada vez.
+
+    Roda num diretório temporário para não tocar no histórico em dados/.
+    """
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    ambiente = {**os.environ, 'PYTHONPATH': raiz + os.pathsep + os.environ.get('PYTHONPATH', '')}
+    medicoes = []
+    with tempfile.TemporaryDirectory() as diretorio:
+        for _ in range(repeticoes):
+            t0 = time.perf_counter()
+            saida = subprocess.check_output([sys.executable, '-c', _SCRIPT_INICIALIZACAO], cwd=diretorio,
+                                            env=ambiente, text=True)
+            medicao = json.loads(saida.strip().splitlines()[-1])
+            medicao['processo_s'] = time.perf_counter() - t0
+            medicoes.append(medicao)
+    return {
+        'repeticoes': repeticoes,
+        **{chave: float(np.median([m[chave] for m in medicoes]))
+           for chave in ('importacao_s', 'layout_s', 'processo_s')},
+        'modulos_carregados': medicoes[-1]['modulos'],
+    }
+
+
+def commit_atual():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except Exception:
+        return None
+
+
+def executar(args):
+    pontes = [PonteSerial(args.baudrate, args.latencia / 1000, args.erro_crc, semente=k) for k in range(2)]
+    ponte_piranometro, ponte_cr1000 = pontes
+    simulador = SimuladorRTU()
+    simulador.adicionar(ponte_piranometro.porta_servidor, args.baudrate,
+                        {SLAVE_PIRANOMETRO: registros_piranometro()})
+    simulador.adicionar(ponte_cr1000.porta_servidor, args.baudrate, {SLAVE_CR1000: registros_cr1000()})
+
+    resultados = {
+        'commit': commit_atual(),
+        'parametros': vars(args),
+    }
+    try:
+        print(f"cr1000MB.ler_registros ({args.leituras} leituras)...")
+        resultados['ler_registros'] = bench_ler_registros(ponte_cr1000.porta_cliente, args.baudrate,
+                                                          args.leituras, args.timeout)
+
+        motor = _criar_motor(args.modo, ponte_piranometro.porta_cliente, ponte_cr1000.porta_cliente,
+                             args.baudrate, args.timeout)
+        try:
+            print(f"Ciclo de aquisição, modo {args.modo} ({args.leituras} ciclos)...")
+            resultados['ciclo_aquisicao'] = bench_ciclo_aquisicao(motor, args.modo, args.leituras)
+            print(f"Memória em execução longa ({args.longo} ciclos)...")
+            resultados['memoria'] = bench_memoria(motor, args.modo, args.longo)
+        finally:
+            motor.desconectar_todos()
+            motor.parar(2)
+
+        if args.duracao_amostragem:
+            print(f"Grade de amostragem a {1 / args.periodo:.0f} Hz ({args.duracao_amostragem} s)...")
+            resultados['amostragem'] = bench_amostragem(args.modo, ponte_piranometro.porta_cliente,
+                                                        ponte_cr1000.porta_cliente, args.baudrate, args.timeout,
+                                                        args.periodo, args.duracao_amostragem)
+
+        print("Decodificação...")
+        resultados['decodificacao'] = bench_decodificacao(args.quadros)
+        if args.captura:
+            print(f"Captura e reprodução ({args.captura} ciclos)...")
+            with tempfile.TemporaryDirectory() as diretorio:
+                resultados['captura'] = bench_captura(args.captura, diretorio)
+        if args.inicializacao:
+            print(f"Inicialização do app ({args.inicializacao} processos)...")
+            resultados['inicializacao'] = bench_inicializacao(args.inicializacao)
+        resultados['fio'] = {
+            'bytes_transmitidos': sum(p.bytes_transmitidos for p in pontes),
+            'respostas_corrompidas': sum(p.respostas_corrompidas for p in pontes),
+        }
+    finally:
+        simulador.fechar()
+        for ponte in pontes:
+            ponte.fechar()
+    return resultados
+
+
+def imprimir(resultados):
+    print("\n" + "=" * 60)
+    print(f"Commit: {resultados['commit']}  Parâmetros: {resultados['parametros']}")
+    for nome in ('ler_registros', 'ciclo_aquisicao'):
+        r = resultados[nome]
+        print(f"{nome:18s} {r['leituras_por_s']:8.1f} leituras/s  p50 {r['p50_ms']:7.2f} ms  "
+              f"p99 {r['p99_ms']:7.2f} ms  erros {r['erros']}/{r['leituras']}")
+    d = resultados['decodificacao']
+    print(f"decodificação      lote {d['lote_ns_por_valor']:.1f} ns/valor  "
+          f"interpret_cr1000 {d['interpret_cr1000_ns_por_valor']:.1f} ns/valor  "
+          f"concat_16bits {d['concat_16bits_ns_por_valor']:.1f} ns/valor")
+    m = resultados['memoria']
+    print(f"memória            +{m['crescimento_kb']:.1f} KB em {m['ciclos']} ciclos "
+          f"({m['crescimento_bytes_por_ciclo']:.1f} B/ciclo), pico {m['pico_kb']:.1f} KB")
+    if 'captura' in resultados:
+        c = resultados['captura']
+        print(f"captura            {c['bytes_por_ciclo']:.0f} B/ciclo  "
+              f"gravação {c['gravacao_quadros_por_s']:.0f} quadros/s  "
+              f"leitura {c['leitura_quadros_por_s']:.0f} quadros/s  vetorizada {c['decodificacao_vetorizada_quadros_por_s']:.0f} quadros/s")
+        print(f"reprodução         {c['reproducao_ciclos_por_s']:.0f} ciclos/s  ok {c['reproducao_ok']}")
+    if 'amostragem' in resultados:
+        a = resultados['amostragem']
+        print(f"amostragem         {a['ticks']} ciclos a {a['periodo_s'] * 1000:.0f} ms  "
+              f"perdidos {a['perdidos']}  estouros {a['estouros']}")
+        for serie, r in a['series'].items():
+            print(f"  atraso {serie:11s} médio {r['atraso_medio_ms']:6.2f} ms  jitter {r['jitter_ms']:6.2f} ms  "
+                  f"p99 {r['p99_ms']:6.2f} ms  máx {r['maximo_ms']:6.2f} ms")
+    print(f"fio                {resultados['fio']}")
+    if 'inicializacao' in resultados:
+        i = resultados['inicializacao']
+        print(f"inicialização      import {i['importacao_s'] * 1000:.0f} ms  layout {i['layout_s'] * 1000:.0f} ms  "
+              f"processo {i['processo_s'] * 1000:.0f} ms  módulos {i['modulos_carregados']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--baudrate', type=int, default=19200)
+    parser.add_argument('--latencia', type=float, default=0.0, help="latência do escravo em ms")
+    parser.add_argument('--erro-crc', type=float, default=0.0, help="probabilidade de corromper uma resposta")
+    parser.add_argument('--leituras', type=int, default=200, help="leituras/ciclos medidos por teste")
+    parser.add_argument('--longo', type=int, default=2000, help="ciclos do teste de memória")
+    parser.add_argument('--quadros', type=int, default=1_000_000, help="quadros no teste de decodificação")
+    parser.add_argument('--timeout', type=float, default=0.5, help="timeout do cliente em s")
+    parser.add_argument('--modo', choices=('thread', 'asyncio'), default='thread')
+    parser.add_argument('--periodo', type=float, default=0.05, help="período da grade de amostragem em s")
+    parser.add_argument('--duracao-amostragem', type=float, default=5.0,
+                        help="segundos do teste da grade de amostragem (0 = não medir)")
+    parser.add_argument('--captura', type=int, default=50_000,
+                        help="ciclos da captura sintética gravada, lida e reproduzida (0 = não medir)")
+    parser.add_argument('--inicializacao', type=int, default=3,
+                        help="processos usados para medir a inicialização do app (0 = não medir)")
+    parser.add_argument('--json', help="grava os resultados neste arquivo")
+    args = parser.parse_args()
+
+    resultados = executar(args)
+    imprimir(resultados)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultados, arquivo, indent=2, ensure_ascii=False)
+    if 'captura' in resultados and not resultados['captura']['reproducao_ok']:
+        sys.exit("A reprodução da captura não devolveu as amostras gravadas")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import numpy as np
+
+# Esquema de colunas do histórico (mesma ordem usada na exportação). O timestamp é
+# o prazo do ciclo na grade de amostragem; *_offset são os segundos entre ele e a
+# requisição de cada dispositivo; stable é a marca de aceite do detector de estabilidade
+COLUNAS_HISTORICO = [
+    'timestamp', 'irradiance', 'voltage_out', 'angle_x', 'angle_y',
+    'cr1000_1', 'cr1000_2', 'cr1000_3', 'piranometer_offset', 'cr1000_offset', 'stable'
+]
+
+
+class BufferCircular:
+    """Buffer circular de capacidade fixa, orientado a colunas.
+
+    Cada coluna é um array NumPy pré-alocado com o dobro da capacidade: cada
+    valor é gravado em duas posições (i e i + capacidade), de modo que as
+    últimas N amostras estão sempre contíguas na memória. Assim o append é
+    O(1) e qualquer janela recente é uma view, sem cópia.
+    """
+
+    def __init__(self, capacidade, colunas=COLUNAS_HISTORICO, coluna_tempo='timestamp'):
+        if capacidade <= 0:
+            raise ValueError("A capacidade do buffer deve ser positiva")
+        self.capacidade = int(capacidade)
+        self.colunas = list(colunas)
+        self.coluna_tempo = coluna_tempo
+        self._dados = {}
+        for coluna in self.colunas:
+            if coluna == coluna_tempo:
+                self._dados[coluna] = np.full(2 * self.capacidade, np.datetime64('NaT'), dtype='datetime64[us]')
+            else:
+                self._dados[coluna] = np.full(2 * self.capacidade, np.nan, dtype=np.float64)
+        self._inicio = 0      # próxima posição de escrita (0..capacidade-1)
+        self._tamanho = 0
+        self.total = 0        # amostras recebidas desde a criação (inclui as descartadas)
+
+    def __len__(self):
+        return self._tamanho
+
+    def append(self, amostra):
+        """Grava uma amostra (dict coluna -> valor); colunas ausentes viram NaN/NaT"""
+        i = self._inicio
+        j = i + self.capacidade
+        for coluna, array in self._dados.items():
+            valor = amostra.get(coluna)
+            if coluna == self.coluna_tempo:
+                valor = np.datetime64('NaT') if valor is None else np.datetime64(valor, 'us')
+            elif valor is None:
+                valor = np.nan
+            array[i] = valor
+            array[j] = valor
+        self._inicio = (i + 1) % self.capacidade
+        self._tamanho = min(self._tamanho + 1, self.capacidade)
+        self.total += 1
+
+    def estender(self, colunas):
+        """Grava um lote de amostras de uma vez (dict coluna -> array de mesmo tamanho)"""
+        n = len(colunas[self.coluna_tempo])
+        if n == 0:
+            return
+        descartadas = max(0, n - self.capacidade)  # só as últimas `capacidade` cabem
+        posicoes = (self._inicio + descartadas + np.arange(n - descartadas)) % self.capacidade
+        for coluna, array in self._dados.items():
+            if coluna in colunas:
+                valores = np.asarray(colunas[coluna])[descartadas:]
+                if coluna == self.coluna_tempo:
+                    valores = valores.astype('datetime64[us]')
+            else:
+                valores = np.datetime64('NaT') if coluna == self.coluna_tempo else np.nan
+            array[posicoes] = valores
+            array[posicoes + self.capacidade] = valores
+        self._inicio = (self._inicio + n) % self.capacidade
+        self._tamanho = min(self._tamanho + n, self.capacidade)
+        self.total += n
+
+    def clear(self):
+        self._inicio = 0
+        self._tamanho = 0
+
+    def janela(self, n=None):
+        """Retorna um dict coluna -> view das últimas n amostras (todas se n for None)"""
+        n = self._tamanho if n is None else max(0, min(int(n), self._tamanho))
+        fim = self._inicio + self.capacidade
+        return {coluna: array[fim - n:fim] for coluna, array in self._dados.items()}
+
+    def __getitem__(self, coluna):
+        if coluna not in self._dados:
+            raise KeyError(f"Coluna desconhecida no buffer: {coluna}")
+        return self.janela()[coluna]
+
+    def to_dataframe(self, n=None):
+        """Cópia das últimas n amostras como DataFrame (para exportação)"""
+        import pandas as pd
+        return pd.DataFrame({coluna: view.copy() for coluna, view in self.janela(n).items()},
+                            columns=self.colunas)
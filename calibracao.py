@@ -0,0 +1,121 @@
+import math
+import threading
+
+# Canais do CR1000 calibrados contra a irradiância de referência
+CANAIS_CR1000 = ('cr1000_1', 'cr1000_2', 'cr1000_3')
+
+
+class RegressaoIncremental:
+    """Regressão linear y = a·x + b por mínimos quadrados, atualizada em O(1) por par.
+
+    Guarda só as médias e os co-momentos centrados (Welford), numericamente
+    estáveis mesmo com milhões de pares e valores grandes em relação à
+    dispersão, como a irradiância ao meio-dia.
+    """
+
+    __slots__ = ('count', 'mean_x', 'mean_y', 'm2_x', 'm2_y', 'c_xy')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.m2_x = 0.0
+        self.m2_y = 0.0
+        self.c_xy = 0.0
+
+    def adicionar(self, x, y):
+        if x is None or y is None or math.isnan(x) or math.isnan(y):
+            return
+        self.count += 1
+        dx = x - self.mean_x
+        self.mean_x += dx / self.count
+        dy = y - self.mean_y
+        self.mean_y += dy / self.count
+        self.m2_x += dx * (x - self.mean_x)
+        self.m2_y += dy * (y - self.mean_y)
+        self.c_xy += dx * (y - self.mean_y)
+
+    def resultado(self):
+        """Inclinação, intercepto, R², desvio dos resíduos e incertezas padrão (k=1) dos coeficientes"""
+        vazio = {'count': self.count, 'slope': math.nan, 'intercept': math.nan, 'r2': math.nan,
+                 'residual_std': math.nan, 'slope_u': math.nan, 'intercept_u': math.nan}
+        if self.count < 2 or self.m2_x <= 0:
+            return vazio
+        slope = self.c_xy / self.m2_x
+        resultado = {
+            **vazio,
+            'slope': slope,
+            'intercept': self.mean_y - slope * self.mean_x,
+            'r2': self.c_xy ** 2 / (self.m2_x * self.m2_y) if self.m2_y > 0 else math.nan,
+        }
+        if self.count > 2:
+            # Variância dos resíduos com n - 2 graus de liberdade
+            variancia = max(self.m2_y - slope * self.c_xy, 0.0) / (self.count - 2)
+            resultado['residual_std'] = math.sqrt(variancia)
+            resultado['slope_u'] = math.sqrt(variancia / self.m2_x)
+            resultado['intercept_u'] = math.sqrt(variancia * (1 / self.count + self.mean_x ** 2 / self.m2_x))
+        return resultado
+
+
+class CalibracaoIncremental:
+    """Coeficientes de calibração de cada canal do CR1000 contra a irradiância de referência.
+
+    Cada amostra com irradiância e tensão válidas entra na regressão
+    tensão = sensibilidade · irradiância + offset do canal; canais inativos
+    (NaN) ficam de fora. `fator` converte a unidade lida do CR1000 em µV, de
+    modo que a sensibilidade sai em µV/(W/m²) e o offset em µV. Amostras com
+    irradiância abaixo de `irradiancia_minima` são ignoradas, assim como,
+    com `coluna_aceite`, as amostras em que essa coluna não vale 1 (ex.: a
+    marca 'stable' do DetectorEstabilidade).
+    """
+
+    def __init__(self, canais=CANAIS_CR1000, referencia='irradiance', fator=1000.0, irradiancia_minima=None,
+                 coluna_aceite=None):
+        self.canais = list(canais)
+        self.referencia = referencia
+        self.fator = fator
+        self.irradiancia_minima = irradiancia_minima
+        self.coluna_aceite = coluna_aceite
+        self._regressoes = {canal: RegressaoIncremental() for canal in self.canais}
+        self._lock = threading.Lock()
+
+    def adicionar(self, amostra):
+        x = amostra.get(self.referencia)
+        if x is None or math.isnan(x):
+            return
+        if self.irradiancia_minima is not None and x < self.irradiancia_minima:
+            return
+        if self.coluna_aceite is not None and amostra.get(self.coluna_aceite) != 1.0:
+            return
+        with self._lock:
+            for canal, regressao in self._regressoes.items():
+                y = amostra.get(canal)
+                if y is not None:
+                    regressao.adicionar(x, y * self.fator)
+
+    def reiniciar(self, canal=None):
+        """Zera a regressão de um canal (ou de todos), por exemplo ao trocar o sensor"""
+        with self._lock:
+            for nome, regressao in self._regressoes.items():
+                if canal is None or nome == canal:
+                    regressao.reset()
+
+    def resultado(self):
+        """Dicionário canal -> {count, sensibilidade, offset, r2, incertezas, resíduo}"""
+        with self._lock:
+            resultados = {canal: regressao.resultado() for canal, regressao in self._regressoes.items()}
+        return {
+            canal: {
+                'count': r['count'],
+                'sensibilidade': r['slope'],      # µV/(W/m²)
+                'sensibilidade_u': r['slope_u'],
+                'offset': r['intercept'],         # µV
+                'offset_u': r['intercept_u'],
+                'r2': r['r2'],
+                'residuo': r['residual_std'],     # µV
+            }
+            for canal, r in resultados.items()
+        }
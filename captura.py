@@ -0,0 +1,176 @@
+"""Captura dos quadros de registros brutos lidos dos instrumentos.
+
+Formato do arquivo: MAGICA, tamanho do cabeçalho (uint32), cabeçalho JSON
+(dispositivos, âncora do relógio e mapas de registros em uso) e os quadros,
+um por requisição Modbus respondida:
+
+    id do dispositivo (uint8), tick (float64), instante (float64),
+    endereço (uint16), quantidade (uint16), registros (uint16 × quantidade)
+
+tick é o prazo do ciclo na grade de amostragem e instante o momento da
+requisição, ambos no relógio monotônico da captura; tudo em little-endian.
+A leitura usa mmap: os registros de cada quadro são views do arquivo, sem
+cópia. Como os registros são guardados crus, a captura pode ser
+decodificada de novo com outro mapa de registros (ver reproducao.py).
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+MAGICA = b'PIRCAP1\n'
+QUADRO = struct.Struct('<BddHH')
+
+Quadro = namedtuple('Quadro', 'dispositivo tick instante endereco registros')
+
+
+def _descrever_mapa(campos):
+    return [[c.nome, c.endereco, c.tipo, c.ordem] for c in campos]
+
+
+class EscritorCaptura:
+    """Grava os quadros de registros de vários dispositivos num único arquivo.
+
+    Quem conduz os ciclos atualiza `tick` antes das leituras; cada
+    `gravar` usa o tick corrente. Os dados vão ao disco a cada
+    `intervalo_flush` segundos e no fechamento.
+    """
+
+    def __init__(self, caminho, dispositivos, mapas=None, intervalo_flush=5.0):
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self.caminho = caminho
+        self.dispositivos = list(dispositivos)
+        if len(self.dispositivos) > 255:
+            raise ValueError("A captura aceita no máximo 255 dispositivos")
+        self._ids = {nome: i for i, nome in enumerate(self.dispositivos)}
+        self.intervalo_flush = intervalo_flush
+        self.tick = math.nan
+        self.quadros = 0
+        self._lock = threading.Lock()
+
+        origem = time.monotonic()
+        cabecalho = json.dumps({
+            'versao': 1,
+            'dispositivos': self.dispositivos,
+            'origem_monotonica': origem,
+            'parede': time.time(),
+            'mapas': {nome: _descrever_mapa(campos) for nome, campos in (mapas or {}).items()},
+        }).encode('utf-8')
+        self._arquivo = open(caminho, 'wb')
+        self._arquivo.write(MAGICA + struct.pack('<I', len(cabecalho)) + cabecalho)
+        self._ultimo_flush = origem
+
+    def gravar(self, dispositivo, instante, endereco, registers):
+        quadro = QUADRO.pack(self._ids[dispositivo], self.tick, instante, endereco, len(registers)) + \
+            struct.pack(f'<{len(registers)}H', *registers)
+        with self._lock:
+            if self._arquivo is None:
+                return
+            self._arquivo.write(quadro)
+            self.quadros += 1
+            if instante - self._ultimo_flush >= self.intervalo_flush:
+                self._arquivo.flush()
+                self._ultimo_flush = instante
+
+    def fechar(self):
+        with self._lock:
+            if self._arquivo is not None:
+                self._arquivo.close()
+                self._arquivo = None
+
+
+class LeitorCaptura:
+    """Lê um arquivo de captura via mmap.
+
+    Um quadro incompleto no fim (captura interrompida) é ignorado. Os
+    registros devolvidos por `quadros()` são views do arquivo e só valem
+    enquanto o leitor estiver aberto.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._arquivo = open(caminho, 'rb')
+        self._mapa = mmap.mmap(self._arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mapa[:len(MAGICA)] != MAGICA:
+            self.fechar()
+            raise ValueError(f"Arquivo de captura inválido: {caminho}")
+        tamanho, = struct.unpack_from('<I', self._mapa, len(MAGICA))
+        inicio = len(MAGICA) + 4
+        self.cabecalho = json.loads(bytes(self._mapa[inicio:inicio + tamanho]))
+        self.dispositivos = self.cabecalho['dispositivos']
+        self.origem = self.cabecalho['origem_monotonica']
+        self.parede = self.cabecalho['parede']
+        self._inicio = inicio + tamanho
+
+    def _percorrer(self):
+        """(deslocamento, id, tick, instante, endereço, quantidade) de cada quadro completo"""
+        mapa, fim, posicao = self._mapa, len(self._mapa), self._inicio
+        while posicao + QUADRO.size <= fim:
+            dispositivo, tick, instante, endereco, quantidade = QUADRO.unpack_from(mapa, posicao)
+            proximo = posicao + QUADRO.size + 2 * quantidade
+            if proximo > fim:
+                break
+            yield posicao, dispositivo, tick, instante, endereco, quantidade
+            posicao = proximo
+
+    def quadros(self):
+        for posicao, dispositivo, tick, instante, endereco, quantidade in self._percorrer():
+            registros = np.frombuffer(self._mapa, dtype='<u2', count=quantidade, offset=posicao + QUADRO.size)
+            yield Quadro(self.dispositivos[dispositivo], tick, instante, endereco, registros)
+
+    def ciclos(self):
+        """Agrupa os quadros consecutivos do mesmo tick: gera (tick, [quadros])"""
+        atual, grupo = None, []
+        for quadro in self.quadros():
+            if grupo and quadro.tick != atual:
+                yield atual, grupo
+                grupo = []
+            atual = quadro.tick
+            grupo.append(quadro)
+        if grupo:
+            yield atual, grupo
+
+    def blocos(self):
+        """Todos os quadros agrupados por (dispositivo, endereço, quantidade), em arrays.
+
+        Cada grupo vira {'tick', 'instante': float64 (N,), 'registros': uint16
+        (N, quantidade)}, pronto para a decodificação vetorizada
+        (decodificacao.decode_float32_batch).
+        """
+        deslocamentos = {}
+        for posicao, dispositivo, _, _, endereco, quantidade in self._percorrer():
+            deslocamentos.setdefault((dispositivo, endereco, quantidade), []).append(posicao)
+
+        bytes_ = np.frombuffer(self._mapa, dtype=np.uint8)
+        grupos = {}
+        for (dispositivo, endereco, quantidade), posicoes in deslocamentos.items():
+            posicoes = np.asarray(posicoes, dtype=np.int64)[:, np.newaxis]
+            campo = lambda inicio, n: bytes_[posicoes + inicio + np.arange(n)]  # noqa: E731
+            grupos[(self.dispositivos[dispositivo], endereco, quantidade)] = {
+                'tick': campo(1, 8).view('<f8')[:, 0],
+                'instante': campo(9, 8).view('<f8')[:, 0],
+                'registros': campo(QUADRO.size, 2 * quantidade).view('<u2'),
+            }
+        return grupos
+
+    def fechar(self):
+        try:
+            self._mapa.close()
+        except BufferError:
+            pass  # ainda há views de registros em uso; o mapa é liberado junto com elas
+        self._arquivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *erro):
+        self.fechar()
+        return False
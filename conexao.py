@@ -0,0 +1,205 @@
+import time
+from collections import deque
+
+import numpy as np
+
+from etapas import medir
+from mapa_registros import decodificar_bloco
+from metricas import MetricasBarramento
+
+
+class Disjuntor:
+    """Circuit breaker de um dispositivo, com espera exponencial entre tentativas.
+
+    Depois de `falhas_para_abrir` falhas seguidas o disjuntor abre e o
+    dispositivo deixa de ser consultado (não gasta tempo de barramento) por
+    `espera_inicial` segundos, dobrando a cada nova abertura até
+    `espera_maxima`. Vencida a espera, uma única tentativa é liberada
+    ('meio_aberto'): sucesso fecha o disjuntor, falha abre de novo.
+    """
+
+    def __init__(self, falhas_para_abrir=3, espera_inicial=1.0, espera_maxima=60.0):
+        self.falhas_para_abrir = falhas_para_abrir
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self.estado = 'fechado'
+        self.falhas_consecutivas = 0
+        self.aberturas = 0  # aberturas seguidas, sem sucesso entre elas
+        self.proxima_tentativa = 0.0
+
+    @property
+    def espera(self):
+        return min(self.espera_maxima, self.espera_inicial * 2 ** max(self.aberturas - 1, 0))
+
+    def permitir(self, agora=None):
+        """True se o dispositivo pode ser consultado agora"""
+        if self.estado == 'fechado':
+            return True
+        agora = time.monotonic() if agora is None else agora
+        if self.estado == 'aberto' and agora >= self.proxima_tentativa:
+            self.estado = 'meio_aberto'
+            return True
+        return False
+
+    def sucesso(self):
+        self.estado = 'fechado'
+        self.falhas_consecutivas = 0
+        self.aberturas = 0
+
+    def falha(self, agora=None):
+        """Registra uma falha; retorna True se o disjuntor abriu agora"""
+        self.falhas_consecutivas += 1
+        if self.estado == 'meio_aberto' or self.falhas_consecutivas >= self.falhas_para_abrir:
+            self.aberturas += 1
+            self.estado = 'aberto'
+            self.proxima_tentativa = (time.monotonic() if agora is None else agora) + self.espera
+            return True
+        return False
+
+
+class TimeoutAdaptativo:
+    """Timeout de resposta calculado a partir do tempo de ida e volta observado.
+
+    Até juntar `minimo_amostras` respostas usa o timeout `inicial`; depois
+    usa `fator` vezes o p99 das últimas respostas, limitado a [minimo, maximo].
+    """
+
+    def __init__(self, inicial, minimo=0.05, maximo=None, fator=3.0, amostras=200, minimo_amostras=20):
+        self.inicial = inicial
+        self.minimo = minimo
+        self.maximo = maximo if maximo is not None else inicial
+        self.fator = fator
+        self.minimo_amostras = minimo_amostras
+        self._rtts = deque(maxlen=amostras)
+
+    def registrar(self, rtt):
+        self._rtts.append(rtt)
+
+    @property
+    def p99(self):
+        return float(np.percentile(self._rtts, 99)) if self._rtts else float('nan')
+
+    @property
+    def valor(self):
+        if len(self._rtts) < self.minimo_amostras:
+            return self.inicial
+        return min(self.maximo, max(self.minimo, self.fator * self.p99))
+
+
+class ConexaoDispositivo:
+    """Um escravo Modbus: cliente persistente da sua porta, disjuntor e timeout adaptativo.
+
+    O cliente pertence à porta e pode ser compartilhado por vários
+    dispositivos no mesmo barramento. Quem usa o barramento consulta
+    `permitir()` antes de cada leitura; `ler_plano` (cliente síncrono) ou
+    `apos_requisicao` (cliente assíncrono) informam o resultado ao disjuntor
+    e ao timeout adaptativo.
+    """
+
+    def __init__(self, nome, client, port, baudrate, parity, slave, timeout=2.0, metricas=None):
+        self.nome = nome
+        self.client = client
+        self.port = port
+        self.baudrate = baudrate
+        self.parity = parity
+        self.slave = slave
+        self.disjuntor = Disjuntor()
+        self.timeout = TimeoutAdaptativo(inicial=timeout)
+        self.metricas = metricas if metricas is not None else MetricasBarramento()
+        self.captura = None  # captura.EscritorCaptura que recebe os registros brutos (opcional)
+        self.cache = None    # gateway_modbus.CacheRegistros servido aos outros programas (opcional)
+        self.etapas = None   # etapas.TemporizadorEtapas que mede a decodificação (opcional)
+        self._publicar_estado()
+
+    def permitir(self):
+        return self.disjuntor.permitir()
+
+    def aplicar_timeout(self):
+        """Atualiza o timeout do cliente (lido pelo pymodbus a cada requisição)"""
+        valor = self.timeout.valor
+        self.client.comm_params.timeout_connect = valor
+        # O gerenciador de transações do pymodbus guarda uma cópia dos parâmetros
+        contexto = getattr(self.client, 'ctx', None)
+        if contexto is not None:
+            contexto.comm_params.timeout_connect = valor
+        socket = getattr(self.client, 'socket', None)
+        if socket is not None and hasattr(socket, 'timeout'):
+            socket.timeout = valor
+        return valor
+
+    def sucesso(self, rtt=None):
+        if rtt is not None:
+            self.timeout.registrar(rtt)
+        self.disjuntor.sucesso()
+        self._publicar_estado()
+
+    def falha(self):
+        if self.disjuntor.falha():
+            print(f"Dispositivo {self.nome} sem resposta; nova tentativa em {self.disjuntor.espera:.1f} s")
+        self._publicar_estado()
+
+    def reconectou(self):
+        self.metricas.registrar_reconexao(self.nome)
+
+    def _publicar_estado(self):
+        self.metricas.definir_conexao(self.nome, self.disjuntor.estado, self.timeout.valor)
+
+    def capturar(self, instante, bloco, registers):
+        if self.captura is not None:
+            self.captura.gravar(self.nome, instante, bloco.endereco, registers)
+        if self.cache is not None:
+            self.cache.atualizar(self.nome, instante, bloco.endereco, registers)
+
+    def apos_requisicao(self, medicao):
+        """Informa o resultado de uma requisição ao disjuntor e ao timeout adaptativo.
+
+        Qualquer resposta, mesmo de exceção, mostra que o dispositivo está vivo;
+        timeouts e erros de comunicação contam como falha. Num erro de
+        comunicação a porta é fechada e reaberta na próxima tentativa.
+        """
+        if medicao.resultado in ('ok', 'exception'):
+            self.sucesso(medicao.latencia)
+            return
+        self.falha()
+        if medicao.resultado == 'error':
+            self.client.close()
+
+    # --- I/O com cliente síncrono ---
+
+    def garantir_conexao(self):
+        """Reabre a porta se ela foi fechada; levanta Exception se não for possível"""
+        if self.client.connected:
+            return
+        if not self.client.connect():
+            self.falha()
+            raise Exception("porta serial indisponível")
+        self.reconectou()
+
+    def ler_plano(self, plano):
+        """Executa as leituras do plano; retorna None se alguma resposta vier com erro"""
+        self.aplicar_timeout()
+        valores = {}
+        for bloco in plano:
+            medicao = self.metricas.medir(self.nome)
+            enviado = time.monotonic()
+            try:
+                with medicao:
+                    response = medicao.resposta(self.client.read_holding_registers(
+                        address=bloco.endereco, count=bloco.count, slave=self.slave
+                    ))
+            finally:
+                self.apos_requisicao(medicao)
+            if response.isError():
+                return None
+            self.capturar(enviado, bloco, response.registers)
+            with medir(self.etapas, 'decodificacao'):
+                valores.update(decodificar_bloco(bloco, response.registers))
+        return valores
+
+    def estado(self):
+        return {
+            'disjuntor': self.disjuntor.estado,
+            'falhas_consecutivas': self.disjuntor.falhas_consecutivas,
+            'timeout': self.timeout.valor,
+            'p99_rtt': self.timeout.p99,
+        }
@@ -1,8 +1,8 @@
-from pymodbus.client import ModbusSerialClient
+from pymodbus.client import ModbusSerialClient, ModbusTcpClient
 import struct
 import math
-import time
-from datetime import datetime
+
+from amostragem import GradeAmostragem
 
 CONFIG = {
     'port': 'COM5',
@@ -13,11 +13,26 @@ CONFIG = {
     'timeout': 3,
     'slave_id': 1,
     'start_address': 0,
-    'register_count': 6
+    'register_count': 6,
+    'periodo': 1.0,  # segundos entre leituras, numa grade fixa (sem deriva)
+    # (host, porta, unidade) do gateway Modbus TCP do GetDados.py; lê os registros já
+    # lidos por ele, sem abrir a porta serial (None = ler direto da porta)
+    'gateway': None
 }
 
 
 def conectar_modbus():
+    if CONFIG['gateway']:
+        host, porta, unidade = CONFIG['gateway']
+        print(f"Conectando ao gateway Modbus TCP em {host}:{porta}...")
+        CONFIG['slave_id'] = unidade
+        client = ModbusTcpClient(host, port=porta, timeout=CONFIG['timeout'])
+        if client.connect():
+            print("✅ Conexão com o gateway estabelecida com sucesso!")
+            return client
+        print("❌ Falha ao conectar ao gateway")
+        return None
+
     print(f"Conectando ao CR1000 na porta {CONFIG['port']}...")
     try:
         client = ModbusSerialClient(
@@ -88,10 +103,12 @@ def main():
     if not client:
         return
 
+    grade = GradeAmostragem(CONFIG['periodo'])
     try:
         while True:
+            prazo = grade.aguardar()
             print("\n" + "=" * 50)
-            print(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            print(grade.para_datetime(prazo).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3])
 
             registros = ler_registros(client)
             if registros:
@@ -104,10 +121,14 @@ def main():
                         else:
                             print(f"Entrada {i}: {val:.10f}")  # 10 casas decimais
 
-            time.sleep(1)
+            grade.concluir()
 
     except KeyboardInterrupt:
         print("\nLeitura encerrada pelo usuário")
+        resumo = grade.estatisticas.resumo()
+        ciclo = resumo['series'].get('ciclo', {'jitter_ms': float('nan'), 'maximo_ms': float('nan')})
+        print(f"{resumo['ticks']} leituras, {resumo['perdidos']} prazos perdidos, "
+              f"jitter {ciclo['jitter_ms']:.3f} ms, atraso máx {ciclo['maximo_ms']:.3f} ms")
     finally:
         client.close()
         print("Conexão encerrada")
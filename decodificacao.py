@@ -0,0 +1,75 @@
+import struct
+
+import numpy as np
+
+# Ordens de palavra suportadas para floats de 32 bits em dois registros
+WORD_ORDERS = ('big', 'word_swap')  # ABCD (Modbus padrão) e CDAB
+
+# Padrão IEEE 754 usado pelo CR1000 para sinalizar NaN
+CR1000_NAN_PATTERN = 0xFFC00000
+
+
+_UINT32 = struct.Struct('>I')
+_FLOAT32 = struct.Struct('>f')
+
+
+# Função de conversão de registros para float
+def concat_16bits_to_float(reg1, reg2):
+    int_32bit = (reg1 << 16) | reg2
+    return struct.unpack('!f', struct.pack('!I', int_32bit))[0]
+
+
+def decode_float32(reg1, reg2, word_order='big'):
+    """Um float32 de dois registros, sem NumPy: o caminho rápido para quadros avulsos.
+
+    Mesma semântica de decode_float32_batch (ordem de palavra e padrão NaN do CR1000).
+    """
+    if word_order == 'word_swap':
+        reg1, reg2 = reg2, reg1
+    elif word_order != 'big':
+        raise ValueError(f"Ordem de palavra inválida: {word_order} (use {WORD_ORDERS})")
+    raw = (reg1 << 16) | reg2
+    if raw == CR1000_NAN_PATTERN:
+        return float('nan')
+    return _FLOAT32.unpack(_UINT32.pack(raw))[0]
+
+
+# Decodificação vetorizada de blocos de registros
+def decode_float32_batch(registers, word_order='big'):
+    """Converte N quadros de registros (uint16, N x 2k) numa matriz float32 (N x k).
+
+    Faz a troca de bytes e a reinterpretação em um único passo NumPy, sem
+    laço Python por valor. O padrão FFC00000 do CR1000 é normalizado para NaN.
+    """
+    if word_order not in WORD_ORDERS:
+        raise ValueError(f"Ordem de palavra inválida: {word_order} (use {WORD_ORDERS})")
+
+    regs = np.asarray(registers)
+    if regs.ndim == 1:
+        regs = regs[np.newaxis, :]
+    if regs.ndim != 2 or regs.shape[1] % 2:
+        raise ValueError(f"Esperado N x 2k registros, recebido formato {regs.shape}")
+
+    n_frames, n_regs = regs.shape
+    words = regs.astype('>u2').reshape(n_frames, n_regs // 2, 2)
+    if word_order == 'word_swap':
+        words = words[:, :, ::-1]
+    words = np.ascontiguousarray(words)
+
+    raw = words.view('>u4')[:, :, 0]
+    values = words.view('>f4')[:, :, 0].astype(np.float32)
+    values[raw == CR1000_NAN_PATTERN] = np.nan
+    return values
+
+
+# Função para interpretar valores do CR1000 via Modbus
+def interpret_cr1000_values(registers, active_ports):
+    """Interpreta os registros considerando apenas as portas ativas"""
+    if not registers or len(registers) != 6:
+        print(f"Dados incompletos do CR1000. Recebidos: {len(registers) if registers else 0}/6 registros")
+        return [float('nan')] * 3
+
+    # Um quadro só: o caminho escalar é mais rápido que montar arrays NumPy (o lote
+    # fica para a reprodução, o benchmark e a exportação). Sempre 3 valores, NaN para portas inativas
+    return [decode_float32(registers[2 * i], registers[2 * i + 1]) if (i + 1) in active_ports else float('nan')
+            for i in range(3)]
@@ -0,0 +1,129 @@
+import json
+import math
+import queue
+import threading
+from datetime import datetime
+
+from etapas import medir
+
+
+def _para_json(valor):
+    """NaN não existe em JSON: vira null (lacuna no gráfico)"""
+    if isinstance(valor, float) and math.isnan(valor):
+        return None
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return valor
+
+
+class Difusor:
+    """Canal Server-Sent Events: cada evento é serializado uma vez e entregue a todos os navegadores.
+
+    Cada navegador conectado tem a sua fila; um cliente lento perde os
+    eventos mais antigos em vez de acumular memória no servidor.
+    """
+
+    def __init__(self, max_fila=100, keepalive=15.0):
+        self.max_fila = max_fila
+        self.keepalive = keepalive  # segundos entre comentários que mantêm a conexão aberta
+        self._filas = set()
+        self._lock = threading.Lock()
+
+    @property
+    def clientes(self):
+        return len(self._filas)
+
+    def publicar(self, evento, dados):
+        quadro = f"event: {evento}\ndata: {json.dumps(dados, separators=(',', ':'))}\n\n".encode('utf-8')
+        with self._lock:
+            filas = list(self._filas)
+        for fila in filas:
+            try:
+                fila.put_nowait(quadro)
+            except queue.Full:
+                try:
+                    fila.get_nowait()
+                except queue.Empty:
+                    pass
+                fila.put_nowait(quadro)
+
+    def fluxo(self):
+        """Gerador de bytes para uma resposta text/event-stream; termina quando o navegador desconecta"""
+        fila = queue.Queue(maxsize=self.max_fila)
+        with self._lock:
+            self._filas.add(fila)
+        try:
+            yield b"retry: 2000\n\n"
+            while True:
+                try:
+                    yield fila.get(timeout=self.keepalive)
+                except queue.Empty:
+                    yield b": keepalive\n\n"
+        finally:
+            with self._lock:
+                self._filas.discard(fila)
+
+
+class PublicadorAmostras:
+    """Junta as amostras do motor de aquisição e publica um lote a cada `intervalo` segundos.
+
+    O lote vai como evento 'amostras' com uma lista por coluna e `total`, o
+    número de amostras recebidas até a última do lote (começando em `total`
+    do construtor), para o navegador descartar pontos que já vieram num
+    redesenho. `extra` é chamada uma vez por lote para anexar dados já
+    prontos para a interface (tabelas de estatísticas, saúde do barramento).
+    Sem navegadores conectados nada é montado. Com `etapas` (um
+    TemporizadorEtapas), a montagem das colunas e a serialização de cada
+    lote são medidas.
+    """
+
+    def __init__(self, difusor, colunas, intervalo=1.0, extra=None, total=0, etapas=None):
+        self.difusor = difusor
+        self.etapas = etapas
+        self.colunas = list(colunas)
+        self.intervalo = intervalo
+        self.extra = extra
+        self.total = total
+        self._pendentes = []
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+
+    def adicionar(self, amostra):
+        with self._lock:
+            self._pendentes.append(amostra)
+            self.total += 1
+
+    def iniciar(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, name="publicador-sse", daemon=True)
+        self._thread.start()
+
+    def parar(self, timeout=None):
+        self._parar.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.publicar_lote()
+            except Exception as e:
+                print(f"Erro no publicador de eventos: {str(e)}")
+
+    def publicar_lote(self):
+        with self._lock:
+            amostras, self._pendentes = self._pendentes, []
+            total = self.total
+        if not self.difusor.clientes:
+            return
+        with medir(self.etapas, 'lote.colunas'):
+            lote = {coluna: [_para_json(a.get(coluna, float('nan'))) for a in amostras] for coluna in self.colunas}
+        lote['total'] = total
+        if self.extra is not None:
+            lote.update(self.extra())
+        with medir(self.etapas, 'lote.json'):
+            self.difusor.publicar('amostras', lote)
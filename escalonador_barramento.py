@@ -0,0 +1,216 @@
+import threading
+import time
+from datetime import datetime
+
+# Bits por caractere RTU: start + 8 dados + paridade (ou stop extra) + stop
+BITS_POR_CARACTERE = 11
+
+
+# --- Modelo de tempo do Modbus RTU ---
+
+def tempo_caractere(baudrate):
+    return BITS_POR_CARACTERE / baudrate
+
+
+def intervalo_entre_quadros(baudrate):
+    """Silêncio t3.5 exigido entre quadros RTU (fixo em 1,75 ms acima de 19200 baud)"""
+    if baudrate > 19200:
+        return 0.00175
+    return 3.5 * tempo_caractere(baudrate)
+
+
+def tempo_transacao(count, baudrate):
+    """Tempo de fio de uma leitura FC03 de `count` registros, incluindo os dois silêncios t3.5.
+
+    Requisição: endereço + função + início (2) + quantidade (2) + CRC (2) = 8 bytes.
+    Resposta: endereço + função + contagem + 2 * count + CRC (2) = 5 + 2 * count bytes.
+    """
+    n_bytes = 8 + 5 + 2 * count
+    return n_bytes * tempo_caractere(baudrate) + 2 * intervalo_entre_quadros(baudrate)
+
+
+class DispositivoBarramento:
+    """Um escravo Modbus no barramento compartilhado e a sua taxa de leitura"""
+
+    def __init__(self, nome, slave, address, count, taxa=1.0, prioridade=0, ao_ler=None):
+        self.nome = nome
+        self.slave = slave
+        self.address = address
+        self.count = count
+        self.taxa = taxa                # leituras por segundo desejadas
+        self.prioridade = prioridade    # maior = atendido primeiro na política 'prioridade'
+        self.ao_ler = ao_ler            # callback(dispositivo, registers | None, timestamp)
+
+        self.proximo = 0.0              # instante (monotônico) da próxima leitura
+        self.leituras = 0
+        self.erros = 0
+        self.atrasos = 0                # leituras que saíram depois do prazo
+
+    @property
+    def periodo(self):
+        return 1.0 / self.taxa
+
+
+class EscalonadorBarramento:
+    """Escalonador de leituras para vários escravos num único barramento RS-485.
+
+    Compartilha um só ModbusSerialClient entre todos os dispositivos e decide,
+    a cada transação, qual dispositivo vencido é atendido: em rodízio
+    ('round_robin') ou pelo de maior prioridade ('prioridade'). Entre
+    transações respeita o silêncio t3.5 do RTU e contabiliza o tempo ocupado,
+    para informar a utilização real do barramento.
+    """
+
+    POLITICAS = ('round_robin', 'prioridade')
+
+    def __init__(self, client, baudrate, politica='round_robin'):
+        if politica not in self.POLITICAS:
+            raise ValueError(f"Política inválida: {politica} (use {self.POLITICAS})")
+        self.client = client
+        self.baudrate = baudrate
+        self.politica = politica
+        self.gap = intervalo_entre_quadros(baudrate)
+
+        self._dispositivos = []
+        self._lock = threading.Lock()
+        self._indice_rodizio = 0
+        self._fim_ultima = 0.0
+        self._tempo_ocupado = 0.0
+        self._inicio = None
+
+        self._parar = threading.Event()
+        self._thread = None
+
+    # --- Dispositivos ---
+
+    def adicionar(self, dispositivo):
+        with self._lock:
+            if any(d.nome == dispositivo.nome for d in self._dispositivos):
+                raise ValueError(f"Dispositivo já cadastrado: {dispositivo.nome}")
+            dispositivo.proximo = time.monotonic()
+            self._dispositivos.append(dispositivo)
+
+    def remover(self, nome):
+        with self._lock:
+            self._dispositivos = [d for d in self._dispositivos if d.nome != nome]
+
+    @property
+    def dispositivos(self):
+        return list(self._dispositivos)
+
+    # --- Escalonamento ---
+
+    def _proximo_dispositivo(self, agora):
+        vencidos = [d for d in self._dispositivos if d.proximo <= agora]
+        if not vencidos:
+            return None
+
+        if self.politica == 'prioridade':
+            return max(vencidos, key=lambda d: (d.prioridade, -d.proximo))
+
+        # Rodízio: o primeiro dispositivo vencido a partir da posição atual
+        n = len(self._dispositivos)
+        for k in range(n):
+            d = self._dispositivos[(self._indice_rodizio + k) % n]
+            if d.proximo <= agora:
+                self._indice_rodizio = (self._indice_rodizio + k + 1) % n
+                return d
+        return None
+
+    def executar_passo(self):
+        """Executa no máximo uma transação; retorna quanto tempo esperar até a próxima"""
+        with self._lock:
+            agora = time.monotonic()
+            if self._inicio is None:
+                self._inicio = agora
+            dispositivo = self._proximo_dispositivo(agora)
+            if dispositivo is None:
+                if not self._dispositivos:
+                    return 0.1
+                return max(0.0, min(d.proximo for d in self._dispositivos) - agora)
+
+            # Silêncio t3.5 desde o fim da transação anterior
+            espera = self._fim_ultima + self.gap - agora
+            if espera > 0:
+                time.sleep(espera)
+
+            inicio = time.monotonic()
+            if inicio - dispositivo.proximo > dispositivo.periodo:
+                dispositivo.atrasos += 1
+            registers = None
+            try:
+                response = self.client.read_holding_registers(
+                    address=dispositivo.address, count=dispositivo.count, slave=dispositivo.slave
+                )
+                if response.isError():
+                    print(f"Erro na resposta de {dispositivo.nome}: {response}")
+                    dispositivo.erros += 1
+                else:
+                    registers = response.registers
+                    dispositivo.leituras += 1
+            except Exception as e:
+                print(f"Erro em {dispositivo.nome}: {str(e)}")
+                dispositivo.erros += 1
+            timestamp = datetime.now()
+
+            self._fim_ultima = time.monotonic()
+            self._tempo_ocupado += self._fim_ultima - inicio + self.gap
+
+            # Próximo prazo na grade do dispositivo; se ficou para trás, não acumula rajadas
+            dispositivo.proximo += dispositivo.periodo
+            if dispositivo.proximo < self._fim_ultima:
+                dispositivo.proximo = self._fim_ultima
+
+        if dispositivo.ao_ler:
+            try:
+                dispositivo.ao_ler(dispositivo, registers, timestamp)
+            except Exception as e:
+                print(f"Erro no callback de {dispositivo.nome}: {str(e)}")
+        return 0.0
+
+    # --- Ciclo de vida ---
+
+    def iniciar(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, name="escalonador-rs485", daemon=True)
+        self._thread.start()
+
+    def parar(self, timeout=None):
+        self._parar.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self):
+        while not self._parar.is_set():
+            espera = self.executar_passo()
+            if espera > 0:
+                self._parar.wait(espera)
+
+    # --- Relatório ---
+
+    def estatisticas(self):
+        """Utilização obtida do barramento e taxa alcançada por dispositivo"""
+        with self._lock:
+            decorrido = time.monotonic() - self._inicio if self._inicio else 0.0
+            demanda = sum(d.taxa * tempo_transacao(d.count, self.baudrate) for d in self._dispositivos)
+            return {
+                'baudrate': self.baudrate,
+                'politica': self.politica,
+                'utilizacao': self._tempo_ocupado / decorrido if decorrido else 0.0,
+                # Fração do barramento que as taxas configuradas exigem só em tempo de fio
+                'utilizacao_teorica': demanda,
+                'dispositivos': {
+                    d.nome: {
+                        'slave': d.slave,
+                        'taxa_alvo': d.taxa,
+                        'taxa_obtida': d.leituras / decorrido if decorrido else 0.0,
+                        'leituras': d.leituras,
+                        'erros': d.erros,
+                        'atrasos': d.atrasos,
+                    }
+                    for d in self._dispositivos
+                },
+            }
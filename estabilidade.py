@@ -0,0 +1,273 @@
+"""Detector de estabilidade para o aceite das amostras de calibração.
+
+Uma amostra é aceita quando a janela dos últimos `janela` segundos que
+termina nela passa em todos os critérios:
+
+    - desvio padrão da irradiância até `desvio_maximo` (W/m²);
+    - tendência (inclinação da reta de mínimos quadrados da irradiância
+      contra o tempo) até `tendencia_maxima` em módulo (W/m² por s);
+    - angle_x e angle_y a no máximo `angulo_maximo` graus da referência em
+      todas as amostras da janela;
+    - irradiância válida (e acima de `irradiancia_minima`) em todas elas.
+
+A janela guarda somas deslizantes (n, Σt, Σy, Σt², Σty, Σy²) e contadores
+de amostras fora da tolerância, então cada amostra custa O(1): entra uma,
+saem as que ficaram velhas. As somas usam tempo e irradiância relativos a
+uma origem e são recalculadas do zero a cada volta completa da janela, o
+que limita o erro acumulado das subtrações.
+
+O detector marca a amostra (coluna `stable`: 1 aceita, 0 recusada) antes
+dos demais assinantes, de modo que a marca vai para o histórico, o
+armazenamento, o gráfico e a calibração. Cada sequência de amostras
+aceitas forma uma janela aceita, com as estatísticas de cada coluna;
+quando a sequência termina (ou a medição acaba, em `encerrar`), a janela é
+publicada como uma linha {timestamp (início), duration, <coluna>_mean,
+_min, _max, _std, _count} para os assinantes.
+"""
+import math
+import threading
+from collections import deque
+
+import numpy as np
+
+from agregacao import COLUNAS_VALORES, EstatisticaIncremental, colunas_agregadas
+
+# Coluna do histórico com a marca de aceite de cada amostra
+COLUNA_ESTAVEL = 'stable'
+
+
+def colunas_janelas(colunas=COLUNAS_VALORES):
+    """Esquema das janelas aceitas: timestamp (início) + duration (s) + <coluna>_<estatística>"""
+    return ['timestamp', 'duration'] + colunas_agregadas(colunas)[1:]
+
+
+COLUNAS_JANELAS = colunas_janelas()
+
+
+def bordas_estaveis(tempos, marcas):
+    """Pontos de mudança da marca de aceite, para desenhar as faixas aceitas em degraus ('hv').
+
+    Mantém a primeira e a última amostra e cada amostra cuja marca difere da
+    anterior; NaN (amostras anteriores ao detector) conta como recusada.
+    """
+    marcas = np.nan_to_num(np.asarray(marcas, dtype=np.float64), nan=0.0)
+    if not len(marcas):
+        return tempos[:0], marcas
+    indices = np.flatnonzero(np.r_[True, marcas[1:] != marcas[:-1]])
+    if indices[-1] != len(marcas) - 1:
+        indices = np.r_[indices, len(marcas) - 1]
+    return tempos[indices], marcas[indices]
+
+
+class DetectorEstabilidade:
+    """Aceite online das amostras: janela deslizante de `janela` s com variância e tendência em O(1).
+
+    `amostras_minimas` é o menor número de leituras válidas para avaliar a
+    janela; além disso a janela só é avaliada depois de `janela` segundos de
+    dados sem lacunas maiores que ela. Use None em `angulo_maximo` para não
+    verificar a inclinação do sensor.
+    """
+
+    def __init__(self, janela=60.0, desvio_maximo=5.0, tendencia_maxima=0.1, angulo_maximo=0.5,
+                 angulo_referencia=(0.0, 0.0), irradiancia_minima=None, amostras_minimas=10,
+                 colunas=COLUNAS_VALORES, historico_janelas=50):
+        self.janela = float(janela)
+        self.desvio_maximo = desvio_maximo
+        self.tendencia_maxima = tendencia_maxima
+        self.angulo_maximo = angulo_maximo
+        self.angulo_referencia = tuple(angulo_referencia)
+        self.irradiancia_minima = irradiancia_minima
+        self.amostras_minimas = amostras_minimas
+        self.colunas = list(colunas)
+        self.aceitas = 0
+        self.recusadas = 0
+        self._janelas = deque(maxlen=historico_janelas)  # últimas janelas aceitas fechadas
+        self._assinantes = []
+        self._lock = threading.Lock()
+        self._limpar()
+
+    def assinar(self, callback):
+        self._assinantes.append(callback)
+
+    def _limpar(self):
+        self._amostras = deque()  # (t, y ou None se inválida, fora da tolerância de inclinação)
+        self._invalidas = 0
+        self._inclinadas = 0
+        self._removidas = 0
+        self._desde = None        # início do trecho contínuo observado
+        self._origem = (0.0, 0.0)
+        self._zerar_somas()
+        self._estavel = False
+        self._motivo = "sem amostras"
+        self._desvio = math.nan
+        self._tendencia = math.nan
+        self._periodo = None      # (início, última amostra) da janela aceita em andamento
+        self._estatisticas = {c: EstatisticaIncremental() for c in self.colunas}
+
+    def _zerar_somas(self):
+        self._n = 0
+        self._st = self._sy = self._stt = self._sty = self._syy = 0.0
+
+    # --- Janela deslizante ---
+
+    def _somar(self, t, y, sinal):
+        t -= self._origem[0]
+        y -= self._origem[1]
+        self._n += sinal
+        self._st += sinal * t
+        self._sy += sinal * y
+        self._stt += sinal * t * t
+        self._sty += sinal * t * y
+        self._syy += sinal * y * y
+
+    def _recalcular(self):
+        """Refaz as somas a partir das amostras da janela, com a origem na mais antiga"""
+        self._zerar_somas()
+        validas = [(t, y) for t, y, _ in self._amostras if y is not None]
+        if validas:
+            self._origem = validas[0]
+        for t, y in validas:
+            self._somar(t, y, 1)
+        self._removidas = 0
+
+    def _entrar(self, t, y, inclinada):
+        if self._amostras and t - self._amostras[-1][0] > self.janela:
+            self._desde = None  # lacuna maior que a janela: recomeça a observação
+        if self._desde is None:
+            self._desde = t
+        self._amostras.append((t, y, inclinada))
+        if y is None:
+            self._invalidas += 1
+        else:
+            if self._n == 0:
+                self._origem = (t, y)
+            self._somar(t, y, 1)
+        if inclinada:
+            self._inclinadas += 1
+
+    def _sair(self, limite):
+        while self._amostras and self._amostras[0][0] <= limite:
+            t, y, inclinada = self._amostras.popleft()
+            if y is None:
+                self._invalidas -= 1
+            else:
+                self._somar(t, y, -1)
+            if inclinada:
+                self._inclinadas -= 1
+            self._removidas += 1
+        if self._removidas >= max(len(self._amostras), 1):
+            self._recalcular()
+
+    def _avaliar(self, t):
+        n = self._n
+        self._desvio = self._tendencia = math.nan
+        if n >= 2:
+            variancia_t = self._stt - self._st * self._st / n
+            self._desvio = math.sqrt(max(self._syy - self._sy * self._sy / n, 0.0) / (n - 1))
+            if variancia_t > 0:
+                self._tendencia = (self._sty - self._st * self._sy / n) / variancia_t
+
+        if t - self._desde < self.janela:
+            return False, f"observando há {t - self._desde:.0f} de {self.janela:.0f} s"
+        if self._invalidas:
+            return False, f"{self._invalidas} leituras de irradiância inválidas ou abaixo do mínimo"
+        if self._inclinadas:
+            return False, f"{self._inclinadas} leituras com inclinação fora da tolerância"
+        if n < max(self.amostras_minimas, 2):
+            return False, f"{n} amostras na janela (mínimo {self.amostras_minimas})"
+        if self.desvio_maximo is not None and self._desvio > self.desvio_maximo:
+            return False, f"desvio {self._desvio:.2f} W/m² > {self.desvio_maximo}"
+        if self.tendencia_maxima is not None and not abs(self._tendencia) <= self.tendencia_maxima:
+            return False, f"tendência {self._tendencia:+.3f} W/m²/s fora de ±{self.tendencia_maxima}"
+        return True, "estável"
+
+    def _fora_da_tolerancia(self, amostra):
+        if self.angulo_maximo is None:
+            return False
+        for coluna, referencia in zip(('angle_x', 'angle_y'), self.angulo_referencia):
+            angulo = amostra.get(coluna)
+            if angulo is None or not abs(angulo - referencia) <= self.angulo_maximo:
+                return True
+        return False
+
+    # --- Amostras ---
+
+    def adicionar(self, amostra):
+        """Avalia a janela que termina na amostra e grava a marca em amostra['stable']"""
+        y = amostra.get('irradiance')
+        if y is None or math.isnan(y) or (self.irradiancia_minima is not None and y < self.irradiancia_minima):
+            y = None
+        tempo = amostra['timestamp']
+        t = tempo.timestamp()
+        fechada = None
+        with self._lock:
+            self._entrar(t, y, self._fora_da_tolerancia(amostra))
+            self._sair(t - self.janela)
+            estavel, self._motivo = self._avaliar(t)
+            self._estavel = estavel
+            if estavel:
+                self.aceitas += 1
+                self._periodo = (self._periodo[0] if self._periodo else tempo, tempo)
+                for coluna, estatistica in self._estatisticas.items():
+                    estatistica.adicionar(amostra.get(coluna))
+            else:
+                self.recusadas += 1
+                fechada = self._fechar()
+        amostra[COLUNA_ESTAVEL] = 1.0 if estavel else 0.0
+        self._publicar(fechada)
+
+    def _linha(self):
+        inicio, fim = self._periodo
+        linha = {'timestamp': inicio, 'duration': (fim - inicio).total_seconds()}
+        for coluna, estatistica in self._estatisticas.items():
+            for nome, valor in estatistica.resultado().items():
+                linha[f'{coluna}_{nome}'] = valor
+        return linha
+
+    def _fechar(self):
+        if self._periodo is None:
+            return None
+        linha = self._linha()
+        for estatistica in self._estatisticas.values():
+            estatistica.reset()
+        self._periodo = None
+        self._janelas.append(linha)
+        return linha
+
+    def _publicar(self, linha):
+        if linha is None:
+            return
+        for callback in list(self._assinantes):
+            try:
+                callback(linha)
+            except Exception as e:
+                print(f"Erro no assinante do detector de estabilidade: {str(e)}")
+
+    def encerrar(self):
+        """Fim da medição: fecha e publica a janela aceita em andamento e recomeça a observação"""
+        with self._lock:
+            fechada = self._fechar()
+            self._limpar()
+        self._publicar(fechada)
+        return fechada
+
+    # --- Consultas ---
+
+    def estado(self):
+        """Situação da janela atual: aceite, motivo da recusa, desvio, tendência e amostras"""
+        with self._lock:
+            return {
+                'estavel': self._estavel,
+                'motivo': self._motivo,
+                'desvio': self._desvio,
+                'tendencia': self._tendencia,
+                'amostras': len(self._amostras),
+                'aceitas': self.aceitas,
+                'recusadas': self.recusadas,
+            }
+
+    def janelas(self):
+        """Janelas aceitas mais recentes primeiro, começando pela em andamento (se houver)"""
+        with self._lock:
+            atual = [self._linha()] if self._periodo is not None else []
+            return atual + list(reversed(self._janelas))
@@ -0,0 +1,254 @@
+"""Tempo gasto em cada etapa dos caminhos quentes e perfil (cProfile) sob demanda.
+
+O TemporizadorEtapas guarda, por etapa (leitura Modbus, decodificação,
+assinantes, montagem das tabelas, figura do gráfico, serialização...), a
+contagem, a soma e o máximo de todas as medições, os contadores de um
+histograma cumulativo para o Prometheus e as últimas AMOSTRAS_ETAPA
+durações, das quais saem os percentis (histograma rolante). Cada medição
+custa dois perf_counter e um append, então pode ficar sempre ligada.
+
+O PerfiladorSobDemanda roda sob cProfile as próximas N invocações de uma
+função instrumentada, escolhida em tempo de execução; ao terminar, grava o
+perfil (.prof, para pstats ou snakeviz) e um relatório em texto, prontos
+para download, sem reiniciar o app nem anexar um depurador.
+"""
+import cProfile
+import functools
+import io
+import os
+import pstats
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import nullcontext
+
+import numpy as np
+
+# Limites (segundos) do histograma cumulativo de cada etapa
+BUCKETS_ETAPA = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+AMOSTRAS_ETAPA = 1000  # durações recentes guardadas por etapa para os percentis
+
+LINHAS_RELATORIO = 40  # funções listadas no relatório em texto do perfil
+
+
+class HistogramaEtapa:
+    """Durações (em segundos) de uma etapa: totais, buckets cumulativos e janela das mais recentes"""
+
+    def __init__(self):
+        self.contagem = 0
+        self.soma = 0.0
+        self.maximo = 0.0
+        self.buckets = [0] * len(BUCKETS_ETAPA)
+        self._recentes = deque(maxlen=AMOSTRAS_ETAPA)
+
+    def registrar(self, duracao):
+        self.contagem += 1
+        self.soma += duracao
+        self.maximo = max(self.maximo, duracao)
+        for i, limite in enumerate(BUCKETS_ETAPA):
+            if duracao <= limite:
+                self.buckets[i] += 1
+        self._recentes.append(duracao)
+
+    def percentil(self, p):
+        return float(np.percentile(self._recentes, p)) if self._recentes else float('nan')
+
+    @property
+    def media_recente(self):
+        return float(np.mean(self._recentes)) if self._recentes else float('nan')
+
+
+class _Medicao:
+    """Context manager que registra a duração do bloco na etapa"""
+
+    __slots__ = ('temporizador', 'nome', 'inicio')
+
+    def __init__(self, temporizador, nome):
+        self.temporizador = temporizador
+        self.nome = nome
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, erro, traceback):
+        self.temporizador.registrar(self.nome, time.perf_counter() - self.inicio)
+        return False
+
+
+def medir(etapas, nome):
+    """etapas.medir(nome), ou um bloco sem medição quando não há temporizador"""
+    return nullcontext() if etapas is None else etapas.medir(nome)
+
+
+class TemporizadorEtapas:
+    """Histogramas rolantes do tempo de cada etapa, alimentados por `medir` ou pelas funções de `envolver`.
+
+    Com um `perfilador`, as funções instrumentadas por `envolver` (ou pelo
+    decorador `funcao`) podem ser escolhidas como alvo do perfil sob demanda.
+    """
+
+    def __init__(self, perfilador=None):
+        self.perfilador = perfilador
+        self._etapas = {}
+        self._funcoes = set()
+        self._lock = threading.Lock()
+
+    def medir(self, nome):
+        return _Medicao(self, nome)
+
+    def registrar(self, nome, duracao):
+        with self._lock:
+            etapa = self._etapas.get(nome)
+            if etapa is None:
+                etapa = self._etapas[nome] = HistogramaEtapa()
+            etapa.registrar(duracao)
+
+    def envolver(self, nome, funcao):
+        """Versão de `funcao` que mede cada chamada na etapa `nome` (e pode ser perfilada)"""
+        self._funcoes.add(nome)
+
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                if self.perfilador is not None and self.perfilador.alvo == nome:
+                    return self.perfilador.executar(nome, funcao, args, kwargs)
+                return funcao(*args, **kwargs)
+            finally:
+                self.registrar(nome, time.perf_counter() - inicio)
+
+        return medida
+
+    def funcao(self, nome):
+        """Decorador equivalente a envolver(nome, funcao)"""
+        return lambda funcao: self.envolver(nome, funcao)
+
+    def funcoes(self):
+        """Nomes das funções instrumentadas, candidatas ao perfil sob demanda"""
+        return sorted(self._funcoes)
+
+    def resumo(self):
+        """Por etapa: contagem, média e percentis das durações recentes, máximo e tempo total"""
+        with self._lock:
+            return {
+                nome: {
+                    'contagem': e.contagem,
+                    'media_ms': e.media_recente * 1000,
+                    'p50_ms': e.percentil(50) * 1000,
+                    'p99_ms': e.percentil(99) * 1000,
+                    'maximo_ms': e.maximo * 1000,
+                    'total_s': e.soma,
+                }
+                for nome, e in sorted(self._etapas.items())
+            }
+
+    def prometheus(self, metrica='stage_duration_seconds', ajuda='Time spent in each hot-path stage.'):
+        """Histograma por etapa no formato texto de exposição do Prometheus (versão 0.0.4)"""
+        linhas = [f'# HELP {metrica} {ajuda}', f'# TYPE {metrica} histogram']
+        with self._lock:
+            for nome, e in sorted(self._etapas.items()):
+                for limite, quantidade in zip(BUCKETS_ETAPA, e.buckets):
+                    linhas.append(f'{metrica}_bucket{{stage="{nome}",le="{limite:g}"}} {quantidade}')
+                linhas.append(f'{metrica}_bucket{{stage="{nome}",le="+Inf"}} {e.contagem}')
+                linhas.append(f'{metrica}_sum{{stage="{nome}"}} {e.soma!r}')
+                linhas.append(f'{metrica}_count{{stage="{nome}"}} {e.contagem}')
+        return '\n'.join(linhas) + '\n'
+
+
+class CapturaPerfil:
+    """Perfil das próximas `invocacoes` chamadas de uma função instrumentada"""
+
+    def __init__(self, nome, invocacoes, diretorio):
+        self.id = uuid.uuid4().hex
+        self.nome = nome
+        self.invocacoes = invocacoes
+        self.feitas = 0
+        self.estado = 'armado'  # armado -> concluido | cancelado
+        self.criado = time.time()
+        self.perfil = cProfile.Profile()
+        base = os.path.join(diretorio, f"perfil_{nome.replace('.', '_')}_{self.id[:8]}")
+        self.caminhos = {'prof': base + '.prof', 'txt': base + '.txt'}
+
+    def nome_arquivo(self, formato):
+        return os.path.basename(self.caminhos[formato])
+
+
+class PerfiladorSobDemanda:
+    """Roda sob cProfile as próximas N invocações da função escolhida e guarda o resultado.
+
+    Enquanto uma captura está armada, as invocações do alvo rodam uma de cada
+    vez (o cProfile mede só a thread em que foi ligado); as demais funções
+    não são afetadas. Só uma captura fica armada por vez.
+    """
+
+    def __init__(self, diretorio=None, max_capturas=20):
+        self.diretorio = diretorio or tempfile.mkdtemp(prefix='perfil_')
+        self._capturas = deque(maxlen=max_capturas)
+        self._atual = None
+        self._lock = threading.Lock()
+        self._lock_execucao = threading.RLock()
+        self._profundidade = 0
+
+    @property
+    def alvo(self):
+        atual = self._atual
+        return atual.nome if atual is not None else None
+
+    def armar(self, nome, invocacoes=20):
+        if invocacoes < 1:
+            raise ValueError("O perfil precisa de pelo menos uma invocação")
+        captura = CapturaPerfil(nome, int(invocacoes), self.diretorio)
+        with self._lock:
+            if self._atual is not None:
+                self._atual.estado = 'cancelado'
+            self._atual = captura
+            self._capturas.append(captura)
+        return captura
+
+    def cancelar(self):
+        with self._lock:
+            if self._atual is not None:
+                self._atual.estado = 'cancelado'
+            self._atual = None
+
+    def executar(self, nome, funcao, args, kwargs):
+        with self._lock_execucao:
+            captura = self._atual
+            if captura is None or captura.nome != nome or self._profundidade:
+                # Desarmado enquanto esperava, ou chamada aninhada já dentro do perfil
+                return funcao(*args, **kwargs)
+            self._profundidade += 1
+            captura.perfil.enable()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                captura.perfil.disable()
+                self._profundidade -= 1
+                captura.feitas += 1
+                if captura.feitas >= captura.invocacoes:
+                    self._concluir(captura)
+
+    def _concluir(self, captura):
+        with self._lock:
+            if self._atual is captura:
+                self._atual = None
+        try:
+            captura.perfil.dump_stats(captura.caminhos['prof'])
+            texto = io.StringIO()
+            texto.write(f"{captura.nome}: {captura.feitas} invocações\n\n")
+            pstats.Stats(captura.perfil, stream=texto).sort_stats('cumulative').print_stats(LINHAS_RELATORIO)
+            with open(captura.caminhos['txt'], 'w', encoding='utf-8') as arquivo:
+                arquivo.write(texto.getvalue())
+            captura.estado = 'concluido'
+        except Exception as e:
+            print(f"Erro ao gravar o perfil de {captura.nome}: {str(e)}")
+            captura.estado = 'erro'
+        captura.perfil = None
+
+    def obter(self, captura_id):
+        with self._lock:
+            return next((c for c in self._capturas if c.id == captura_id), None)
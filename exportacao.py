@@ -0,0 +1,199 @@
+import csv
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from etapas import medir
+
+FORMATOS = ('xlsx', 'csv', 'parquet')
+
+# Linhas por planilha do Excel (1.048.576, incluindo o cabeçalho)
+MAX_LINHAS_XLSX = 1_048_576
+
+# Trabalhos de exportação em andamento ou concluídos, por id
+_trabalhos = {}
+_lock_trabalhos = threading.Lock()
+
+
+def _timestamps_como_texto(timestamps):
+    """datetime64 -> 'YYYY-MM-DD HH:MM:SS.mmm': os milissegundos distinguem as amostras de um mesmo segundo"""
+    return np.char.replace(np.datetime_as_string(timestamps, unit='ms'), 'T', ' ')
+
+
+class TrabalhoExportacao:
+    """Exportação executada em segundo plano, lendo o armazenamento em pedaços.
+
+    As linhas são lidas de `fonte` (um Armazenamento) com iterar_intervalo e
+    escritas direto no arquivo de destino, sem montar o histórico inteiro em
+    memória. O progresso fica em `progresso` (0 a 1) para a interface. Com
+    `etapas` (um TemporizadorEtapas), a contagem, a leitura dos pedaços e a
+    escrita no formato escolhido são medidas.
+    """
+
+    def __init__(self, fonte, formato='xlsx', inicio=None, fim=None, colunas=None, tamanho_pedaco=10000,
+                 etapas=None):
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato inválido: {formato} (use {FORMATOS})")
+        self.id = uuid.uuid4().hex
+        self.fonte = fonte
+        self.formato = formato
+        self.inicio = inicio
+        self.fim = fim
+        self.colunas = ['timestamp'] + [c for c in (colunas or fonte.colunas) if c != 'timestamp']
+        self.tamanho_pedaco = tamanho_pedaco
+        self.etapas = etapas
+
+        self.estado = 'pendente'  # pendente -> executando -> concluido | erro
+        self.erro = None
+        self.linhas = 0
+        self.total = 0
+        self.criado = time.time()
+        self._diretorio = tempfile.mkdtemp(prefix='exportacao_')
+        self.caminho = os.path.join(self._diretorio, self.nome_arquivo)
+
+    @property
+    def nome_arquivo(self):
+        return f"dados_piranometro.{self.formato}"
+
+    @property
+    def progresso(self):
+        if self.estado == 'concluido':
+            return 1.0
+        return self.linhas / self.total if self.total else 0.0
+
+    def executar(self):
+        self.estado = 'executando'
+        try:
+            if hasattr(self.fonte, 'flush'):
+                self.fonte.flush(timeout=10)  # inclui as amostras ainda na fila de gravação
+            with medir(self.etapas, 'exportacao.contagem'):
+                self.total = self.fonte.contar(self.inicio, self.fim)
+            pedacos = self._medir_leitura(
+                self.fonte.iterar_intervalo(self.inicio, self.fim, self.colunas, self.tamanho_pedaco))
+            inicio = time.perf_counter()
+            getattr(self, f'_escrever_{self.formato}')(pedacos)
+            if self.etapas is not None:
+                # A escrita é o tempo do escritor menos o gasto lendo os pedaços
+                self.etapas.registrar(f'exportacao.escrita_{self.formato}',
+                                      time.perf_counter() - inicio - self._tempo_leitura)
+            self.estado = 'concluido'
+        except Exception as e:
+            print(f"Erro na exportação: {str(e)}")
+            self.erro = str(e)
+            self.estado = 'erro'
+
+    def _medir_leitura(self, pedacos):
+        """Repassa os pedaços acumulando o tempo gasto em cada leitura do armazenamento"""
+        self._tempo_leitura = 0.0
+        pedacos = iter(pedacos)
+        while True:
+            inicio = time.perf_counter()
+            try:
+                pedaco = next(pedacos)
+            except StopIteration:
+                return
+            finally:
+                duracao = time.perf_counter() - inicio
+                self._tempo_leitura += duracao
+                if self.etapas is not None:
+                    self.etapas.registrar('exportacao.leitura', duracao)
+            yield pedaco
+
+    def remover(self):
+        shutil.rmtree(self._diretorio, ignore_errors=True)
+
+    # --- Escritores por formato ---
+
+    def _escrever_xlsx(self, pedacos):
+        import xlsxwriter
+
+        # constant_memory: cada linha vai para o disco assim que a próxima começa
+        workbook = xlsxwriter.Workbook(self.caminho, {'constant_memory': True})
+        try:
+            worksheet, linha = None, MAX_LINHAS_XLSX
+            for pedaco in pedacos:
+                textos = _timestamps_como_texto(pedaco['timestamp'])
+                numeros = [pedaco[c] for c in self.colunas[1:]]
+                for i in range(len(textos)):
+                    if linha >= MAX_LINHAS_XLSX:
+                        # Planilha cheia (o xlsxwriter descartaria as linhas seguintes): continua na próxima
+                        worksheet = workbook.add_worksheet()
+                        worksheet.write_row(0, 0, self.colunas)
+                        linha = 1
+                    worksheet.write_string(linha, 0, textos[i])
+                    for j, coluna in enumerate(numeros, start=1):
+                        valor = coluna[i]
+                        if not np.isnan(valor):  # NaN vira célula vazia, como no pandas
+                            worksheet.write_number(linha, j, valor)
+                    linha += 1
+                self.linhas += len(textos)
+            if worksheet is None:
+                # Intervalo vazio: só o cabeçalho
+                workbook.add_worksheet().write_row(0, 0, self.colunas)
+        finally:
+            workbook.close()
+
+    def _escrever_csv(self, pedacos):
+        with open(self.caminho, 'w', newline='', encoding='utf-8') as arquivo:
+            writer = csv.writer(arquivo)
+            writer.writerow(self.colunas)
+            for pedaco in pedacos:
+                textos = _timestamps_como_texto(pedaco['timestamp'])
+                numeros = [pedaco[c] for c in self.colunas[1:]]
+                writer.writerows(
+                    [textos[i]] + ['' if np.isnan(coluna[i]) else repr(float(coluna[i])) for coluna in numeros]
+                    for i in range(len(textos))
+                )
+                self.linhas += len(textos)
+
+    def _escrever_parquet(self, pedacos):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for pedaco in pedacos:
+                tabela = pa.table({c: pa.array(pedaco[c]) for c in self.colunas})
+                if writer is None:
+                    writer = pq.ParquetWriter(self.caminho, tabela.schema)
+                writer.write_table(tabela)
+                self.linhas += tabela.num_rows
+            if writer is None:
+                # Intervalo vazio: grava só o esquema
+                tabela = pa.table({c: pa.array([], type=pa.timestamp('us') if c == 'timestamp' else pa.float64())
+                                   for c in self.colunas})
+                pq.write_table(tabela, self.caminho)
+        finally:
+            if writer is not None:
+                writer.close()
+
+
+def iniciar_exportacao(fonte, formato='xlsx', inicio=None, fim=None, colunas=None, etapas=None):
+    """Cria e dispara um trabalho de exportação em segundo plano; retorna o trabalho"""
+    trabalho = TrabalhoExportacao(fonte, formato, inicio, fim, colunas, etapas=etapas)
+    with _lock_trabalhos:
+        _trabalhos[trabalho.id] = trabalho
+    threading.Thread(target=trabalho.executar, name=f"exportacao-{trabalho.id[:8]}", daemon=True).start()
+    return trabalho
+
+
+def obter_exportacao(trabalho_id):
+    with _lock_trabalhos:
+        return _trabalhos.get(trabalho_id)
+
+
+def limpar_exportacoes(idade_maxima=3600):
+    """Remove trabalhos (e arquivos) terminados há mais de `idade_maxima` segundos"""
+    agora = time.time()
+    with _lock_trabalhos:
+        antigos = [t for t in _trabalhos.values()
+                   if t.estado in ('concluido', 'erro') and agora - t.criado > idade_maxima]
+        for trabalho in antigos:
+            del _trabalhos[trabalho.id]
+    for trabalho in antigos:
+        trabalho.remover()
@@ -0,0 +1,272 @@
+"""Gateway Modbus TCP local com os últimos registros lidos do barramento serial.
+
+Outros programas da bancada (SCADA, cr1000MB.py, scripts) leem os mesmos
+dados sem abrir a porta serial nem gerar tráfego extra no barramento: cada
+leitura do motor de aquisição atualiza um cache em memória e o servidor
+responde a partir dele.
+
+Cada dispositivo vira uma unidade (unit id) do servidor:
+
+    holding registers (FC03)  registros crus, nos endereços originais do instrumento
+    input registers (FC04)    idade em ms de cada holding register no mesmo endereço
+                              (65535 = nunca lido ou mais velho que 65,5 s)
+    input registers 60000+    resumo: estado (0 atual, 1 velho, 2 sem dados),
+                              idade da última leitura em ms (uint32),
+                              leituras recebidas (uint32) e idade máxima em ms (uint32)
+
+Os uint32 vão com a palavra mais significativa primeiro. Ler um endereço
+que o motor nunca leu devolve a exceção 0x02 (endereço inválido) e ler
+registros mais velhos que `idade_maxima` devolve 0x0B (o dispositivo
+atrás do gateway não respondeu); uma unidade desconhecida devolve 0x0A.
+Escritas são recusadas com 0x01: o gateway é só de leitura e nunca
+repassa requisições ao barramento.
+"""
+import asyncio
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from pymodbus.datastore import ModbusServerContext
+from pymodbus.datastore.context import ModbusBaseSlaveContext
+from pymodbus.pdu import ExceptionResponse
+from pymodbus.server import ModbusTcpServer
+
+# Unidades do gateway para cada dispositivo do motor de aquisição
+UNIDADES_PADRAO = {'piranometro': 1, 'cr1000': 2}
+
+# Endereço (input registers) do bloco de resumo de cada unidade
+ENDERECO_RESUMO = 60000
+
+IDADE_SATURADA = 0xFFFF
+ESTADO_ATUAL, ESTADO_VELHO, ESTADO_SEM_DADOS = 0, 1, 2
+
+
+def _uint32(valor):
+    valor = min(int(valor), 0xFFFFFFFF)
+    return [valor >> 16, valor & 0xFFFF]
+
+
+class RegistrosDispositivo:
+    """Espaço de registros de um dispositivo: último valor e instante de leitura de cada endereço"""
+
+    def __init__(self):
+        self.valores = np.zeros(65536, dtype=np.uint16)
+        self.instantes = np.full(65536, np.nan)
+        self.leituras = 0
+        self.ultima = None
+
+
+class CacheRegistros:
+    """Últimos registros crus de cada dispositivo, atualizados pelo motor de aquisição.
+
+    `atualizar` tem a mesma forma de `EscritorCaptura.gravar` e é chamado
+    pela ConexaoDispositivo a cada bloco lido com sucesso; os instantes são
+    do relógio monotônico.
+    """
+
+    def __init__(self):
+        self._dispositivos = {}
+        self._lock = threading.Lock()
+
+    def atualizar(self, dispositivo, instante, endereco, registers):
+        with self._lock:
+            registros = self._dispositivos.get(dispositivo)
+            if registros is None:
+                registros = self._dispositivos[dispositivo] = RegistrosDispositivo()
+            fim = endereco + len(registers)
+            registros.valores[endereco:fim] = registers
+            registros.instantes[endereco:fim] = instante
+            registros.leituras += 1
+            registros.ultima = instante
+
+    def ler(self, dispositivo, endereco, quantidade):
+        """(registros, instantes) de um intervalo de endereços, ou None se o dispositivo nunca foi lido"""
+        with self._lock:
+            registros = self._dispositivos.get(dispositivo)
+            if registros is None:
+                return None
+            fim = endereco + quantidade
+            return registros.valores[endereco:fim].copy(), registros.instantes[endereco:fim].copy()
+
+    def resumo(self, dispositivo):
+        """(leituras recebidas, instante da última) de um dispositivo"""
+        with self._lock:
+            registros = self._dispositivos.get(dispositivo)
+            return (0, None) if registros is None else (registros.leituras, registros.ultima)
+
+
+class UnidadeGateway(ModbusBaseSlaveContext):
+    """Contexto do pymodbus que responde por um dispositivo a partir do cache"""
+
+    def __init__(self, cache, dispositivo, idade_maxima, contadores):
+        self.cache = cache
+        self.dispositivo = dispositivo
+        self.idade_maxima = idade_maxima
+        self._contadores = contadores
+
+    def reset(self):
+        pass
+
+    def getValues(self, fc_as_hex, address, count=1):
+        self._contadores['requisicoes', self.dispositivo] += 1
+        if fc_as_hex == 3:
+            resposta = self._holding(address, count)
+        elif fc_as_hex == 4:
+            resposta = self._input(address, count)
+        else:
+            resposta = ExceptionResponse.ILLEGAL_FUNCTION
+        if isinstance(resposta, int):
+            self._contadores['excecoes', self.dispositivo] += 1
+        return resposta
+
+    def setValues(self, fc_as_hex, address, values):
+        self._contadores['requisicoes', self.dispositivo] += 1
+        self._contadores['excecoes', self.dispositivo] += 1
+        return ExceptionResponse.ILLEGAL_FUNCTION
+
+    def _holding(self, address, count):
+        lidos = self.cache.ler(self.dispositivo, address, count)
+        if lidos is None or len(lidos[0]) < count or np.isnan(lidos[1]).any():
+            return ExceptionResponse.ILLEGAL_ADDRESS
+        valores, instantes = lidos
+        if self.idade_maxima is not None and time.monotonic() - instantes.min() > self.idade_maxima:
+            return ExceptionResponse.GATEWAY_NO_RESPONSE
+        return valores.tolist()
+
+    def _input(self, address, count):
+        if address >= ENDERECO_RESUMO:
+            resumo = self._resumo()
+            inicio = address - ENDERECO_RESUMO
+            if inicio + count > len(resumo):
+                return ExceptionResponse.ILLEGAL_ADDRESS
+            return resumo[inicio:inicio + count]
+
+        lidos = self.cache.ler(self.dispositivo, address, count)
+        if lidos is None or len(lidos[0]) < count:
+            return [IDADE_SATURADA] * count if lidos is None else ExceptionResponse.ILLEGAL_ADDRESS
+        idades = (time.monotonic() - lidos[1]) * 1000.0
+        idades = np.where(np.isnan(idades), IDADE_SATURADA, np.clip(idades, 0, IDADE_SATURADA))
+        return idades.astype(np.uint16).tolist()
+
+    def _resumo(self):
+        leituras, ultima = self.cache.resumo(self.dispositivo)
+        idade_maxima_ms = 0 if self.idade_maxima is None else self.idade_maxima * 1000.0
+        if ultima is None:
+            return [ESTADO_SEM_DADOS, *_uint32(0xFFFFFFFF), *_uint32(0), *_uint32(idade_maxima_ms)]
+        idade = time.monotonic() - ultima
+        velho = self.idade_maxima is not None and idade > self.idade_maxima
+        return [ESTADO_VELHO if velho else ESTADO_ATUAL, *_uint32(idade * 1000.0),
+                *_uint32(leituras), *_uint32(idade_maxima_ms)]
+
+
+class UnidadeDesconhecida(ModbusBaseSlaveContext):
+    """Responde 0x0A a unidades sem dispositivo (o pymodbus devolveria um quadro inválido)"""
+
+    def reset(self):
+        pass
+
+    def getValues(self, fc_as_hex, address, count=1):
+        return ExceptionResponse.GATEWAY_PATH_UNAVIABLE
+
+    def setValues(self, fc_as_hex, address, values):
+        return ExceptionResponse.GATEWAY_PATH_UNAVIABLE
+
+
+class ContextoGateway(ModbusServerContext):
+    """Unidades do gateway; qualquer outra unidade cai em UnidadeDesconhecida"""
+
+    def __init__(self, unidades):
+        super().__init__(slaves=unidades, single=False)
+        self._desconhecida = UnidadeDesconhecida()
+
+    def __getitem__(self, slave):
+        return self._slaves.get(slave, self._desconhecida)
+
+
+class ServidorGateway:
+    """Servidor Modbus TCP (numa thread própria) que expõe o CacheRegistros.
+
+    Por padrão escuta só em localhost; a porta 5020 evita precisar de root
+    para a 502. `idade_maxima` (s) é a idade a partir da qual um registro
+    deixa de ser servido (None = sempre servir o último valor).
+    """
+
+    def __init__(self, cache, unidades=None, host='127.0.0.1', porta=5020, idade_maxima=10.0):
+        self.cache = cache
+        self.unidades = dict(unidades or UNIDADES_PADRAO)
+        self.host = host
+        self.porta = porta
+        self.idade_maxima = idade_maxima
+        self._contadores = Counter()
+        self._loop = None
+        self._servidor = None
+        self._thread = None
+        self._pronto = threading.Event()
+
+    def iniciar(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._pronto.clear()
+        self._thread = threading.Thread(target=self._executar, daemon=True, name='gateway-modbus')
+        self._thread.start()
+        self._pronto.wait(5.0)
+
+    def parar(self, timeout=5.0):
+        if self._loop is None or self._servidor is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._servidor.shutdown(), self._loop).result(timeout)
+        except Exception as e:
+            print(f"Erro ao parar o gateway Modbus: {str(e)}")
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _executar(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._servir())
+        except Exception as e:
+            print(f"Erro no gateway Modbus: {str(e)}")
+        finally:
+            self._pronto.set()
+            self._loop.close()
+
+    async def _servir(self):
+        unidades = {
+            unidade: UnidadeGateway(self.cache, dispositivo, self.idade_maxima, self._contadores)
+            for dispositivo, unidade in self.unidades.items()
+        }
+        self._servidor = ModbusTcpServer(ContextoGateway(unidades), address=(self.host, self.porta))
+        await self._servidor.listen()
+        print(f"Gateway Modbus TCP em {self.host}:{self.porta} (unidades {self.unidades})")
+        self._pronto.set()
+        await self._servidor.serving
+
+    def prometheus(self):
+        """Métricas no formato texto de exposição do Prometheus (versão 0.0.4)"""
+        linhas = [
+            '# HELP gateway_requests_total Modbus TCP requests answered from the register cache.',
+            '# TYPE gateway_requests_total counter',
+        ]
+        for dispositivo in sorted(self.unidades):
+            linhas.append(f'gateway_requests_total{{device="{dispositivo}"}} '
+                          f'{self._contadores["requisicoes", dispositivo]}')
+        linhas += [
+            '# HELP gateway_exceptions_total Gateway requests answered with a Modbus exception.',
+            '# TYPE gateway_exceptions_total counter',
+        ]
+        for dispositivo in sorted(self.unidades):
+            linhas.append(f'gateway_exceptions_total{{device="{dispositivo}"}} '
+                          f'{self._contadores["excecoes", dispositivo]}')
+        linhas += [
+            '# HELP gateway_register_age_seconds Age of the latest cached read of each device.',
+            '# TYPE gateway_register_age_seconds gauge',
+        ]
+        agora = time.monotonic()
+        for dispositivo in sorted(self.unidades):
+            _, ultima = self.cache.resumo(dispositivo)
+            if ultima is not None:
+                linhas.append(f'gateway_register_age_seconds{{device="{dispositivo}"}} {agora - ultima!r}')
+        return '\n'.join(linhas) + '\n'
@@ -0,0 +1,228 @@
+"""Índice de agregados em várias resoluções, para consultas rápidas de intervalos longos.
+
+Cada amostra atualiza, em O(1), um AgregadorJanela por resolução (1 s, 1 min
+e 1 h); cada intervalo fechado vira uma linha com média, mínimo, máximo,
+desvio e contagem de cada coluna numa tabela SQLite própria, indexada pelo
+timestamp. Uma consulta de semanas lê então algumas centenas ou milhares de
+linhas já agregadas, em vez de varrer milhões de amostras brutas.
+
+Na inicialização, os intervalos que faltam nas tabelas (amostras gravadas
+antes de o índice existir ou de o app ser reiniciado) são reconstruídos em
+segundo plano a partir do armazenamento bruto. O intervalo em andamento na
+inicialização só conta as amostras novas.
+"""
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from agregacao import AgregadorJanela, COLUNAS_VALORES, colunas_agregadas
+from armazenamento import ArmazenamentoSQLite
+
+# Nome -> período em segundos, da mais fina para a mais grossa
+RESOLUCOES = {'1s': 1, '1min': 60, '1h': 3600}
+
+# Estatísticas devolvidas pelas consultas (as tabelas guardam também desvio e contagem)
+ESTATISTICAS_CONSULTA = ('mean', 'min', 'max')
+
+# Amostras brutas lidas por vez na reconstrução
+TAMANHO_RECONSTRUCAO = 200_000
+
+# Maior número de amostras brutas devolvidas por uma consulta 'raw'
+MAX_LINHAS_BRUTAS = 200_000
+
+
+def agregar_intervalos(tempos, valores, periodo):
+    """Estatísticas por intervalo de `periodo` s de um trecho ordenado de amostras (vetorizado).
+
+    `tempos` é datetime64[us] e `valores` um dict coluna -> array float64;
+    devolve um dict no esquema de colunas_agregadas, com o início de cada
+    intervalo em 'timestamp' e as mesmas estatísticas da EstatisticaIncremental.
+    Os intervalos seguem as fronteiras do AgregadorJanela (relógio local, agregacao.EPOCA).
+    """
+    periodo_us = int(periodo * 1_000_000)
+    indices = tempos.astype(np.int64) // periodo_us
+    inicios = np.flatnonzero(np.r_[True, indices[1:] != indices[:-1]])
+    linhas = {'timestamp': (indices[inicios] * periodo_us).astype('datetime64[us]')}
+    for coluna, v in valores.items():
+        validos = ~np.isnan(v)
+        count = np.add.reduceat(validos.astype(np.int64), inicios)
+        soma = np.add.reduceat(np.where(validos, v, 0.0), inicios)
+        soma2 = np.add.reduceat(np.where(validos, v * v, 0.0), inicios)
+        minimo = np.minimum.reduceat(np.where(validos, v, np.inf), inicios)
+        maximo = np.maximum.reduceat(np.where(validos, v, -np.inf), inicios)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            media = soma / count
+            variancia = np.maximum((soma2 - soma * media) / (count - 1), 0.0)
+        vazio = count == 0
+        linhas[f'{coluna}_mean'] = np.where(vazio, np.nan, media)
+        linhas[f'{coluna}_min'] = np.where(vazio, np.nan, minimo)
+        linhas[f'{coluna}_max'] = np.where(vazio, np.nan, maximo)
+        linhas[f'{coluna}_std'] = np.where(count > 1, np.sqrt(variancia), np.where(vazio, np.nan, 0.0))
+        linhas[f'{coluna}_count'] = count.astype(np.float64)
+    return linhas
+
+
+class IndiceAgregados:
+    """Agregados de 1 s, 1 min e 1 h mantidos a cada amostra, com consulta por intervalo.
+
+    `bruto` é o armazenamento das amostras brutas, usado na reconstrução e
+    nas consultas com resolução 'raw', limitadas a `max_linhas_brutas`
+    amostras. Com resolução 'auto', a consulta usa a resolução mais fina que
+    devolve no máximo `max_pontos` intervalos.
+    """
+
+    def __init__(self, caminho, bruto=None, resolucoes=RESOLUCOES, colunas=COLUNAS_VALORES, max_pontos=2000,
+                 max_linhas_brutas=MAX_LINHAS_BRUTAS):
+        self.bruto = bruto
+        self.max_linhas_brutas = max_linhas_brutas
+        self.resolucoes = dict(resolucoes)
+        self.colunas = list(colunas)
+        self.max_pontos = max_pontos
+        self.reconstruidos = 0  # intervalos recuperados do armazenamento bruto
+        self._agregadores = {}
+        self._armazenamentos = {}
+        for nome, periodo in self.resolucoes.items():
+            armazenamento = ArmazenamentoSQLite(caminho, sincronismo='NORMAL', tabela=f'agregados_{nome}',
+                                                colunas=colunas_agregadas(self.colunas),
+                                                lote=max(1, int(60 / periodo)), intervalo_flush=10.0)
+            agregador = AgregadorJanela(periodo, self.colunas)
+            agregador.assinar(armazenamento.append)
+            self._armazenamentos[nome] = armazenamento
+            self._agregadores[nome] = agregador
+        # Amostras anteriores a este instante ficam a cargo da reconstrução, a partir do último
+        # intervalo gravado em cada tabela (lido antes de qualquer linha nova ser gravada)
+        self._inicio = datetime.now()
+        self._ultimos = {nome: a.limites()[1] for nome, a in self._armazenamentos.items()}
+        self._thread = None
+
+    def adicionar(self, amostra):
+        for agregador in self._agregadores.values():
+            agregador.adicionar(amostra)
+
+    def iniciar(self):
+        for armazenamento in self._armazenamentos.values():
+            armazenamento.iniciar()
+        if self.bruto is not None:
+            self._thread = threading.Thread(target=self.reconstruir, name="agregados-reconstrucao", daemon=True)
+            self._thread.start()
+
+    def fechar(self, timeout=None):
+        for armazenamento in self._armazenamentos.values():
+            armazenamento.fechar(timeout)
+
+    def apagar(self):
+        """Remove os intervalos gravados em todas as resoluções (antes de iniciar)"""
+        for nome, armazenamento in self._armazenamentos.items():
+            armazenamento.apagar()
+            self._ultimos[nome] = None
+
+    # --- Reconstrução a partir das amostras brutas ---
+
+    def reconstruir(self):
+        """Agrega as amostras brutas dos intervalos completos ainda ausentes de cada tabela"""
+        for nome, periodo in self.resolucoes.items():
+            try:
+                self._reconstruir(nome, periodo)
+            except Exception as e:
+                print(f"Erro ao reconstruir os agregados de {nome}: {str(e)}")
+
+    def _reconstruir(self, nome, periodo):
+        armazenamento = self._armazenamentos[nome]
+        periodo_us = int(periodo * 1_000_000)
+        # Do intervalo seguinte ao último gravado até o intervalo em andamento na inicialização
+        ultimo = self._ultimos[nome]
+        inicio = None if ultimo is None else ultimo + np.timedelta64(periodo_us, 'us')
+        corte = int(np.datetime64(self._inicio, 'us').astype(np.int64)) // periodo_us * periodo_us
+        fim = np.datetime64(corte - 1, 'us')
+        if inicio is not None and inicio > fim:
+            return
+
+        resto = None  # amostras do último intervalo do trecho, que pode continuar no próximo
+        for trecho in self.bruto.iterar_intervalo(inicio, fim, self.colunas, tamanho=TAMANHO_RECONSTRUCAO):
+            if resto is not None:
+                trecho = {c: np.concatenate([resto[c], trecho[c]]) for c in trecho}
+            tempos = trecho['timestamp']
+            if not len(tempos):
+                continue
+            ultimo_indice = tempos[-1].astype(np.int64) // periodo_us
+            k = np.searchsorted(tempos.astype(np.int64) // periodo_us, ultimo_indice)
+            resto = {c: v[k:] for c, v in trecho.items()}
+            self._gravar_reconstrucao(armazenamento, trecho, k, periodo)
+        if resto is not None:
+            self._gravar_reconstrucao(armazenamento, resto, len(resto['timestamp']), periodo)
+
+    def _gravar_reconstrucao(self, armazenamento, trecho, n, periodo):
+        if n == 0:
+            return
+        linhas = agregar_intervalos(trecho['timestamp'][:n], {c: trecho[c][:n] for c in self.colunas}, periodo)
+        armazenamento.inserir(linhas)
+        self.reconstruidos += len(linhas['timestamp'])
+
+    # --- Consultas ---
+
+    def escolher_resolucao(self, inicio=None, fim=None):
+        """Resolução mais fina com no máximo `max_pontos` intervalos em [inicio, fim]"""
+        nomes = list(self.resolucoes)
+        fim = datetime.now() if fim is None else fim
+        if inicio is None:
+            # O primeiro intervalo de qualquer tabela serve; a mais grossa é a menor
+            primeiro = next((p for p in (self._armazenamentos[n].limites()[0] for n in reversed(nomes))
+                             if p is not None), None)
+            if primeiro is None:
+                return nomes[0]
+            inicio = primeiro
+        duracao = (np.datetime64(fim, 'us') - np.datetime64(inicio, 'us')) / np.timedelta64(1, 's')
+        for nome in nomes:
+            if duracao / self.resolucoes[nome] <= self.max_pontos:
+                return nome
+        return nomes[-1]
+
+    def consultar(self, inicio=None, fim=None, colunas=None, resolucao='auto'):
+        """Série de [inicio, fim] na resolução pedida: (resolução usada, dict coluna -> array).
+
+        Nas resoluções agregadas cada coluna vira <coluna>_mean, _min e _max,
+        com o início do intervalo em 'timestamp'; o intervalo em andamento
+        entra com as estatísticas parciais. 'raw' devolve as amostras brutas.
+        """
+        colunas = colunas or self.colunas
+        desconhecidas = [c for c in colunas if c not in self.colunas]
+        if desconhecidas:
+            raise ValueError(f"Colunas desconhecidas: {desconhecidas}")
+        if resolucao == 'auto':
+            resolucao = self.escolher_resolucao(inicio, fim)
+        if resolucao == 'raw':
+            if self.bruto is None:
+                raise ValueError("Resolução 'raw' indisponível sem o armazenamento bruto")
+            linhas = self.bruto.contar(inicio, fim)
+            if linhas > self.max_linhas_brutas:
+                raise ValueError(f"{linhas} amostras brutas no intervalo (máximo {self.max_linhas_brutas}): "
+                                 f"reduza o intervalo ou use uma resolução agregada")
+            return resolucao, self.bruto.ler_intervalo(inicio, fim, colunas)
+        if resolucao not in self.resolucoes:
+            raise ValueError(f"Resolução inválida: {resolucao} (use auto, raw ou {', '.join(self.resolucoes)})")
+
+        armazenamento = self._armazenamentos[resolucao]
+        armazenamento.flush(timeout=1.0)  # inclui os intervalos fechados ainda na fila de gravação
+        nomes = [f'{c}_{e}' for c in colunas for e in ESTATISTICAS_CONSULTA]
+        dados = armazenamento.ler_intervalo(inicio, fim, nomes)
+
+        parcial = self._agregadores[resolucao].parcial()
+        if parcial is not None:
+            tempo = np.datetime64(parcial['timestamp'], 'us')
+            dentro = (inicio is None or tempo >= np.datetime64(inicio, 'us')) and \
+                     (fim is None or tempo <= np.datetime64(fim, 'us'))
+            if dentro and (not len(dados['timestamp']) or tempo > dados['timestamp'][-1]):
+                dados = {c: np.append(v, tempo if c == 'timestamp' else parcial[c]) for c, v in dados.items()}
+        return resolucao, dados
+
+
+def serie_para_json(dados):
+    """dict coluna -> array em listas serializáveis: timestamps ISO 8601 e NaN como null"""
+    resultado = {}
+    for coluna, valores in dados.items():
+        if coluna == 'timestamp':
+            resultado[coluna] = np.datetime_as_string(valores, unit='ms').tolist()
+        else:
+            resultado[coluna] = np.where(np.isnan(valores), None, valores).tolist()
+    return resultado
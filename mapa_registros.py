@@ -0,0 +1,130 @@
+from decodificacao import decode_float32
+from escalonador_barramento import tempo_transacao
+
+# Número de registros ocupados por tipo de dado
+PALAVRAS_POR_TIPO = {'float32': 2, 'uint16': 1, 'int16': 1}
+
+# Limite de registros por requisição FC03 (especificação Modbus)
+MAX_REGISTROS_LEITURA = 125
+
+# Tempo típico que um escravo leva para começar a responder (segundos)
+LATENCIA_RESPOSTA = 0.005
+
+
+class Campo:
+    """Um valor do mapa de registros de um dispositivo"""
+
+    def __init__(self, nome, endereco, tipo='float32', ordem='big'):
+        if tipo not in PALAVRAS_POR_TIPO:
+            raise ValueError(f"Tipo inválido: {tipo} (use {tuple(PALAVRAS_POR_TIPO)})")
+        self.nome = nome
+        self.endereco = endereco
+        self.tipo = tipo
+        self.ordem = ordem  # 'big' (ABCD) ou 'word_swap' (CDAB), só para float32
+
+    @property
+    def palavras(self):
+        return PALAVRAS_POR_TIPO[self.tipo]
+
+    @property
+    def fim(self):
+        return self.endereco + self.palavras
+
+    def __repr__(self):
+        return f"Campo({self.nome!r}, {self.endereco}, {self.tipo!r}, {self.ordem!r})"
+
+
+class Bloco:
+    """Uma requisição de leitura que cobre um ou mais campos contíguos"""
+
+    def __init__(self, campos):
+        self.campos = list(campos)
+        self.endereco = min(c.endereco for c in self.campos)
+        self.count = max(c.fim for c in self.campos) - self.endereco
+
+    def __repr__(self):
+        return f"Bloco(endereco={self.endereco}, count={self.count}, campos={[c.nome for c in self.campos]})"
+
+
+# Mapas dos instrumentos usados na bancada (endereços em registros)
+MAPA_PIRANOMETRO = [
+    Campo('irradiance', 2),
+    Campo('angle_x', 14),
+    Campo('angle_y', 16),
+    Campo('voltage_out', 20),
+]
+
+MAPA_CR1000 = [
+    Campo('cr1000_1', 0),
+    Campo('cr1000_2', 2),
+    Campo('cr1000_3', 4),
+]
+
+
+def custo_plano(blocos, baudrate, latencia=LATENCIA_RESPOSTA):
+    """Tempo estimado (s) para executar todas as leituras de um plano"""
+    return sum(tempo_transacao(b.count, baudrate) + latencia for b in blocos)
+
+
+def planejar_leituras(campos, baudrate=19200, max_gap=None, latencia=LATENCIA_RESPOSTA,
+                      max_registros=MAX_REGISTROS_LEITURA):
+    """Agrupa os campos no conjunto de leituras mais barato para o baudrate.
+
+    Campos vizinhos só podem ir na mesma requisição se o buraco entre eles for
+    de no máximo `max_gap` registros (None = sem limite) e o bloco não passar
+    de `max_registros`. Entre os agrupamentos permitidos, escolhe por
+    programação dinâmica o de menor tempo total de barramento: cada
+    requisição extra custa os cabeçalhos, o CRC, os silêncios t3.5 e a
+    latência do escravo; cada registro a mais custa 2 bytes de fio.
+    """
+    ordenados = sorted(campos, key=lambda c: c.endereco)
+    n = len(ordenados)
+    if n == 0:
+        return []
+
+    # melhor[i] = (custo, blocos) do melhor plano para os i primeiros campos
+    melhor = [(0.0, [])] + [None] * n
+    for fim in range(1, n + 1):
+        for inicio in range(fim - 1, -1, -1):
+            if inicio < fim - 1:
+                gap = ordenados[inicio + 1].endereco - ordenados[inicio].fim
+                if max_gap is not None and gap > max_gap:
+                    break
+            bloco = Bloco(ordenados[inicio:fim])
+            if bloco.count > max_registros:
+                break
+            custo = melhor[inicio][0] + custo_plano([bloco], baudrate, latencia)
+            if melhor[fim] is None or custo < melhor[fim][0]:
+                melhor[fim] = (custo, melhor[inicio][1] + [bloco])
+    return melhor[n][1]
+
+
+def decodificar_registros(campos, endereco, registers):
+    """Valores dos campos inteiramente cobertos por registros lidos a partir de `endereco`.
+
+    Serve para quadros capturados, que podem ser decodificados com um mapa
+    diferente do que gerou as leituras.
+    """
+    cobertos = [c for c in campos if c.endereco >= endereco and c.fim <= endereco + len(registers)]
+    if not cobertos:
+        return {}
+    bloco = Bloco(cobertos)
+    return decodificar_bloco(bloco, registers[bloco.endereco - endereco:])
+
+
+def decodificar_bloco(bloco, registers):
+    """Extrai os valores dos campos de um bloco a partir dos registros lidos (lista ou array uint16)"""
+    # Inteiros Python uma vez por bloco: escalares NumPy uint16 (quadros capturados) estouram em `<< 16`
+    registers = [int(r) for r in registers[:bloco.count]]
+    valores = {}
+    for campo in bloco.campos:
+        i = campo.endereco - bloco.endereco
+        palavras = registers[i:i + campo.palavras]
+        # Um valor por campo: struct/aritmética escalar, mais baratos que arrays NumPy de 2 registros
+        if campo.tipo == 'float32':
+            valores[campo.nome] = decode_float32(palavras[0], palavras[1], campo.ordem)
+        elif campo.tipo == 'int16':
+            valores[campo.nome] = palavras[0] - 0x10000 if palavras[0] & 0x8000 else palavras[0]
+        else:
+            valores[campo.nome] = int(palavras[0])
+    return valores
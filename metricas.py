@@ -0,0 +1,251 @@
+import math
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from pymodbus.exceptions import ModbusIOException
+
+# Limites (segundos) do histograma de latência, no padrão do Prometheus
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Resultado de cada requisição: resposta normal, sem resposta, resposta de exceção Modbus, outro erro
+RESULTADOS = ('ok', 'timeout', 'exception', 'error')
+
+JANELA_TAXA = 60.0  # segundos usados para calcular a taxa de leitura obtida
+AMOSTRAS_LATENCIA = 1000  # latências recentes guardadas para p50/p99
+
+
+def crc16_modbus(dados):
+    """CRC-16/MODBUS (polinômio 0xA001, valor inicial 0xFFFF)"""
+    crc = 0xFFFF
+    for byte in dados:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+def tamanho_resposta_rtu(dados):
+    """Tamanho do quadro de resposta RTU que começa em `dados` (None se ainda não dá para saber)"""
+    if len(dados) < 3:
+        return None
+    funcao = dados[1]
+    if funcao & 0x80:
+        return 5  # endereço + função + código de exceção + CRC
+    if funcao in (3, 4):
+        return 5 + dados[2]  # endereço + função + contagem + dados + CRC
+    return None
+
+
+class MetricasDispositivo:
+    """Contadores e histograma de um escravo Modbus"""
+
+    def __init__(self):
+        self.requisicoes = dict.fromkeys(RESULTADOS, 0)
+        self.erros_crc = 0
+        self.bytes_tx = 0
+        self.bytes_rx = 0
+        self.reconexoes = 0
+        self.disjuntor = 'fechado'  # estado do circuit breaker (ver conexao.Disjuntor)
+        self.timeout = float('nan')  # timeout de resposta em uso, em segundos
+        self.buckets = [0] * len(BUCKETS_LATENCIA)
+        self.soma_latencia = 0.0
+        self._latencias = deque(maxlen=AMOSTRAS_LATENCIA)
+        self._sucessos = deque()  # instantes (monotônicos) das leituras bem-sucedidas
+
+    def registrar(self, resultado, latencia, agora):
+        self.requisicoes[resultado] += 1
+        self.soma_latencia += latencia
+        for i, limite in enumerate(BUCKETS_LATENCIA):
+            if latencia <= limite:
+                self.buckets[i] += 1
+        self._latencias.append(latencia)
+        if resultado == 'ok':
+            self._sucessos.append(agora)
+
+    @property
+    def total(self):
+        return sum(self.requisicoes.values())
+
+    def taxa(self, agora):
+        """Leituras bem-sucedidas por segundo nos últimos JANELA_TAXA segundos"""
+        while self._sucessos and agora - self._sucessos[0] > JANELA_TAXA:
+            self._sucessos.popleft()
+        if len(self._sucessos) < 2:
+            return 0.0
+        return (len(self._sucessos) - 1) / (self._sucessos[-1] - self._sucessos[0])
+
+    def percentil(self, p):
+        return float(np.percentile(self._latencias, p)) if self._latencias else float('nan')
+
+
+class _Medicao:
+    """Contexto de uma requisição: mede a latência e classifica o resultado ao sair"""
+
+    def __init__(self, metricas, nome):
+        self._metricas = metricas
+        self._nome = nome
+        self.resultado = 'ok'
+        self.latencia = None
+
+    def resposta(self, response):
+        if isinstance(response, ModbusIOException):
+            self.resultado = 'timeout'
+        elif response.isError():
+            self.resultado = 'exception'
+        return response
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, erro, traceback):
+        if erro is not None:
+            # O pymodbus levanta ModbusIOException quando o escravo não responde a tempo
+            self.resultado = 'timeout' if isinstance(erro, ModbusIOException) else 'error'
+        self.latencia = time.perf_counter() - self._inicio
+        self._metricas.registrar(self._nome, self.resultado, self.latencia)
+        return False
+
+
+class MetricasBarramento:
+    """Saúde do barramento por dispositivo, para a interface e para o Prometheus.
+
+    O motor de aquisição envolve cada requisição com `medir(nome)` e cria os
+    clientes com `trace_packet=rastreador(nome)`, que conta os bytes no fio e
+    confere o CRC de cada resposta recebida.
+    """
+
+    def __init__(self):
+        self._dispositivos = {}
+        self._lock = threading.Lock()
+
+    def _dispositivo(self, nome):
+        if nome not in self._dispositivos:
+            self._dispositivos[nome] = MetricasDispositivo()
+        return self._dispositivos[nome]
+
+    def medir(self, nome):
+        return _Medicao(self, nome)
+
+    def registrar(self, nome, resultado, latencia):
+        if resultado not in RESULTADOS:
+            raise ValueError(f"Resultado inválido: {resultado} (use {RESULTADOS})")
+        with self._lock:
+            self._dispositivo(nome).registrar(resultado, latencia, time.monotonic())
+
+    def registrar_reconexao(self, nome):
+        with self._lock:
+            self._dispositivo(nome).reconexoes += 1
+
+    def definir_conexao(self, nome, disjuntor, timeout):
+        with self._lock:
+            dispositivo = self._dispositivo(nome)
+            dispositivo.disjuntor = disjuntor
+            dispositivo.timeout = timeout
+
+    def rastreador(self, nome, nomes_por_slave=None):
+        """Função trace_packet(sending, data) para o cliente pymodbus do dispositivo `nome`.
+
+        Num cliente compartilhado por vários escravos, `nomes_por_slave`
+        (slave -> nome) atribui cada quadro ao dispositivo pelo endereço. Na
+        recepção o pymodbus repassa o buffer acumulado até formar um quadro,
+        então só os bytes novos em relação à chamada anterior são contados, e o
+        CRC é conferido uma vez, quando o quadro fica completo.
+        """
+        estado = {'buffer': b'', 'conferido': False}
+
+        def trace_packet(sending, data):
+            with self._lock:
+                dono = nomes_por_slave.get(data[0], nome) if nomes_por_slave and data else nome
+                dispositivo = self._dispositivo(dono)
+                if sending:
+                    dispositivo.bytes_tx += len(data)
+                    estado['buffer'] = b''
+                    estado['conferido'] = False
+                    return data
+
+                anterior = estado['buffer']
+                novos = len(data) - len(anterior) if data.startswith(anterior) else len(data)
+                dispositivo.bytes_rx += max(novos, 0)
+                estado['buffer'] = data
+
+                tamanho = tamanho_resposta_rtu(data)
+                if not estado['conferido'] and tamanho is not None and len(data) >= tamanho:
+                    estado['conferido'] = True
+                    if crc16_modbus(data[:tamanho - 2]) != int.from_bytes(data[tamanho - 2:tamanho], 'little'):
+                        dispositivo.erros_crc += 1
+            return data
+
+        return trace_packet
+
+    # --- Consulta ---
+
+    def resumo(self):
+        """Dicionário por dispositivo com os números do painel de status"""
+        agora = time.monotonic()
+        with self._lock:
+            return {
+                nome: {
+                    'requisicoes': d.total,
+                    **{resultado: d.requisicoes[resultado] for resultado in RESULTADOS},
+                    'erros_crc': d.erros_crc,
+                    'bytes_tx': d.bytes_tx,
+                    'bytes_rx': d.bytes_rx,
+                    'p50_ms': d.percentil(50) * 1000,
+                    'p99_ms': d.percentil(99) * 1000,
+                    'taxa_hz': d.taxa(agora),
+                    'reconexoes': d.reconexoes,
+                    'disjuntor': d.disjuntor,
+                    'timeout_ms': d.timeout * 1000,
+                }
+                for nome, d in self._dispositivos.items()
+            }
+
+    def prometheus(self):
+        """Métricas no formato texto de exposição do Prometheus (versão 0.0.4)"""
+        agora = time.monotonic()
+        linhas = {
+            'requests': ['# HELP modbus_requests_total Modbus requests by result.',
+                         '# TYPE modbus_requests_total counter'],
+            'crc': ['# HELP modbus_crc_errors_total Responses received with an invalid CRC.',
+                    '# TYPE modbus_crc_errors_total counter'],
+            'bytes': ['# HELP modbus_bytes_total Bytes on the wire.',
+                      '# TYPE modbus_bytes_total counter'],
+            'latency': ['# HELP modbus_request_latency_seconds Request round-trip time.',
+                        '# TYPE modbus_request_latency_seconds histogram'],
+            'rate': [f'# HELP modbus_poll_rate_hz Successful reads per second over the last {JANELA_TAXA:g} s.',
+                     '# TYPE modbus_poll_rate_hz gauge'],
+            'reconnects': ['# HELP modbus_reconnects_total Serial port reconnections.',
+                           '# TYPE modbus_reconnects_total counter'],
+            'circuit': ['# HELP modbus_circuit_open 1 while the circuit breaker keeps the device out of the poll.',
+                        '# TYPE modbus_circuit_open gauge'],
+            'timeout': ['# HELP modbus_timeout_seconds Response timeout currently in use.',
+                        '# TYPE modbus_timeout_seconds gauge'],
+        }
+        with self._lock:
+            for nome, d in sorted(self._dispositivos.items()):
+                rotulo = f'device="{_escapar(nome)}"'
+                for resultado in RESULTADOS:
+                    linhas['requests'].append(
+                        f'modbus_requests_total{{{rotulo},result="{resultado}"}} {d.requisicoes[resultado]}')
+                linhas['crc'].append(f'modbus_crc_errors_total{{{rotulo}}} {d.erros_crc}')
+                linhas['bytes'].append(f'modbus_bytes_total{{{rotulo},direction="tx"}} {d.bytes_tx}')
+                linhas['bytes'].append(f'modbus_bytes_total{{{rotulo},direction="rx"}} {d.bytes_rx}')
+                for limite, contagem in zip(BUCKETS_LATENCIA, d.buckets):
+                    linhas['latency'].append(
+                        f'modbus_request_latency_seconds_bucket{{{rotulo},le="{limite:g}"}} {contagem}')
+                linhas['latency'].append(f'modbus_request_latency_seconds_bucket{{{rotulo},le="+Inf"}} {d.total}')
+                linhas['latency'].append(f'modbus_request_latency_seconds_sum{{{rotulo}}} {d.soma_latencia!r}')
+                linhas['latency'].append(f'modbus_request_latency_seconds_count{{{rotulo}}} {d.total}')
+                linhas['rate'].append(f'modbus_poll_rate_hz{{{rotulo}}} {d.taxa(agora)!r}')
+                linhas['reconnects'].append(f'modbus_reconnects_total{{{rotulo}}} {d.reconexoes}')
+                linhas['circuit'].append(f'modbus_circuit_open{{{rotulo}}} {int(d.disjuntor == "aberto")}')
+                if not math.isnan(d.timeout):  # omitido enquanto o dispositivo não foi conectado
+                    linhas['timeout'].append(f'modbus_timeout_seconds{{{rotulo}}} {d.timeout!r}')
+        return '\n'.join(linha for grupo in linhas.values() for linha in grupo) + '\n'
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
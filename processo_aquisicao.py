@@ -0,0 +1,258 @@
+"""Motor de aquisição num processo separado, com as amostras num anel em memória compartilhada.
+
+No processo do Dash, os callbacks, o pandas e a serialização JSON disputam
+o GIL com o I/O Modbus; sob carga da interface isso atrasa a grade de
+amostragem e provoca timeouts. Com o MotorProcesso, o motor de aquisição
+roda num interpretador próprio (este arquivo executado como script): as
+amostras decodificadas vão para um AnelAmostras (anel_compartilhado.py) e
+os comandos (conectar, desconectar, métricas...) por uma
+multiprocessing.connection autenticada.
+
+O processo filho é iniciado como script, e não com multiprocessing.Process,
+porque o spawn importaria de novo o módulo principal (GetDados.py) no filho.
+"""
+import os
+import subprocess
+import sys
+import threading
+from multiprocessing.connection import Client, Listener
+
+from anel_compartilhado import AnelAmostras
+from aquisicao import MotorAquisicao
+from aquisicao_async import MotorAquisicaoAsync
+from reproducao import MotorReproducao
+
+# Consultas cujo resultado volta ao processo principal; os demais comandos só executam
+CONSULTAS = {'piranometro_conectado', 'cr1000_conectado', 'estatisticas_amostragem', 'estado_conexoes',
+             'resumo_barramento', 'resumo_etapas', 'prometheus'}
+
+
+def criar_motor(modo, intervalo=5, max_gap=None, caminho_reproducao=None, velocidade_reproducao=1.0):
+    """Motor de aquisição do modo 'thread', 'asyncio' ou 'replay'"""
+    if modo == 'replay':
+        return MotorReproducao(caminho_reproducao, velocidade=velocidade_reproducao, max_gap=max_gap)
+    if modo == 'asyncio':
+        return MotorAquisicaoAsync(intervalo=intervalo, max_gap=max_gap)
+    return MotorAquisicao(intervalo=intervalo, max_gap=max_gap)
+
+
+class MotorProcesso:
+    """Mesma interface do MotorAquisicao, com o motor num processo filho.
+
+    Uma thread local lê as amostras novas do anel a cada `intervalo_leitura`
+    segundos e as publica para os assinantes deste processo, na ordem em que
+    foram lidas. `capacidade` amostras cabem no anel; se a leitura atrasar
+    mais que isso, as mais antigas se perdem e são contadas em `perdidas`.
+    """
+
+    def __init__(self, modo='thread', capacidade=4096, intervalo_leitura=0.05, **opcoes):
+        self.modo = modo
+        self.intervalo_leitura = intervalo_leitura
+        self.perdidas = 0
+        self._anel = AnelAmostras.criar(capacidade)
+        self._lidas = 0
+        self._lock_comandos = threading.Lock()
+        self._lock_snapshot = threading.Lock()
+        self._amostra = None
+        self._sequencia = 0
+        self._assinantes = []
+        self._portas_ativas = [1]
+        self._parar = threading.Event()
+        self._thread = None
+
+        chave = os.urandom(32)
+        self._processo = subprocess.Popen(
+            [sys.executable, '-u', os.path.abspath(__file__)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        self._processo.stdin.write(chave.hex() + '\n')
+        self._processo.stdin.close()
+        endereco = self._processo.stdout.readline().strip()
+        if not endereco:
+            self._anel.liberar()
+            raise Exception("O processo de aquisição não iniciou")
+        # A saída do filho (mensagens de erro do motor) continua no console deste processo
+        threading.Thread(target=self._repassar_saida, name="aquisicao-saida", daemon=True).start()
+        self._conexao = Client(endereco, authkey=chave)
+        self._conexao.send((self._anel.nome, modo, opcoes))
+
+    def _repassar_saida(self):
+        for linha in self._processo.stdout:
+            print(linha, end='')
+
+    def _chamar(self, metodo, *args):
+        with self._lock_comandos:
+            try:
+                self._conexao.send((metodo, args))
+                ok, resultado = self._conexao.recv()
+            except (EOFError, OSError):
+                raise Exception("O processo de aquisição foi encerrado")
+        if not ok:
+            raise Exception(resultado)
+        return resultado
+
+    # --- Comandos repassados ao motor do processo filho ---
+
+    def conectar_piranometro(self, port, baudrate, parity, slave, timeout=2.0):
+        self._chamar('conectar_piranometro', port, baudrate, parity, slave, timeout)
+
+    def conectar_cr1000(self, port, baudrate, parity, slave, timeout=3.0):
+        self._chamar('conectar_cr1000', port, baudrate, parity, slave, timeout)
+
+    def desconectar_todos(self):
+        self._chamar('desconectar_todos')
+
+    def iniciar_captura(self, caminho):
+        self._chamar('iniciar_captura', caminho)
+
+    def parar_captura(self):
+        self._chamar('parar_captura')
+
+    def iniciar_gateway(self, porta, unidades=None, host='127.0.0.1', idade_maxima=10.0):
+        self._chamar('iniciar_gateway', porta, unidades, host, idade_maxima)
+
+    def parar_gateway(self):
+        self._chamar('parar_gateway')
+
+    @property
+    def portas_ativas(self):
+        return self._portas_ativas
+
+    @portas_ativas.setter
+    def portas_ativas(self, portas):
+        self._portas_ativas = list(portas)
+        self._chamar('portas_ativas', self._portas_ativas)
+
+    @property
+    def piranometro_conectado(self):
+        return self._chamar('piranometro_conectado')
+
+    @property
+    def cr1000_conectado(self):
+        return self._chamar('cr1000_conectado')
+
+    def estatisticas_amostragem(self):
+        return self._chamar('estatisticas_amostragem')
+
+    def estado_conexoes(self):
+        return self._chamar('estado_conexoes')
+
+    def resumo_barramento(self):
+        return self._chamar('resumo_barramento')
+
+    def resumo_etapas(self):
+        return self._chamar('resumo_etapas')
+
+    def prometheus(self):
+        return self._chamar('prometheus')
+
+    # --- Publicação local das amostras lidas do anel ---
+
+    def assinar(self, callback):
+        """Registra uma função chamada (na thread de leitura do anel) a cada nova amostra"""
+        self._assinantes.append(callback)
+
+    def ultima_amostra(self):
+        """Retorna (sequência, amostra) da última amostra lida do anel"""
+        with self._lock_snapshot:
+            return self._sequencia, self._amostra
+
+    def iniciar(self):
+        self._chamar('iniciar')
+        if self._thread and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, name="aquisicao-anel", daemon=True)
+        self._thread.start()
+
+    def parar(self, timeout=None):
+        try:
+            self._chamar('parar', timeout)
+        finally:
+            self._parar.set()
+            if self._thread:
+                self._thread.join(timeout)
+                self._thread = None
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo_leitura):
+            self.ler_anel()
+
+    def ler_anel(self):
+        """Publica as amostras gravadas no anel desde a última leitura; retorna quantas"""
+        amostras, self._lidas, perdidas = self._anel.ler(self._lidas)
+        if perdidas:
+            self.perdidas += perdidas
+            print(f"{perdidas} amostras sobrescritas no anel antes de serem lidas")
+        for amostra in amostras:
+            with self._lock_snapshot:
+                self._sequencia += 1
+                self._amostra = amostra
+            for callback in list(self._assinantes):
+                try:
+                    callback(amostra)
+                except Exception as e:
+                    print(f"Erro no assinante de aquisição: {str(e)}")
+        return len(amostras)
+
+    def encerrar(self, timeout=5.0):
+        """Para o motor, encerra o processo filho e libera a memória compartilhada"""
+        self._parar.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        try:
+            self._chamar('encerrar')
+        except Exception:
+            pass
+        self._conexao.close()
+        try:
+            self._processo.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self._processo.kill()
+        self._anel.liberar()
+
+
+def executar_comando(motor, metodo, args):
+    if metodo == 'portas_ativas':
+        motor.portas_ativas = args[0]
+        return None
+    atributo = getattr(motor, metodo)
+    resultado = atributo(*args) if callable(atributo) else atributo
+    return resultado if metodo in CONSULTAS else None
+
+
+def _principal():
+    """Processo filho: motor de aquisição gravando no anel e atendendo os comandos do pai"""
+    chave = bytes.fromhex(sys.stdin.readline().strip())
+    with Listener(authkey=chave) as escuta:
+        print(escuta.address, flush=True)
+        conexao = escuta.accept()
+    nome_anel, modo, opcoes = conexao.recv()
+    anel = AnelAmostras.abrir(nome_anel)
+    motor = criar_motor(modo, **opcoes)
+    motor.assinar(anel.gravar)
+    try:
+        while True:
+            try:
+                metodo, args = conexao.recv()
+            except (EOFError, OSError):
+                break  # o processo principal terminou
+            if metodo == 'encerrar':
+                conexao.send((True, None))
+                break
+            try:
+                conexao.send((True, executar_comando(motor, metodo, args)))
+            except Exception as e:
+                conexao.send((False, str(e)))
+    finally:
+        motor.parar(5.0)
+        motor.parar_gateway()
+        motor.parar_captura()
+        motor.desconectar_todos()
+        anel.fechar()
+
+
+if __name__ == '__main__':
+    _principal()
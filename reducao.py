@@ -0,0 +1,75 @@
+import numpy as np
+
+METODOS = ('lttb', 'minmax')
+
+
+def _como_float(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[us]').astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def lttb(x, y, n):
+    """Largest-Triangle-Three-Buckets: índices dos n pontos que melhor preservam a forma da curva.
+
+    Mantém o primeiro e o último ponto e, em cada um dos n - 2 baldes
+    intermediários, escolhe o ponto que forma o maior triângulo com o ponto
+    escolhido no balde anterior e com a média do balde seguinte.
+    """
+    total = len(y)
+    if n >= total or n < 3:
+        return np.arange(total)
+
+    xf = _como_float(x)
+    yf = np.asarray(y, dtype=np.float64)
+    limites = np.linspace(1, total - 1, n - 1).astype(np.int64)
+
+    indices = np.empty(n, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = total - 1
+    anterior = 0
+    for i in range(n - 2):
+        inicio, fim = limites[i], limites[i + 1]
+        proximo_inicio = limites[i + 1]
+        proximo_fim = limites[i + 2] if i + 2 < n - 1 else total
+        media_x = xf[proximo_inicio:proximo_fim].mean()
+        media_y = yf[proximo_inicio:proximo_fim].mean()
+
+        ax, ay = xf[anterior], yf[anterior]
+        areas = np.abs((ax - media_x) * (yf[inicio:fim] - ay) - (ax - xf[inicio:fim]) * (media_y - ay))
+        anterior = inicio + int(np.argmax(areas))
+        indices[i + 1] = anterior
+    return indices
+
+
+def minmax(x, y, n):
+    """Mínimo e máximo de cada balde (n / 2 baldes): preserva picos, ideal para um ponto por pixel"""
+    total = len(y)
+    if n >= total or n < 2:
+        return np.arange(total)
+
+    yf = np.asarray(y, dtype=np.float64)
+    limites = np.linspace(0, total, n // 2 + 1).astype(np.int64)
+    indices = []
+    for inicio, fim in zip(limites[:-1], limites[1:]):
+        if fim <= inicio:
+            continue
+        trecho = yf[inicio:fim]
+        i_min = inicio + int(np.argmin(trecho))
+        i_max = inicio + int(np.argmax(trecho))
+        indices.extend(sorted((i_min, i_max)) if i_min != i_max else (i_min,))
+    return np.array(indices, dtype=np.int64)
+
+
+def reduzir(x, y, n, metodo='lttb'):
+    """Reduz uma série a no máximo ~n pontos; descarta NaN antes (o Plotly não os desenha)"""
+    if metodo not in METODOS:
+        raise ValueError(f"Método inválido: {metodo} (use {METODOS})")
+    x = np.asarray(x)
+    y = np.asarray(y)
+    validos = ~np.isnan(y)
+    if not validos.all():
+        x, y = x[validos], y[validos]
+    indices = lttb(x, y, n) if metodo == 'lttb' else minmax(x, y, n)
+    return x[indices], y[indices]
@@ -0,0 +1,304 @@
+"""Registrador de campo sem interface: lê os instrumentos Modbus e grava em disco.
+
+Não importa Dash nem pandas: só pymodbus e numpy, para estações autônomas
+com pouca memória e CPU. Os dispositivos e registros vêm de um arquivo JSON
+(veja `python registrador.py --exemplo`); cada porta serial é lida por uma
+thread própria, tão rápido quanto o barramento permitir (ou numa grade fixa
+de prazos no intervalo configurado), com reconexão automática e disjuntor
+por dispositivo. Cada registro leva o instante da sua requisição.
+
+Cada dispositivo grava arquivos binários compactos em <saida>/, um por hora:
+cabeçalho JSON seguido de registros de tamanho fixo (timestamp int64 em µs
+UTC + um float32 por campo). Use `ler_arquivo_registro` para carregá-los.
+
+Uso:
+    python registrador.py estacao.json
+    python registrador.py estacao.json --saida dados/campo --intervalo 0.1 --duracao 3600
+"""
+import argparse
+import glob
+import json
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from pymodbus.client import ModbusSerialClient
+
+from amostragem import GradeAmostragem
+from conexao import ConexaoDispositivo
+from mapa_registros import MAPA_CR1000, MAPA_PIRANOMETRO, Campo, planejar_leituras
+from metricas import MetricasBarramento
+
+MAGICA = b'PIRLOG1\n'
+
+# Mapas de registros conhecidos, usados quando o dispositivo não lista os seus campos
+MAPAS = {'piranometro': MAPA_PIRANOMETRO, 'cr1000': MAPA_CR1000}
+
+EXEMPLO_CONFIG = {
+    'saida': 'dados/registro',
+    'intervalo': 0,
+    'rotacao': 3600,
+    'dispositivos': [
+        {'nome': 'piranometro', 'porta': 'COM3', 'baudrate': 19200, 'paridade': 'E', 'slave': 32,
+         'timeout': 2.0, 'mapa': 'piranometro'},
+        {'nome': 'cr1000', 'porta': 'COM5', 'baudrate': 9600, 'paridade': 'N', 'slave': 1, 'timeout': 3.0,
+         'campos': [{'nome': 'cr1000_1', 'endereco': 0}, {'nome': 'cr1000_2', 'endereco': 2},
+                    {'nome': 'cr1000_3', 'endereco': 4}]},
+    ],
+}
+
+
+# --- Formato em disco ---
+
+def dtype_registro(colunas):
+    return np.dtype([('timestamp', '<i8')] + [(c, '<f4') for c in colunas])
+
+
+class ArquivoRegistro:
+    """Arquivos binários de um dispositivo, trocados a cada `rotacao` segundos.
+
+    Cada arquivo começa com MAGICA, o tamanho do cabeçalho (uint32) e o
+    cabeçalho JSON; depois vêm os registros, gravados com buffer e enviados
+    ao disco a cada `intervalo_flush` segundos.
+    """
+
+    def __init__(self, diretorio, dispositivo, colunas, rotacao=3600, intervalo_flush=5.0, metadados=None):
+        self.diretorio = diretorio
+        self.dispositivo = dispositivo
+        self.colunas = list(colunas)
+        self.rotacao = rotacao
+        self.intervalo_flush = intervalo_flush
+        self.metadados = metadados or {}
+        self._formato = struct.Struct('<q' + 'f' * len(self.colunas))
+        self._arquivo = None
+        self._fim_arquivo = 0.0
+        self._ultimo_flush = 0.0
+        self.registros = 0
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _abrir(self, agora):
+        self.fechar()
+        inicio = agora - agora % self.rotacao  # arquivos alinhados ao relógio (ex.: um por hora)
+        nome = f"{self.dispositivo}_{datetime.fromtimestamp(inicio).strftime('%Y%m%d_%H%M%S')}.bin"
+        caminho = os.path.join(self.diretorio, nome)
+        novo = not os.path.exists(caminho) or os.path.getsize(caminho) == 0
+        self._arquivo = open(caminho, 'ab')
+        if novo:
+            cabecalho = json.dumps({
+                'dispositivo': self.dispositivo,
+                'colunas': self.colunas,
+                'timestamp': 'int64, microssegundos desde a época (UTC)',
+                'valores': 'float32 little-endian; NaN sem leitura válida',
+                **self.metadados,
+            }).encode('utf-8')
+            self._arquivo.write(MAGICA + struct.pack('<I', len(cabecalho)) + cabecalho)
+        self._fim_arquivo = inicio + self.rotacao
+        self._ultimo_flush = agora
+
+    def escrever(self, timestamp, valores):
+        """timestamp em segundos (time.time()); valores na ordem de `colunas`"""
+        if self._arquivo is None or timestamp >= self._fim_arquivo:
+            self._abrir(timestamp)
+        self._arquivo.write(self._formato.pack(int(timestamp * 1_000_000), *valores))
+        self.registros += 1
+        if timestamp - self._ultimo_flush >= self.intervalo_flush:
+            self._arquivo.flush()
+            self._ultimo_flush = timestamp
+
+    def fechar(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+
+def ler_arquivo_registro(caminho):
+    """Retorna (cabeçalho, registros) de um arquivo; registros é um array estruturado do numpy.
+
+    Um registro incompleto no fim (gravação interrompida) é ignorado.
+    """
+    with open(caminho, 'rb') as arquivo:
+        if arquivo.read(len(MAGICA)) != MAGICA:
+            raise ValueError(f"Arquivo de registro inválido: {caminho}")
+        tamanho, = struct.unpack('<I', arquivo.read(4))
+        cabecalho = json.loads(arquivo.read(tamanho).decode('utf-8'))
+    dtype = dtype_registro(cabecalho['colunas'])
+    inicio = len(MAGICA) + 4 + tamanho
+    n = (os.path.getsize(caminho) - inicio) // dtype.itemsize
+    return cabecalho, np.fromfile(caminho, dtype=dtype, count=n, offset=inicio)
+
+
+def ler_registros(diretorio, dispositivo):
+    """Concatena todos os arquivos de um dispositivo em ordem de tempo"""
+    partes = [ler_arquivo_registro(caminho)[1]
+              for caminho in sorted(glob.glob(os.path.join(diretorio, f"{dispositivo}_*.bin")))]
+    return np.concatenate(partes) if partes else None
+
+
+# --- Configuração ---
+
+def carregar_config(caminho):
+    with open(caminho, encoding='utf-8') as arquivo:
+        config = json.load(arquivo)
+    if not config.get('dispositivos'):
+        raise ValueError("A configuração não tem dispositivos")
+    return config
+
+
+def campos_do_dispositivo(dispositivo):
+    if 'campos' in dispositivo:
+        return [Campo(c['nome'], c['endereco'], c.get('tipo', 'float32'), c.get('ordem', 'big'))
+                for c in dispositivo['campos']]
+    mapa = dispositivo.get('mapa', dispositivo['nome'])
+    if mapa not in MAPAS:
+        raise ValueError(f"Dispositivo {dispositivo['nome']} sem campos e com mapa desconhecido: {mapa}")
+    return MAPAS[mapa]
+
+
+# --- Aquisição ---
+
+class Registrador:
+    """Lê os dispositivos configurados, uma thread por porta serial, e grava cada leitura em disco"""
+
+    def __init__(self, config, saida=None, intervalo=None, metricas=None):
+        self.saida = saida or config.get('saida', EXEMPLO_CONFIG['saida'])
+        self.intervalo = config.get('intervalo', 0) if intervalo is None else intervalo
+        self.metricas = metricas if metricas is not None else MetricasBarramento()
+        rotacao = config.get('rotacao', EXEMPLO_CONFIG['rotacao'])
+
+        self._portas = {}  # porta -> lista de (conexão, plano, colunas, arquivo)
+        clientes = {}
+        nomes_por_porta = {}
+        for dispositivo in config['dispositivos']:
+            nome, porta = dispositivo['nome'], dispositivo['porta']
+            baudrate = dispositivo.get('baudrate', 9600)
+            paridade = dispositivo.get('paridade', 'N')
+            timeout = dispositivo.get('timeout', 2.0)
+            nomes_por_porta.setdefault(porta, {})[dispositivo['slave']] = nome
+            if porta not in clientes:
+                # Um único cliente por porta: dispositivos no mesmo barramento o compartilham
+                clientes[porta] = ModbusSerialClient(
+                    port=porta, baudrate=baudrate, parity=paridade, stopbits=1, bytesize=8,
+                    timeout=timeout, retries=1,
+                    trace_packet=self.metricas.rastreador(nome, nomes_por_porta[porta])
+                )
+            campos = campos_do_dispositivo(dispositivo)
+            colunas = [c.nome for c in campos]
+            conexao = ConexaoDispositivo(nome, clientes[porta], porta, baudrate, paridade, dispositivo['slave'],
+                                         timeout, metricas=self.metricas)
+            plano = planejar_leituras(campos, baudrate, dispositivo.get('max_gap'))
+            arquivo = ArquivoRegistro(self.saida, nome, colunas, rotacao,
+                                      metadados={'porta': porta, 'slave': dispositivo['slave'],
+                                                 'baudrate': baudrate})
+            self._portas.setdefault(porta, []).append((conexao, plano, colunas, arquivo))
+
+        self._grades = {}  # porta -> GradeAmostragem da thread da porta
+        self._parar = threading.Event()
+        self._threads = []
+
+    def iniciar(self):
+        self._parar.clear()
+        for porta, dispositivos in self._portas.items():
+            if not dispositivos[0][0].client.connect():
+                print(f"Porta {porta} indisponível; novas tentativas automáticas")
+            thread = threading.Thread(target=self._loop_porta, args=(porta, dispositivos),
+                                      name=f"registrador-{os.path.basename(porta)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def parar(self, timeout=None):
+        self._parar.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        for dispositivos in self._portas.values():
+            for conexao, _, _, arquivo in dispositivos:
+                arquivo.fechar()
+            dispositivos[0][0].client.close()
+
+    def _loop_porta(self, porta, dispositivos):
+        grade = self._grades[porta] = GradeAmostragem(self.intervalo)
+        while True:
+            prazo = grade.aguardar(self._parar)
+            if prazo is None:
+                break
+            lidos = sum(self._ler(*dispositivo, grade, prazo) for dispositivo in dispositivos)
+            if not lidos:
+                # Todos os disjuntores abertos: dorme até a próxima tentativa em vez de girar em falso
+                proxima = min(conexao.disjuntor.proxima_tentativa for conexao, _, _, _ in dispositivos)
+                if self._parar.wait(max(min(proxima - time.monotonic(), 1.0), 0.01)):
+                    break
+            grade.concluir()
+
+    def _ler(self, conexao, plano, colunas, arquivo, grade, prazo):
+        """Uma leitura do dispositivo; retorna True se o barramento foi usado"""
+        if not conexao.permitir():
+            return False
+        try:
+            conexao.garantir_conexao()
+            enviado = time.monotonic()
+            valores = conexao.ler_plano(plano)
+        except Exception as e:
+            print(f"Erro no {conexao.nome}: {str(e)}")
+            return True
+        if valores is None:
+            print(f"Erro na resposta do {conexao.nome}!")
+            return True
+        grade.estatisticas.registrar(conexao.nome, enviado - prazo)
+        arquivo.escrever(grade.para_epoch(enviado), [valores.get(c, float('nan')) for c in colunas])
+        return True
+
+    def resumo(self):
+        registros = {arquivo.dispositivo: arquivo.registros
+                     for dispositivos in self._portas.values() for *_, arquivo in dispositivos}
+        # Atraso da requisição de cada dispositivo em relação ao prazo da grade da sua porta
+        atrasos = {nome: serie for grade in list(self._grades.values())
+                   for nome, serie in grade.estatisticas.resumo()['series'].items() if nome != 'ciclo'}
+        return {nome: {**estatisticas, 'registros': registros.get(nome, 0),
+                       'atraso_p99_ms': atrasos.get(nome, {}).get('p99_ms', float('nan'))}
+                for nome, estatisticas in self.metricas.resumo().items()}
+
+
+def imprimir_status(resumo):
+    partes = [f"{nome}: {r['registros']} registros, {r['taxa_hz']:.1f} Hz, {r['timeout']} timeouts, "
+              f"p99 {r['p99_ms']:.1f} ms, atraso p99 {r['atraso_p99_ms']:.1f} ms, disjuntor {r['disjuntor']}"
+              for nome, r in resumo.items()]
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] " + " | ".join(partes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('config', nargs='?', help="arquivo JSON com os dispositivos e registros")
+    parser.add_argument('--saida', help="diretório dos arquivos (padrão: 'saida' da configuração)")
+    parser.add_argument('--intervalo', type=float, help="segundos entre leituras de cada porta (0 = máximo)")
+    parser.add_argument('--duracao', type=float, help="encerra após este número de segundos")
+    parser.add_argument('--status', type=float, default=60.0, help="segundos entre linhas de status")
+    parser.add_argument('--exemplo', action='store_true', help="mostra uma configuração de exemplo e sai")
+    args = parser.parse_args()
+
+    if args.exemplo:
+        print(json.dumps(EXEMPLO_CONFIG, indent=2, ensure_ascii=False))
+        return
+    if not args.config:
+        parser.error("informe o arquivo de configuração (ou --exemplo)")
+
+    registrador = Registrador(carregar_config(args.config), saida=args.saida, intervalo=args.intervalo)
+    print(f"Gravando em {registrador.saida} ({len(registrador._portas)} porta(s))")
+    registrador.iniciar()
+    fim = time.monotonic() + args.duracao if args.duracao else None
+    try:
+        while fim is None or time.monotonic() < fim:
+            espera = args.status if fim is None else min(args.status, max(0.0, fim - time.monotonic()))
+            time.sleep(espera)
+            imprimir_status(registrador.resumo())
+    except KeyboardInterrupt:
+        print("\nRegistro encerrado pelo usuário")
+    finally:
+        registrador.parar(5)
+        imprimir_status(registrador.resumo())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import threading
+import time
+
+from amostragem import GradeAmostragem
+from aquisicao import MotorAquisicao
+from captura import LeitorCaptura
+from mapa_registros import decodificar_registros
+
+
+class MotorReproducao(MotorAquisicao):
+    """Fonte de amostras que reproduz uma captura de registros brutos (ver captura.py).
+
+    Substitui o motor de aquisição sem instrumentos conectados: cada ciclo
+    capturado é decodificado com os mapas de registros atuais (que podem
+    diferir dos usados na captura), vira uma amostra com o tick e os
+    instantes de requisição capturados e é publicado para os mesmos
+    assinantes do motor real.
+    `velocidade` 1.0 reproduz no ritmo original, 10.0 dez vezes mais rápido e
+    None tão rápido quanto possível.
+    """
+
+    def __init__(self, caminho, velocidade=1.0, **kwargs):
+        super().__init__(intervalo=0, **kwargs)
+        self.caminho = caminho
+        self.velocidade = velocidade
+        self.ciclos_reproduzidos = 0
+        self.concluida = threading.Event()
+        self._dispositivos = set()  # dispositivos "conectados" pela interface
+
+    # --- Conexões simuladas: nenhuma porta serial é aberta ---
+
+    def conectar_piranometro(self, port=None, baudrate=None, parity=None, slave=None, timeout=None):
+        self._dispositivos.add('piranometro')
+
+    def conectar_cr1000(self, port=None, baudrate=None, parity=None, slave=None, timeout=None):
+        self._dispositivos.add('cr1000')
+
+    def desconectar_todos(self):
+        self._dispositivos.clear()
+
+    @property
+    def piranometro_conectado(self):
+        return 'piranometro' in self._dispositivos
+
+    @property
+    def cr1000_conectado(self):
+        return 'cr1000' in self._dispositivos
+
+    def iniciar_captura(self, caminho):
+        raise Exception("Não é possível capturar durante uma reprodução")
+
+    # --- Reprodução ---
+
+    def _loop(self):
+        self.concluida.clear()
+        leitor = LeitorCaptura(self.caminho)
+        self.grade = GradeAmostragem(0, origem=leitor.origem, parede=leitor.parede)
+        inicio, primeiro = time.monotonic(), None
+        try:
+            for tick, quadros in leitor.ciclos():
+                if self.velocidade:
+                    primeiro = tick if primeiro is None else primeiro
+                    espera = inicio + (tick - primeiro) / self.velocidade - time.monotonic()
+                    if espera > 0 and self._parar.wait(espera):
+                        break
+                if self._parar.is_set():
+                    break
+                try:
+                    self.reproduzir_ciclo(tick, quadros)
+                except Exception as e:
+                    print(f"Erro na reprodução do ciclo: {str(e)}")
+        finally:
+            leitor.fechar()
+            self.concluida.set()
+
+    def reproduzir_ciclo(self, tick, quadros):
+        """Decodifica os quadros de um ciclo e publica a amostra correspondente"""
+        valores, instantes = {}, {}
+        agora = time.monotonic()
+        with self.etapas.medir('decodificacao'):
+            for quadro in quadros:
+                # Os registros capturados são views uint16 do arquivo: viram inteiros Python, como os lidos do barramento
+                registros = quadro.registros.tolist()
+                if self._cache is not None:
+                    self._cache.atualizar(quadro.dispositivo, agora, quadro.endereco, registros)
+                mapa = self._mapas.get(quadro.dispositivo)
+                if mapa is None:
+                    continue
+                valores.setdefault(quadro.dispositivo, {}).update(
+                    decodificar_registros(mapa, quadro.endereco, registros))
+                instantes.setdefault(quadro.dispositivo, quadro.instante)
+
+        if 'cr1000' in valores:
+            cr1000_values = self._canais_cr1000(valores['cr1000'])
+        else:
+            cr1000_values = [float('nan')] * 3
+        amostra = self._montar_amostra(tick, valores.get('piranometro', {}), instantes.get('piranometro'),
+                                       cr1000_values, instantes.get('cr1000'))
+        self.ciclos_reproduzidos += 1
+        self.publicar(amostra)
+        return amostra
@@ -0,0 +1,41 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from agregacao import AgregadorJanela
+from indice_agregados import agregar_intervalos
+
+
+@pytest.fixture
+def fuso_meia_hora():
+    anterior = os.environ.get('TZ')
+    os.environ['TZ'] = 'Asia/Kolkata'  # UTC+05:30
+    time.tzset()
+    yield
+    if anterior is None:
+        del os.environ['TZ']
+    else:
+        os.environ['TZ'] = anterior
+    time.tzset()
+
+
+@pytest.mark.parametrize('periodo', [5, 60, 3600])
+def test_agregacao_ao_vivo_e_reconstrucao_com_as_mesmas_fronteiras(fuso_meia_hora, periodo):
+    inicio = datetime(2026, 3, 1, 9, 10, 0)
+    tempos = [inicio + timedelta(seconds=7 * k) for k in range(2000)]
+    valores = np.arange(len(tempos), dtype=np.float64)
+
+    fechadas = []
+    agregador = AgregadorJanela(periodo, colunas=['irradiance'])
+    agregador.assinar(fechadas.append)
+    for tempo, valor in zip(tempos, valores):
+        agregador.adicionar({'timestamp': tempo, 'irradiance': valor})
+    ao_vivo = fechadas + [agregador.parcial()]
+
+    reconstruidas = agregar_intervalos(np.array(tempos, dtype='datetime64[us]'), {'irradiance': valores}, periodo)
+    assert [linha['timestamp'] for linha in ao_vivo] == reconstruidas['timestamp'].astype(datetime).tolist()
+    assert [linha['irradiance_count'] for linha in ao_vivo] == reconstruidas['irradiance_count'].tolist()
+    assert np.allclose([linha['irradiance_mean'] for linha in ao_vivo], reconstruidas['irradiance_mean'])
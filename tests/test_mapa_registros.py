@@ -0,0 +1,30 @@
+import math
+
+import numpy as np
+
+from mapa_registros import Bloco, Campo, MAPA_PIRANOMETRO, decodificar_bloco, decodificar_registros
+
+
+def _registros_float(valor):
+    bruto = np.array([valor], dtype='>f4').view('>u2')
+    return [int(bruto[0]), int(bruto[1])]
+
+
+def test_bloco_uint16_ndarray_igual_a_lista():
+    bloco = Bloco([Campo('a', 0), Campo('b', 2, ordem='word_swap'), Campo('c', 4, 'int16'), Campo('d', 5, 'uint16')])
+    b1, b2 = _registros_float(-12.5)
+    lista = _registros_float(850.0) + [b2, b1] + [0xFFFE, 0xFFFE]
+    esperado = {'a': 850.0, 'b': -12.5, 'c': -2, 'd': 0xFFFE}
+    assert decodificar_bloco(bloco, lista) == esperado
+    assert decodificar_bloco(bloco, np.array(lista, dtype=np.uint16)) == esperado
+    # Mesma visão que captura.LeitorCaptura entrega na reprodução
+    assert decodificar_bloco(bloco, np.frombuffer(np.array(lista, dtype='<u2').tobytes(), '<u2')) == esperado
+
+
+def test_registros_capturados_do_piranometro():
+    registros = np.zeros(20, dtype=np.uint16)
+    registros[0:2] = _registros_float(850.0)
+    registros[12:14] = [0xFFC0, 0x0000]  # padrão NaN do CR1000
+    valores = decodificar_registros(MAPA_PIRANOMETRO, 2, registros)
+    assert valores['irradiance'] == 850.0
+    assert math.isnan(valores['angle_x'])